@@ -1,4 +1,6 @@
 import os
+import warnings
+from importlib.util import find_spec
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -26,7 +28,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "main.instrumentation.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "main.compression.CompressionMiddleware",
+    "main.db_router.ReplicaPinMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -39,7 +44,7 @@ ROOT_URLCONF = "config.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "main.instrumentation.TimedDjangoTemplates",
         "DIRS": [],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -47,6 +52,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "main.context_processors.cart_badge",
             ],
         },
     },
@@ -65,9 +71,63 @@ DATABASES = {
         "USER": os.getenv('USER'),
         "HOST": os.getenv('HOST'),
         "PORT": os.getenv('PORT'),
+        # Постоянные соединения (секунды); 0 — новое соединение на каждый запрос
+        "CONN_MAX_AGE": int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Пул соединений (только PostgreSQL) вместо постоянных соединений. Django держит пул
+# только на psycopg 3 с пакетом psycopg_pool (pip install "psycopg[binary,pool]");
+# с psycopg2 DB_POOL_MAX_SIZE не действует — остаются постоянные соединения CONN_MAX_AGE
+DB_POOL_AVAILABLE = find_spec('psycopg_pool') is not None
+if os.getenv('DB_POOL_MAX_SIZE') and not DB_POOL_AVAILABLE:
+    warnings.warn('DB_POOL_MAX_SIZE задан, но psycopg_pool не установлен: пул соединений выключен')
+if os.getenv('DB_POOL_MAX_SIZE') and DB_POOL_AVAILABLE and 'postgresql' in (DATABASES["default"]["ENGINE"] or ''):
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            "max_size": int(os.getenv('DB_POOL_MAX_SIZE')),
+            "timeout": int(os.getenv('DB_POOL_TIMEOUT', '10')),
+        },
+    }
+
+# Реплики для чтения каталога (main/db_router.py) через запятую: host[:port],
+# для SQLite — пути к копиям основной базы
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, map(str.strip, os.getenv('DB_REPLICAS', '').split(','))), 1):
+    if 'sqlite' in (DATABASES["default"]["ENGINE"] or ''):
+        location = {"NAME": replica}
+    else:
+        host, _, port = replica.partition(':')
+        location = {"HOST": host, "PORT": port or DATABASES["default"]["PORT"]}
+    DATABASES[f"replica{number}"] = {**DATABASES["default"], **location, "TEST": {"MIRROR": "default"}}
+    DATABASE_REPLICAS.append(f"replica{number}")
+
+DATABASE_ROUTERS = ['main.db_router.ReplicaRouter']
+
+# Сколько секунд после записи в каталог сессия читает каталог из основной базы
+REPLICA_PIN_SECONDS = 5
+
+
+
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Сессии читаются из кеша, в базу пишутся при смене ключей или раз в интервал
+# (main/sessions.py); кеш процесса (locmem) не общий для воркеров — пишем сразу
+SESSION_ENGINE = 'main.sessions'
+SESSION_DB_WRITE_INTERVAL = 0 if 'locmem' in CACHES['default']['BACKEND'] else 60
+
+# Кеш страниц каталога сбрасывается версиями (main/catalog_cache.py), TTL — страховка
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
 
 
 
@@ -100,11 +160,48 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 STATICFILES_DIRS = [BASE_DIR / 'static']
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    # Без DEBUG — имена с хешем и .gz/.br-копии после collectstatic (main/staticfiles.py)
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage" if DEBUG
+        else "main.staticfiles.CompressedManifestStaticFilesStorage",
+    },
+}
+
+# Отдавать STATIC_ROOT из Django (main.staticfiles.serve_static), если перед ним нет nginx;
+# при DEBUG статику и так отдаёт runserver
+SERVE_STATIC = os.getenv('SERVE_STATIC', '') == '1'
 
 
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Как отдавать MEDIA: 'django' (FileResponse с Range), 'x-accel' (nginx) или 'x-sendfile'
+MEDIA_SERVE_MODE = os.getenv('MEDIA_SERVE_MODE', 'django')
+# internal-локация nginx, указывающая на MEDIA_ROOT
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Потоки для фоновой генерации рендишенов картинок; 0 — генерировать сразу
+RENDITION_WORKERS = 2
+
+# Адрес сайта для ссылок в товарном фиде; пусто — берётся из запроса
+FEED_BASE_URL = os.getenv('FEED_BASE_URL', '')
+
+# Async-версии страниц каталога и корзины (main/async_views.py); включает config/asgi.py
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', '') == '1'
+
+# Заголовок Server-Timing и лог медленных запросов (main/instrumentation.py)
+REQUEST_TIMING = os.getenv('REQUEST_TIMING', '') == '1'
+# Запросы дольше стольких миллисекунд пишутся в лог с самыми медленными и частыми SQL
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', '500'))
+MESSAGE_STORAGE = 'main.instrumentation.TimedMessageStorage'
+
+# Сколько минут держится резерв товара, пока его не снимет sweep_reservations
+STOCK_RESERVATION_MINUTES = 15
+
 
 
 AUTH_USER_MODEL = 'users.User'
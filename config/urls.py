@@ -1,13 +1,21 @@
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
+from main.media import serve_media
+from main.staticfiles import serve_static
+from main.views import rendition_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("", include('main.urls', namespace='main')),
     path('users/', include('users.urls', namespace='users')),
+    # Готовые рендишены отдаёт веб-сервер; сюда попадают только ещё не созданные
+    path(f"{settings.MEDIA_URL.lstrip('/')}renditions/<path:path>", rendition_view, name='rendition'),
+    # Путь проверяет Django, байты в продакшене отдаёт nginx (см. MEDIA_SERVE_MODE)
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", serve_media, name='media'),
 ]
 
-
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+if settings.SERVE_STATIC:
+    # Статику в продакшене отдаёт nginx; здесь — запасной путь с теми же заголовками
+    urlpatterns.append(path(f"{settings.STATIC_URL.lstrip('/')}<path:path>", serve_static, name='static'))
@@ -1,5 +1,44 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, Q
+from django.utils.functional import cached_property
+
+from main import inventory
 from main.models import Category, Furniture
+from main.search import get_search_backend, query_terms
+
+# Начиная с этого размера таблицы без фильтров считаем по статистике планировщика
+ESTIMATE_COUNT_THRESHOLD = 10000
+# Сколько самых релевантных товаров показывает поиск в админке
+ADMIN_SEARCH_LIMIT = 1000
+
+
+def estimated_count(queryset):
+    """Оценка числа строк таблицы из статистики PostgreSQL или None"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    return row[0] if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Без фильтров и поиска не делает COUNT(*) по большой таблице"""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset)
+            if estimate is not None and estimate >= ESTIMATE_COUNT_THRESHOLD:
+                return estimate
+        return super().count
 
 
 @admin.register(Category)
@@ -10,10 +49,12 @@ class CategoryAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     list_filter = ['created_at']
 
-    def product_count(self, obj):
-        return obj.products.count()
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(product_count=Count('products'))
 
-    product_count.short_description = 'Кол-во товаров'
+    @admin.display(description='Кол-во товаров', ordering='product_count')
+    def product_count(self, obj):
+        return obj.product_count
 
 
 @admin.register(Furniture)
@@ -24,9 +65,14 @@ class FurnitureAdmin(admin.ModelAdmin):
     ]
     list_display_links = ['name']
     list_editable = ['price', 'stock', 'is_active', 'is_featured']
+    list_select_related = ['category']
     search_fields = ['name', 'description', 'sku', 'material']
+    search_help_text = 'Название, материал, описание или начало артикула'
     list_filter = ['category', 'is_active', 'is_featured', 'created_at']
     prepopulated_fields = {'slug': ('name',)}
+    paginator = EstimatedCountPaginator
+    # Второй COUNT по всей таблице ради «N из M» не нужен
+    show_full_result_count = False
 
     # Группировка полей в админке
     fieldsets = (
@@ -50,3 +96,23 @@ class FurnitureAdmin(admin.ModelAdmin):
     )
 
     readonly_fields = ['created_at', 'updated_at']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Остаток разбитого товара живёт в частях (main/inventory.py) — раскладываем правку по ним,
+        # иначе sync_split_stock вернул бы прежнюю сумму. Через этот метод сохраняет и list_editable
+        if change and 'stock' in form.changed_data and inventory.is_split(obj.pk):
+            inventory.set_stock(obj.pk, obj.stock)
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по полнотекстовому индексу вместо LIKE '%...%' по четырём полям"""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        # Артикул — по началу: «SKU-12» находит и SKU-120, и SKU-121
+        condition = Q(sku__istartswith=search_term)
+        terms = query_terms(search_term)
+        if terms:
+            ids = get_search_backend(queryset.db).ranked_ids(terms, ADMIN_SEARCH_LIMIT, 0, active_only=False)
+            condition |= Q(pk__in=ids)
+        return queryset.filter(condition), False
@@ -0,0 +1,243 @@
+"""JSON API каталога только для чтения (мобильное приложение, партнёры).
+
+* ``GET /api/categories/`` — категории;
+* ``GET /api/products/?category=<slug>&fields=id,name,price&limit=50&cursor=...``
+  — активные товары, keyset-пагинация как на страницах категорий;
+* ``GET /api/products/<slug>/`` — один активный товар.
+
+``?fields=`` задаёт набор полей ответа, и из базы читаются только нужные
+столбцы через ``values()`` — модели не создаются. Страница списка
+сериализуется потоком, пачками строк.
+
+ETag известен до выборки: для категорий и товаров одной категории он
+строится из версий кеша каталога (без запросов к БД), для всего каталога —
+из одного агрегата. Точный остаток не отдаём: в ответе только ``in_stock``,
+а переход товара в наличие и из него сдвигает версию категории.
+"""
+import hashlib
+import json
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import BooleanField, Count, ExpressionWrapper, Max, Q
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
+
+from .catalog_cache import CATALOG_SCOPE, category_scope, version_token
+from .conditional import make_etag
+from .models import Category, Furniture
+from .pagination import KeysetPaginator
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+# Строк в одном куске потокового ответа
+STREAM_CHUNK = 100
+
+IN_STOCK = ExpressionWrapper(Q(stock__gt=0), output_field=BooleanField())
+
+# Поле ответа -> столбец выборки
+PRODUCT_FIELDS = {
+    'id': 'id',
+    'slug': 'slug',
+    'sku': 'sku',
+    'name': 'name',
+    'description': 'description',
+    'category': 'category__slug',
+    'price': 'price',
+    'old_price': 'old_price',
+    'in_stock': 'in_stock',
+    'is_featured': 'is_featured',
+    'material': 'material',
+    'color': 'color',
+    'dimensions': 'dimensions',
+    'weight': 'weight',
+    'assembly_required': 'assembly_required',
+    'warranty': 'warranty',
+    'image': 'image',
+    'url': 'slug',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+DEFAULT_PRODUCT_FIELDS = ['id', 'slug', 'name', 'category', 'price', 'old_price', 'in_stock', 'image', 'url']
+
+CATEGORY_FIELDS = {
+    'id': 'id',
+    'slug': 'slug',
+    'name': 'name',
+    'description': 'description',
+    'image': 'image',
+    'url': 'slug',
+}
+DEFAULT_CATEGORY_FIELDS = list(CATEGORY_FIELDS)
+
+
+class ApiError(ValueError):
+    pass
+
+
+def _dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def _url_builder(route):
+    """reverse() один раз на запрос, дальше — подстановка slug в шаблон"""
+    template = reverse(route, args=['__slug__'])
+    return lambda slug: template.replace('__slug__', slug)
+
+
+def _media_url(name):
+    return default_storage.url(name) if name else None
+
+
+def parse_fields(request, available, default):
+    """[(поле ответа, столбец)] из ``?fields=`` или полей по умолчанию"""
+    requested = request.GET.get('fields')
+    names = [name.strip() for name in requested.split(',') if name.strip()] if requested else default
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}; доступны: {", ".join(available)}')
+    return [(name, available[name]) for name in dict.fromkeys(names)]
+
+
+def parse_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError('limit должен быть числом')
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def make_serializer(fields, detail_route):
+    """Функция строка values() -> словарь ответа"""
+    converters = {'image': _media_url, 'url': _url_builder(detail_route)}
+    plan = [(name, column, converters.get(name)) for name, column in fields]
+
+    def serialize(row):
+        return {
+            name: convert(row[column]) if convert else row[column]
+            for name, column, convert in plan
+        }
+
+    return serialize
+
+
+def _columns(fields, *extra):
+    return list(dict.fromkeys([column for _, column in fields] + list(extra)))
+
+
+def _not_modified(request, etag):
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+    return response
+
+
+def _error(exc):
+    return JsonResponse({'error': str(exc)}, status=400, json_dumps_params={'ensure_ascii': False})
+
+
+def _page_url(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+
+def stream_page(rows, serialize, next_url, previous_url):
+    """Тело страницы списка кусками по STREAM_CHUNK строк"""
+    yield '{"results":['
+    for start in range(0, len(rows), STREAM_CHUNK):
+        chunk = ','.join(_dumps(serialize(row)) for row in rows[start:start + STREAM_CHUNK])
+        yield (',' if start else '') + chunk
+    yield f'],"next":{_dumps(next_url)},"previous":{_dumps(previous_url)}}}'
+
+
+@require_safe
+def category_list(request):
+    try:
+        fields = parse_fields(request, CATEGORY_FIELDS, DEFAULT_CATEGORY_FIELDS)
+    except ApiError as exc:
+        return _error(exc)
+
+    # Любое изменение категорий сдвигает общую версию каталога
+    etag = make_etag(request, 'api', version_token(CATALOG_SCOPE))
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    serialize = make_serializer(fields, 'main:furniture')
+    rows = Category.objects.order_by('name').values(*_columns(fields))
+    response = HttpResponse(
+        _dumps({'results': [serialize(row) for row in rows]}), content_type='application/json'
+    )
+    response['ETag'] = etag
+    return response
+
+
+@require_safe
+def product_list(request):
+    try:
+        fields = parse_fields(request, PRODUCT_FIELDS, DEFAULT_PRODUCT_FIELDS)
+        limit = parse_limit(request)
+    except ApiError as exc:
+        return _error(exc)
+
+    queryset = Furniture.objects.filter(is_active=True)
+    category_slug = request.GET.get('category')
+    if category_slug:
+        queryset = queryset.filter(category__slug=category_slug)
+        etag = make_etag(request, 'api', version_token(category_scope(category_slug)))
+    else:
+        stats = queryset.aggregate(
+            updated=Max('updated_at'), count=Count('id'), in_stock=Count('id', filter=Q(stock__gt=0))
+        )
+        etag = make_etag(request, 'api', version_token(CATALOG_SCOPE), *stats.values())
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    columns = _columns(fields, 'id', 'created_at')
+    if 'in_stock' in columns:
+        queryset = queryset.annotate(in_stock=IN_STOCK)
+    page = KeysetPaginator(queryset.values(*columns), limit).page(request.GET.get('cursor'))
+
+    response = StreamingHttpResponse(
+        stream_page(
+            page.object_list,
+            make_serializer(fields, 'main:furniture_detail'),
+            _page_url(request, page.next_cursor),
+            _page_url(request, page.previous_cursor),
+        ),
+        content_type='application/json',
+    )
+    response['ETag'] = etag
+    return response
+
+
+@require_safe
+def product_detail(request, product_slug):
+    try:
+        fields = parse_fields(request, PRODUCT_FIELDS, list(PRODUCT_FIELDS))
+    except ApiError as exc:
+        return _error(exc)
+
+    row = (
+        Furniture.objects.filter(slug=product_slug, is_active=True)
+        .annotate(in_stock=IN_STOCK)
+        .values(*_columns(fields))
+        .first()
+    )
+    if row is None:
+        raise Http404('Товар не найден')
+
+    body = _dumps(make_serializer(fields, 'main:furniture_detail')(row))
+    etag = make_etag(request, 'api', hashlib.md5(body.encode()).hexdigest())
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return response
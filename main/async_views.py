@@ -0,0 +1,243 @@
+"""Асинхронные версии страниц каталога и корзины для запуска под ASGI.
+
+Под ASGI синхронное представление целиком уходит в поток и держит его
+до конца запроса. Эти представления читают базу через async-ORM
+(``aget``, ``acount``, ``async for``) и освобождают цикл событий на время
+каждого запроса к базе. Параллельными запросы от этого не становятся:
+Django выполняет их через ``sync_to_async(thread_sensitive=True)``, то
+есть по очереди в одном потоке, поэтому они идут друг за другом.
+
+Поведение то же, что у синхронных представлений в ``views.py``: общий
+кеш страниц и фрагментов, 304 по ETag/Last-Modified, сессионная корзина
+гостя. Включаются настройкой ``ASYNC_VIEWS`` (её выставляет
+``config/asgi.py``) — под WSGI асинхронное представление дороже, Django
+поднимает для него цикл событий на каждый запрос.
+
+Шаблон рендерится в потоке (``sync_to_async``): контекст-процессоры,
+``{% cache %}`` и ленивые выборки в шаблонах синхронны. Обращения к кешу
+каталога тоже уходят в поток: клиент кеша (Redis, memcached) блокирующий
+и в цикле событий остановил бы все остальные запросы.
+Сравнение WSGI и ASGI под нагрузкой — ``manage.py loadtest``.
+"""
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import Count, Q
+from django.http import Http404
+from django.shortcuts import redirect, render
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
+
+from . import cart as cart_ops
+from .catalog_cache import (
+    CATALOG_CACHE_TIMEOUT, CATALOG_SCOPE, aremember, cached_page, category_scope,
+    ensure_csrf_cookie, get_product_category, is_page_cacheable, page_cache_key,
+    set_product_category, store_page, version_token,
+)
+from .conditional import acatalog_stats, catalog_validators, set_validators
+from .context_processors import acart_item_count, asession_cart_data
+from .facets import FacetFilters, afacet_rows, build_facets
+from .models import Cart, CartSummary, Category, Furniture, RelatedProduct
+from .pagination import KeysetPaginator
+from .views import FurnitureList
+
+_render = sync_to_async(render)
+_get_product_category = sync_to_async(get_product_category)
+_set_product_category = sync_to_async(set_product_category)
+
+
+async def _load_viewer(request):
+    """Пользователь, его значок корзины и корзина из сессии — заранее, в async.
+
+    Ленивый ``request.user`` из AuthenticationMiddleware ходит в базу
+    синхронно, что в цикле событий запрещено, поэтому подменяем его
+    готовым объектом. Сессия загружается через async-API, после этого
+    синхронное чтение (``session_cart_data``, ``make_etag``) её не перечитывает.
+    """
+    request.user = await request.auser()
+    await asession_cart_data(request)
+    if request.user.is_authenticated:
+        return await acart_item_count(request.user.pk)
+    return None
+
+
+@sync_to_async
+def _page_cache(request, scopes):
+    """Ключ страницы в кеше и готовый ответ, если страница там есть"""
+    if scopes is None or not is_page_cacheable(request):
+        return None, None
+    key = page_cache_key(request, scopes)
+    return key, cached_page(request, key)
+
+
+def _not_modified(request, etag, last_modified):
+    if not etag:
+        return None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    return set_validators(response, etag, last_modified) if response is not None else None
+
+
+@sync_to_async
+def _finish(response, key, etag=None, last_modified=None):
+    if response.status_code == 200:
+        if etag:
+            set_validators(response, etag, last_modified)
+        if key:
+            store_page(key, response)
+    return response
+
+
+@sync_to_async
+def _catalog_context(scopes):
+    return {
+        'catalog_version': version_token(*scopes),
+        'catalog_cache_timeout': CATALOG_CACHE_TIMEOUT,
+    }
+
+
+@require_safe
+async def category_list(request):
+    await _load_viewer(request)
+    ensure_csrf_cookie(request)
+    scopes = [CATALOG_SCOPE]
+    key, response = await _page_cache(request, scopes)
+    if response is not None:
+        return response
+
+    # Выборка ленивая: выполнится при рендеринге и только если сетки нет в кеше фрагментов
+    categories = Category.objects.annotate(product_count=Count('products'))
+    response = await _render(request, 'main/category_list.html', {
+        'cat': categories,
+        'object_list': categories,
+        **await _catalog_context(scopes),
+    })
+    return await _finish(response, key)
+
+
+@require_safe
+async def furniture_list(request, slug):
+    cart_count = await _load_viewer(request)
+    ensure_csrf_cookie(request)
+    scopes = [category_scope(slug)]
+    key, response = await _page_cache(request, scopes)
+    if response is not None:
+        return response
+
+    filters = FacetFilters.from_request(request)
+    products = Furniture.objects.filter(category__slug=slug, is_active=True)
+    paginator = KeysetPaginator(filters.apply(products).select_related('category'), FurnitureList.paginate_by)
+    category = await Category.objects.filter(slug=slug).afirst()
+    if category is None:
+        raise Http404('Категория не найдена')
+    stats = await aremember(f'stats:{slug}', scopes, lambda: acatalog_stats(products))
+    page = await paginator.apage(request.GET.get('cursor'))
+    facet_rows = await afacet_rows(slug, filters)
+
+    etag, last_modified = catalog_validators(request, stats, cart_count)
+    not_modified = _not_modified(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    response = await _render(request, 'main/furniture_list.html', {
+        'fur': page.object_list,
+        'object_list': page.object_list,
+        'page_obj': page,
+        'paginator': None,
+        'is_paginated': page.has_other_pages(),
+        'category': category,
+        'filters': filters,
+        'filter_query': filters.querystring(),
+        'facets': build_facets(facet_rows, filters),
+        **await _catalog_context(scopes),
+    })
+    return await _finish(response, key, etag, last_modified)
+
+
+async def _related_products(product):
+    # Предрасчитанный список (main/related.py)
+    links = RelatedProduct.objects.filter(product=product).select_related('related')[:4]
+    return [link.related async for link in links]
+
+
+@require_safe
+async def furniture_detail(request, product_slug):
+    cart_count = await _load_viewer(request)
+    ensure_csrf_cookie(request)
+    # Категория товара известна только после первого рендера страницы
+    category_slug = await _get_product_category(product_slug)
+    scopes = [category_scope(category_slug)] if category_slug else None
+    key, response = await _page_cache(request, scopes)
+    if response is not None:
+        return response
+
+    try:
+        product = await Furniture.objects.select_related('category').aget(slug=product_slug)
+    except Furniture.DoesNotExist:
+        raise Http404('Товар не найден')
+    await _set_product_category(product.slug, product.category.slug)
+    related_products = await _related_products(product)
+
+    # Агрегат для валидаторов — по соседям товара по категории
+    stats_queryset = Furniture.objects.filter(
+        Q(is_active=True) | Q(slug=product_slug), category__products__slug=product_slug
+    )
+    if scopes is None:
+        stats = await acatalog_stats(stats_queryset)
+    else:
+        stats = await aremember(f'stats:product:{product_slug}', scopes, lambda: acatalog_stats(stats_queryset))
+
+    etag, last_modified = catalog_validators(request, stats, cart_count)
+    not_modified = _not_modified(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    response = await _render(request, 'main/furniture_detail.html', {
+        'object': product,
+        'product': product,
+        'related_products': related_products,
+        'csrf_cookie_name': settings.CSRF_COOKIE_NAME,
+        **await _catalog_context([category_scope(product.category.slug)]),
+    })
+    return await _finish(response, key, etag, last_modified)
+
+
+async def cart_view(request):
+    """Просмотр корзины: из базы для авторизованных, из сессии для гостей"""
+    request.user = await request.auser()
+    if request.user.is_authenticated:
+        cart = await Cart.objects.filter(user=request.user).afirst()
+        summary = await cart.asummary() if cart else CartSummary(items=[], item_count=0, total=Decimal('0'))
+    else:
+        cart = cart_ops.SessionCart(request.session)
+        summary = await cart.asummary()
+
+    return await _render(request, 'main/cart.html', {
+        'cart': cart,
+        'summary': summary,
+        'items': summary.items,
+        'total': summary.total,
+    })
+
+
+async def add_to_cart(request, product_id):
+    """Добавление товара в корзину"""
+    if request.method != 'POST':
+        return redirect('main:index')
+
+    request.user = await request.auser()
+    name = await (
+        Furniture.objects.filter(id=product_id, is_active=True).values_list('name', flat=True).afirst()
+    )
+    if name is None:
+        raise Http404('Товар не найден')
+    if request.user.is_authenticated:
+        # Upsert на «сыром» SQL — у курсора Django нет async-версии
+        if await sync_to_async(cart_ops.add_item)(request.user.pk, product_id) is None:
+            raise Http404('Товар не найден')
+    else:
+        await cart_ops.SessionCart(request.session).aadd(product_id)
+
+    messages.success(request, f'Товар "{name}" добавлен в корзину!')
+    return redirect(request.META.get('HTTP_REFERER', 'main:index'))
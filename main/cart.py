@@ -0,0 +1,241 @@
+"""Изменение корзины атомарными запросами и корзина анонимного посетителя.
+
+Каждое действие укладывается в один-два SQL-оператора без цикла
+«прочитать — изменить в Python — сохранить», поэтому одновременные
+клики по «В корзину» не теряют друг друга. Добавление товаров — upsert
+``INSERT ... ON CONFLICT DO UPDATE`` (PostgreSQL, SQLite); на прочих
+СУБД — ``UPDATE ... SET quantity = quantity + n`` и INSERT при промахе.
+
+Сигналы моделей при этом не срабатывают, поэтому кеш значка корзины
+сбрасывается здесь явно.
+
+Анонимный посетитель хранит корзину в сессии (``SessionCart``) — пока он
+только смотрит каталог, в базу ничего не пишется. При входе корзина из
+сессии вливается в корзину пользователя тем же upsert-ом, одним запросом
+на все позиции (см. ``merge_session_cart`` и ``main/signals.py``).
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+
+from .context_processors import SESSION_CART_KEY, cart_count_cache_key
+from .models import Cart, CartItem, CartSummary, Furniture
+
+# Корзина и товары выбираются тем же оператором: неактивный товар не добавится
+UPSERT_SQL = (
+    'INSERT INTO main_cartitem (cart_id, product_id, quantity) '
+    'SELECT c.id, p.id, v.column2 FROM main_cart c, main_furniture p, (VALUES {values}) v '
+    'WHERE c.user_id = %s AND p.id = v.column1 AND p.is_active '
+    'ON CONFLICT (cart_id, product_id) '
+    'DO UPDATE SET quantity = main_cartitem.quantity + excluded.quantity '
+    'RETURNING product_id, quantity'
+)
+UPSERT_VALUE_SQL = '(CAST(%s AS integer), CAST(%s AS integer))'
+
+DELETE_SQL = (
+    'DELETE FROM main_cartitem '
+    'WHERE id = %s AND cart_id IN (SELECT id FROM main_cart WHERE user_id = %s)'
+)
+
+UPSERT_VENDORS = {'postgresql', 'sqlite'}
+
+
+def add_items(user_id, quantities, using='default'):
+    """Добавляет товары в корзину пользователя: {id товара: сколько добавить}.
+
+    Корзина создаётся при первом добавлении. Возвращает {id товара: новое
+    количество}; товаров, которых нет или которые сняты с продажи, в ответе нет.
+    """
+    quantities = {int(pk): quantity for pk, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return {}
+    connection = connections[using]
+    if connection.vendor in UPSERT_VENDORS:
+        result = _upsert(connection, user_id, quantities)
+        if not result:
+            # Пустой ответ — корзины ещё нет (или товары сняты с продажи);
+            # её могли создать параллельно, поэтому повторяем в любом случае
+            Cart.objects.using(using).get_or_create(user_id=user_id)
+            result = _upsert(connection, user_id, quantities)
+    else:
+        result = {}
+        for product_id, quantity in quantities.items():
+            new_quantity = _add_fallback(user_id, product_id, quantity, using)
+            if new_quantity is not None:
+                result[product_id] = new_quantity
+    if result:
+        cache.delete(cart_count_cache_key(user_id))
+    return result
+
+
+def add_item(user_id, product_id, quantity=1, using='default'):
+    """Добавляет товар в корзину; возвращает новое количество или None,
+    если товара нет или он снят с продажи"""
+    return add_items(user_id, {product_id: quantity}, using).get(product_id)
+
+
+def _upsert(connection, user_id, quantities):
+    sql = UPSERT_SQL.format(values=', '.join([UPSERT_VALUE_SQL] * len(quantities)))
+    params = [value for item in quantities.items() for value in item] + [user_id]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return dict(cursor.fetchall())
+
+
+def _add_fallback(user_id, product_id, quantity, using):
+    items = CartItem.objects.using(using).filter(
+        cart__user_id=user_id, product_id=product_id, product__is_active=True
+    )
+    if items.update(quantity=F('quantity') + quantity):
+        return items.values_list('quantity', flat=True).first()
+    if not Furniture.objects.using(using).filter(pk=product_id, is_active=True).exists():
+        return None
+    cart, _ = Cart.objects.using(using).get_or_create(user_id=user_id)
+    try:
+        with transaction.atomic(using=using):
+            CartItem.objects.using(using).create(cart=cart, product_id=product_id, quantity=quantity)
+    except IntegrityError:
+        # Параллельный запрос успел вставить строку первым
+        items.update(quantity=F('quantity') + quantity)
+        return items.values_list('quantity', flat=True).first()
+    return quantity
+
+
+def set_quantity(user_id, item_id, quantity, using='default'):
+    """Задаёт количество позиции (0 и меньше — удаление); False, если позиции нет"""
+    if quantity <= 0:
+        return remove_item(user_id, item_id, using)
+    # Число позиций не меняется — значок корзины сбрасывать не нужно
+    return bool(
+        CartItem.objects.using(using)
+        .filter(id=item_id, cart__user_id=user_id)
+        .update(quantity=quantity)
+    )
+
+
+def remove_item(user_id, item_id, using='default'):
+    """Удаляет позицию из корзины пользователя; False, если её не было"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(DELETE_SQL, [item_id, user_id])
+        deleted = cursor.rowcount
+    if deleted:
+        cache.delete(cart_count_cache_key(user_id))
+    return bool(deleted)
+
+
+@dataclass
+class SessionCartItem:
+    """Позиция сессионной корзины; id совпадает с id товара"""
+    product: Furniture
+    quantity: int
+
+    @property
+    def id(self):
+        return self.product.pk
+
+    @property
+    def line_total(self):
+        return self.product.price * self.quantity
+
+    def total_price(self):
+        return self.line_total
+
+
+class SessionCart:
+    """Корзина анонимного посетителя в сессии — тот же интерфейс чтения, что у ``Cart``.
+
+    Позиции адресуются id товара: в шаблоне ``item.id`` ведёт в те же
+    URL изменения и удаления, что и у корзины в базе.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    @property
+    def data(self):
+        return self.session.get(SESSION_CART_KEY, {})
+
+    def _save(self, data):
+        if data:
+            self.session[SESSION_CART_KEY] = data
+        else:
+            self.session.pop(SESSION_CART_KEY, None)
+
+    def add(self, product_id, quantity=1):
+        data = dict(self.data)
+        key = str(product_id)
+        data[key] = data.get(key, 0) + quantity
+        self._save(data)
+        return data[key]
+
+    async def aadd(self, product_id, quantity=1):
+        data = dict(await self.session.aget(SESSION_CART_KEY, {}))
+        key = str(product_id)
+        data[key] = data.get(key, 0) + quantity
+        await self.session.aset(SESSION_CART_KEY, data)
+        return data[key]
+
+    def set_quantity(self, product_id, quantity):
+        if quantity <= 0:
+            return self.remove(product_id)
+        data = dict(self.data)
+        if str(product_id) not in data:
+            return False
+        data[str(product_id)] = quantity
+        self._save(data)
+        return True
+
+    def remove(self, product_id):
+        data = dict(self.data)
+        if data.pop(str(product_id), None) is None:
+            return False
+        self._save(data)
+        return True
+
+    def clear(self):
+        self._save({})
+
+    @staticmethod
+    def _products():
+        return Furniture.objects.filter(is_active=True).select_related('category')
+
+    @staticmethod
+    def _build_summary(data, products):
+        items = [
+            SessionCartItem(product=products[int(pk)], quantity=quantity)
+            for pk, quantity in data.items() if int(pk) in products
+        ]
+        return CartSummary(
+            items=items,
+            item_count=len(items),
+            total=sum((item.line_total for item in items), Decimal('0')),
+        )
+
+    def summary(self):
+        """Позиции с товарами и категориями — один запрос"""
+        data = self.data
+        products = self._products().in_bulk([int(pk) for pk in data]) if data else {}
+        return self._build_summary(data, products)
+
+    async def asummary(self):
+        data = await self.session.aget(SESSION_CART_KEY, {})
+        products = await self._products().ain_bulk([int(pk) for pk in data]) if data else {}
+        return self._build_summary(data, products)
+
+    def total_price(self):
+        return self.summary().total
+
+    @property
+    def item_count(self):
+        return len(self.data)
+
+
+def merge_session_cart(session, user_id, using='default'):
+    """Переносит корзину из сессии в корзину пользователя одним upsert-ом"""
+    session_cart = SessionCart(session)
+    if session_cart.data:
+        add_items(user_id, session_cart.data, using)
+        session_cart.clear()
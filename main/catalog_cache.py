@@ -0,0 +1,219 @@
+"""Версионированный кеш каталога.
+
+Каждая область каталога (весь каталог, отдельная категория) имеет номер
+версии в кеше. Ключи страниц и фрагментов включают версии областей, от
+которых они зависят, поэтому изменение в админке сразу делает старые
+записи недостижимыми — без подбора TTL. Версии сдвигают сигналы
+``Category`` и ``Furniture`` (см. ``main/signals.py``).
+
+С репликами (``main/db_router.py``) новая версия появляется раньше, чем
+реплика догонит запись: страница, собранная с реплики, легла бы в кеш со
+старыми данными под новым ключом на сутки. Поэтому ``bump`` оставляет
+отметку на ``REPLICA_PIN_SECONDS``, и запрос, который строит ключ по
+недавно сдвинутой области, читает каталог из основной базы.
+"""
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from . import db_router
+from .context_processors import session_cart_data
+
+CATALOG_SCOPE = 'all'
+
+CACHED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def category_scope(slug):
+    return f'category:{slug}'
+
+
+def _version_key(scope):
+    return f'catalog:version:{scope}'
+
+
+def _bumped_key(scope):
+    return f'catalog:bumped:{scope}'
+
+
+def _track_replica_lag():
+    return bool(getattr(settings, 'DATABASE_REPLICAS', None))
+
+
+def _product_category_key(product_slug):
+    return f'catalog:product-category:{product_slug}'
+
+
+def _initial_version():
+    # Стартуем не с 1, а с текущего времени: если ключ версии вытеснят из
+    # кеша, новая версия не совпадёт со старыми закешированными страницами.
+    return time.time_ns() // 1000
+
+
+def get_versions(*scopes):
+    """Текущие версии областей (недостающие создаются) — одним обращением к кешу"""
+    keys = {_version_key(scope): scope for scope in scopes}
+    bumped = [_bumped_key(scope) for scope in scopes] if _track_replica_lag() else []
+    found = cache.get_many([*keys, *bumped])
+    if any(key in found for key in bumped):
+        # Реплика могла ещё не получить изменение — наполняем кеш из основной базы
+        db_router.pin_reads()
+    missing = {key: _initial_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {keys[key]: found[key] for key in keys}
+
+
+def bump(*scopes):
+    """Сдвигаем версии областей — все зависящие от них записи устаревают"""
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_version(), None)
+    if _track_replica_lag():
+        cache.set_many({_bumped_key(scope): True for scope in scopes}, db_router.REPLICA_PIN_SECONDS)
+
+
+def version_token(*scopes):
+    """Строка версий для ключей фрагментов ``{% cache %}``"""
+    versions = get_versions(*scopes)
+    return '.'.join(str(versions[scope]) for scope in scopes)
+
+
+_MISSING = object()
+
+
+def remember(name, scopes, compute):
+    """Результат ``compute()``, закешированный до смены версий ``scopes``"""
+    key = f'catalog:{name}:{version_token(*scopes)}'
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = compute()
+        cache.set(key, value, CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+async def aremember(name, scopes, compute):
+    """``remember`` для асинхронных представлений: ``compute`` возвращает корутину"""
+    # Клиент кеша блокирующий — в цикле событий обращаемся к нему через поток
+    key = f'catalog:{name}:{await sync_to_async(version_token)(*scopes)}'
+    value = await cache.aget(key, _MISSING)
+    if value is _MISSING:
+        value = await compute()
+        await cache.aset(key, value, CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+def get_product_category(product_slug):
+    return cache.get(_product_category_key(product_slug))
+
+
+def set_product_category(product_slug, category_slug):
+    cache.set(_product_category_key(product_slug), category_slug, CATALOG_CACHE_TIMEOUT)
+
+
+def forget_product_category(product_slug):
+    cache.delete(_product_category_key(product_slug))
+
+
+def _page_key(request, token):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'catalog:page:{token}:{path}'
+
+
+def ensure_csrf_cookie(request):
+    # В общей для всех гостей странице не может быть личного CSRF-токена:
+    # формы берут его из куки, а куку выставляем здесь, если её ещё нет
+    if not request.user.is_authenticated and settings.CSRF_COOKIE_NAME not in request.COOKIES:
+        get_token(request)
+
+
+def is_page_cacheable(request):
+    # Гость с корзиной в сессии видит в навбаре свой значок
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not session_cart_data(request)
+    )
+
+
+def page_cache_key(request, scopes):
+    return _page_key(request, version_token(*scopes))
+
+
+def cached_page(request, key):
+    """Готовая страница из кеша (или 304 по сохранённым валидаторам); None при промахе"""
+    cached = cache.get(key)
+    if cached is None:
+        return None
+    content, headers = cached
+    response = HttpResponse(content)
+    for header, value in headers.items():
+        response[header] = value
+    # Валидаторы сохранены вместе со страницей — 304 без запросов к БД
+    return get_conditional_response(
+        request,
+        etag=headers.get('ETag'),
+        last_modified=parse_http_date_safe(headers.get('Last-Modified', '')),
+        response=response,
+    )
+
+
+def store_page(key, response):
+    cache.set(key, (response.content, {
+        header: response[header] for header in CACHED_HEADERS if response.has_header(header)
+    }), CATALOG_CACHE_TIMEOUT)
+
+
+class CatalogCacheMixin:
+    """Кеширует готовую страницу каталога для анонимных посетителей.
+
+    Подкласс возвращает области, от которых зависит страница, из
+    ``get_cache_scopes()``. Авторизованные пользователи видят в шаблонах
+    персональные данные, поэтому для них используется только кеш
+    фрагментов с ``catalog_version`` из контекста.
+    """
+
+    def get_cache_scopes(self):
+        return [CATALOG_SCOPE]
+
+    def is_page_cacheable(self, request):
+        return is_page_cacheable(request)
+
+    def dispatch(self, request, *args, **kwargs):
+        ensure_csrf_cookie(request)
+
+        scopes = self.get_cache_scopes()
+        if scopes is None or not self.is_page_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        key = page_cache_key(request, scopes)
+        response = cached_page(request, key)
+        if response is not None:
+            return response
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and hasattr(response, 'add_post_render_callback'):
+            response.add_post_render_callback(lambda r: store_page(key, r))
+        return response
+
+    def get_context_data(self, **kwargs):
+        # Версия — до запросов страницы: от неё зависит, с какой базы читать
+        scopes = self.get_cache_scopes() or [CATALOG_SCOPE]
+        catalog_version = version_token(*scopes)
+        context = super().get_context_data(**kwargs)
+        context['catalog_version'] = catalog_version
+        context['catalog_cache_timeout'] = CATALOG_CACHE_TIMEOUT
+        return context
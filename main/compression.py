@@ -0,0 +1,96 @@
+"""Сжатие ответов и статики.
+
+* ``CompressionMiddleware`` сжимает gzip-ом текстовые ответы (HTML, JSON,
+  CSV, XML), в том числе потоковые — по мере отдачи, не собирая тело в
+  памяти. Картинки, файлы с Range и уже сжатые ответы (фид) не трогает.
+* ``precompress`` пишет рядом с файлом статики копии ``.gz`` и ``.br``
+  (см. ``main/staticfiles.py``): nginx с ``gzip_static``/``brotli_static``
+  или ``serve_static`` отдают их без сжатия на лету.
+
+Brotli — необязательная зависимость (пакет ``brotli``): без неё пишутся
+только ``.gz``.
+"""
+import gzip
+import os
+
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'application/xml', 'image/svg+xml',
+}
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.json', '.map', '.svg', '.txt', '.xml', '.html'}
+# Меньше этого сжатие не окупает заголовки и лишний файл
+MIN_COMPRESS_SIZE = 256
+
+ENCODINGS = {'br': '.br', 'gzip': '.gz'} if brotli else {'gzip': '.gz'}
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """GZipMiddleware только для успешных текстовых ответов"""
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if response.status_code != 200 or content_type not in COMPRESSIBLE_TYPES:
+            return response
+        # GZipMiddleware ищет «gzip» в заголовке и не замечает отказа gzip;q=0
+        if 'gzip' not in negotiate(request.headers.get('Accept-Encoding', '')):
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+        return super().process_response(request, response)
+
+
+def _compressors():
+    # mtime=0 — одинаковый файл при каждом collectstatic
+    yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli:
+        yield '.br', lambda data: brotli.compress(data, quality=11)
+
+
+def precompress(path):
+    """Пишет сжатые копии файла рядом с ним; список созданных путей"""
+    if os.path.splitext(path)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+        return []
+    with open(path, 'rb') as source:
+        data = source.read()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return []
+    written = []
+    for suffix, compress in _compressors():
+        compressed = compress(data)
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as target:
+                target.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+def _quality(params):
+    """Значение q из параметров кодировки; без q — 1, нечитаемое — 0"""
+    for param in params:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'q':
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def negotiate(accept_encoding):
+    """Кодировки из Accept-Encoding, которые у нас есть, в порядке предпочтения.
+
+    ``q=0`` в любой записи (``q=0.0``, ``q=0.000``) означает отказ.
+    """
+    offered = set()
+    for part in accept_encoding.split(','):
+        encoding, *params = part.split(';')
+        if _quality(params) > 0:
+            offered.add(encoding.strip().lower())
+    return [encoding for encoding in ENCODINGS if encoding in offered]
@@ -0,0 +1,101 @@
+"""Условные GET-запросы (ETag / Last-Modified) для страниц каталога.
+
+Валидаторы считаются одним агрегатом по ``updated_at`` без рендеринга
+шаблона. Если клиент прислал совпадающий ``If-None-Match`` или
+``If-Modified-Since``, он получает 304 без тела.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .context_processors import cart_badge, session_cart_data
+
+
+STATS_AGGREGATES = {
+    'products': Max('updated_at'),
+    'category': Max('category__updated_at'),
+    'count': Count('id'),
+}
+
+
+def _stats_result(stats):
+    if stats['products'] is None:
+        return None
+    return max(stats['products'], stats['category']), stats['count']
+
+
+def catalog_stats(queryset):
+    """(последнее изменение товаров или их категории, число товаров) одним агрегатом"""
+    return _stats_result(queryset.aggregate(**STATS_AGGREGATES))
+
+
+async def acatalog_stats(queryset):
+    return _stats_result(await queryset.aaggregate(**STATS_AGGREGATES))
+
+
+def make_etag(request, *parts, cart_count=None):
+    """Слабый ETag: данные каталога + адрес страницы + то, что видит пользователь.
+
+    Асинхронные представления передают ``cart_count`` заранее: значок
+    корзины может потребовать запроса к БД.
+    """
+    user = request.user
+    if user.is_authenticated:
+        if cart_count is None:
+            cart_count = cart_badge(request)['cart_item_count']
+        parts += (user.pk, cart_count)
+    elif session_cart_data(request):
+        parts += ('session', request.session.session_key, len(session_cart_data(request)))
+    parts += (request.get_full_path(),)
+    digest = hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def set_validators(response, etag, last_modified):
+    if etag and not response.has_header('ETag'):
+        response['ETag'] = etag
+    if last_modified and not response.has_header('Last-Modified'):
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def catalog_validators(request, stats, cart_count=None):
+    """(ETag, Last-Modified) страницы по ``catalog_stats``; (None, None) — без валидаторов"""
+    if request.method not in ('GET', 'HEAD') or not stats or stats[0] is None:
+        return None, None
+    last_modified, count = stats
+    etag = make_etag(request, last_modified.isoformat(), count, cart_count=cart_count)
+    # Персональные страницы различаются не только временем изменения
+    if request.user.is_authenticated or session_cart_data(request):
+        return etag, None
+    return etag, int(last_modified.timestamp())
+
+
+class ConditionalGetMixin:
+    """Отвечает 304, если страница не менялась с прошлого запроса клиента.
+
+    Подкласс реализует ``get_catalog_stats()`` и возвращает кортеж
+    ``(последнее изменение, число записей)`` или ``None``. Число записей
+    нужно, потому что удаление товара ``updated_at`` не сдвигает.
+    """
+
+    def get_catalog_stats(self):
+        raise NotImplementedError
+
+    def get_validators(self):
+        if self.request.method not in ('GET', 'HEAD'):
+            return None, None
+        return catalog_validators(self.request, self.get_catalog_stats())
+
+    def dispatch(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        if etag:
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return set_validators(not_modified, etag, last_modified)
+        response = super().dispatch(request, *args, **kwargs)
+        if etag and response.status_code == 200:
+            set_validators(response, etag, last_modified)
+        return response
@@ -0,0 +1,55 @@
+from django.core.cache import cache
+
+from .models import CartItem
+
+CART_COUNT_TIMEOUT = 60 * 60 * 24
+
+# Корзина анонимного посетителя в сессии: {id товара (строкой): количество}
+SESSION_CART_KEY = 'cart'
+
+
+def cart_count_cache_key(user_id):
+    return f'cart:count:{user_id}'
+
+
+def session_cart_data(request):
+    """Корзина из сессии; без сессионной куки к хранилищу сессий не обращаемся"""
+    session = getattr(request, 'session', None)
+    if session is None or not session.session_key:
+        return {}
+    return session.get(SESSION_CART_KEY, {})
+
+
+async def asession_cart_data(request):
+    """``session_cart_data`` для асинхронных представлений: сессия загружается
+    через async-API, после этого синхронное чтение обходится без запросов"""
+    session = getattr(request, 'session', None)
+    if session is None or not session.session_key:
+        return {}
+    return await session.aget(SESSION_CART_KEY, {})
+
+
+async def acart_item_count(user_id):
+    key = cart_count_cache_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = await CartItem.objects.filter(cart__user_id=user_id).acount()
+        cache.set(key, count, CART_COUNT_TIMEOUT)
+    return count
+
+
+def cart_badge(request):
+    """Количество позиций в корзине для значка в навбаре (из кеша или сессии)"""
+    user = getattr(request, 'user', None)
+    if user is None:
+        return {}
+    if not user.is_authenticated:
+        count = len(session_cart_data(request))
+        return {'cart_item_count': count} if count else {}
+
+    key = cart_count_cache_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = CartItem.objects.filter(cart__user_id=user.pk).count()
+        cache.set(key, count, CART_COUNT_TIMEOUT)
+    return {'cart_item_count': count}
@@ -0,0 +1,102 @@
+"""Чтение каталога с реплик базы.
+
+Запросы на чтение ``Category``, ``Furniture`` и ``RelatedProduct`` уходят
+на реплики из ``DATABASE_REPLICAS`` (одна случайная на запрос), всё
+остальное — корзина, сессии, пользователи, резервы — и любые записи идут
+в основную базу.
+
+Реплика отстаёт от основной базы, поэтому чтение «прилипает» к основной:
+
+* внутри транзакции на основной базе — транзакция должна видеть свои данные;
+* после записи в модели каталога в этом же запросе (или вызова
+  ``pin_primary()`` из кода, пишущего «сырым» SQL);
+* в течение ``REPLICA_PIN_SECONDS`` после такой записи в той же сессии
+  браузера — ``ReplicaPinMiddleware`` ставит для этого куку;
+* у любого посетителя, если запрос наполняет кеш каталога, версию которого
+  сдвинули меньше ``REPLICA_PIN_SECONDS`` назад (``pin_reads()`` из
+  ``main/catalog_cache.py``) — иначе в кеш под новой версией попали бы
+  отстающие данные реплики.
+
+Без реплик в настройках роутер ничего не меняет.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.deprecation import MiddlewareMixin
+
+REPLICA_MODELS = {'main.category', 'main.furniture', 'main.relatedproduct'}
+
+PIN_COOKIE = 'db_primary'
+REPLICA_PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+# Состояние текущего запроса: выбранная реплика и была ли запись в каталог
+_replica = ContextVar('replica', default=None)
+_pinned = ContextVar('pinned_to_primary', default=False)
+_wrote = ContextVar('wrote_to_primary', default=False)
+
+
+def pin_primary():
+    """Дальнейшие чтения этого запроса (и сессии) — из основной базы"""
+    _pinned.set(True)
+    _wrote.set(True)
+
+
+def pin_reads():
+    """Дальнейшие чтения этого запроса — из основной базы, без «прилипания» сессии"""
+    _pinned.set(True)
+
+
+def reset(pinned=False):
+    _replica.set(None)
+    _pinned.set(pinned)
+    _wrote.set(False)
+
+
+class ReplicaRouter:
+    def __init__(self, replicas=None):
+        self.replicas = list(replicas if replicas is not None else getattr(settings, 'DATABASE_REPLICAS', []))
+        self.databases = {DEFAULT_DB_ALIAS, *self.replicas}
+
+    def _routed(self, model):
+        return self.replicas and model._meta.label_lower in REPLICA_MODELS
+
+    def db_for_read(self, model, **hints):
+        if not self._routed(model):
+            return None
+        if _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replica = _replica.get()
+        if replica is None:
+            replica = random.choice(self.replicas)
+            _replica.set(replica)
+        return replica
+
+    def db_for_write(self, model, **hints):
+        if not self._routed(model):
+            return None
+        pin_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной базы: связи между ними допустимы
+        if obj1._state.db in self.databases and obj2._state.db in self.databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in self.replicas else None
+
+
+class ReplicaPinMiddleware(MiddlewareMixin):
+    """Сбрасывает состояние роутера на каждый запрос и продлевает «прилипание»
+    к основной базе для сессии, которая только что писала в каталог"""
+
+    def process_request(self, request):
+        reset(pinned=PIN_COOKIE in request.COOKIES)
+
+    def process_response(self, request, response):
+        if _wrote.get():
+            response.set_cookie(PIN_COOKIE, '1', max_age=REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
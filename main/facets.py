@@ -0,0 +1,187 @@
+"""Фасетные фильтры страницы категории.
+
+Счётчики всех фасетов считаются одним группирующим запросом по
+комбинациям (материал, цвет, сборка, наличие); число таких комбинаций
+в категории невелико, поэтому дальше счётчики собираются в Python.
+Для каждого фасета учитываются фильтры остальных фасетов, но не его
+собственный — так покупатель видит, сколько товаров добавит соседний
+флажок. Результат группировки кешируется по версии категории.
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import BooleanField, Case, Count, Q, When
+from django.utils.http import urlencode
+
+from . import catalog_cache
+from .models import Furniture
+
+FACET_LABELS = {
+    'material': 'Материал',
+    'color': 'Цвет',
+    'assembly_required': 'Сборка',
+    'in_stock': 'Наличие',
+}
+
+BOOLEAN_VALUE_LABELS = {
+    'assembly_required': {True: 'Требуется сборка', False: 'Без сборки'},
+    'in_stock': {True: 'В наличии'},
+}
+
+
+def _parse_price(value):
+    try:
+        price = Decimal(value)
+        # NaN и Infinity — тоже Decimal, но в фильтр по цене их пускать нельзя
+        return price if price.is_finite() and price >= 0 else None
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+
+
+def _parse_flag(value):
+    return {'1': True, '0': False}.get(value)
+
+
+@dataclass
+class FacetFilters:
+    """Выбранные покупателем фильтры (из GET-параметров)"""
+    material: list = field(default_factory=list)
+    color: list = field(default_factory=list)
+    assembly_required: bool = None
+    in_stock: bool = None
+    min_price: Decimal = None
+    max_price: Decimal = None
+
+    @classmethod
+    def from_request(cls, request):
+        params = request.GET
+        in_stock = _parse_flag(params.get('in_stock'))
+        return cls(
+            material=[value for value in params.getlist('material') if value][:20],
+            color=[value for value in params.getlist('color') if value][:20],
+            assembly_required=_parse_flag(params.get('assembly_required')),
+            in_stock=True if in_stock else None,
+            min_price=_parse_price(params.get('min_price')),
+            max_price=_parse_price(params.get('max_price')),
+        )
+
+    def selected(self, name):
+        value = getattr(self, name)
+        if isinstance(value, list):
+            return set(value)
+        return set() if value is None else {value}
+
+    def matches(self, row, skip=None):
+        """Подходит ли строка группировки под все фильтры, кроме ``skip``"""
+        for name in FACET_LABELS:
+            if name == skip:
+                continue
+            selected = self.selected(name)
+            if selected and row[name] not in selected:
+                return False
+        return True
+
+    def price_q(self):
+        q = Q()
+        if self.min_price is not None:
+            q &= Q(price__gte=self.min_price)
+        if self.max_price is not None:
+            q &= Q(price__lte=self.max_price)
+        return q
+
+    def apply(self, queryset):
+        queryset = queryset.filter(self.price_q())
+        if self.material:
+            queryset = queryset.filter(material__in=self.material)
+        if self.color:
+            queryset = queryset.filter(color__in=self.color)
+        if self.assembly_required is not None:
+            queryset = queryset.filter(assembly_required=self.assembly_required)
+        if self.in_stock:
+            queryset = queryset.filter(stock__gt=0)
+        return queryset
+
+    def querystring(self):
+        """Фильтры в виде строки запроса — для ссылок пагинации"""
+        params = [('material', value) for value in self.material]
+        params += [('color', value) for value in self.color]
+        if self.assembly_required is not None:
+            params.append(('assembly_required', int(self.assembly_required)))
+        if self.in_stock:
+            params.append(('in_stock', 1))
+        if self.min_price is not None:
+            params.append(('min_price', self.min_price))
+        if self.max_price is not None:
+            params.append(('max_price', self.max_price))
+        return urlencode(params)
+
+    def is_active(self):
+        return bool(self.querystring())
+
+
+def _facet_queryset(category_slug, filters):
+    return (
+        Furniture.objects
+        .filter(category__slug=category_slug, is_active=True)
+        .filter(filters.price_q())
+        .annotate(in_stock=Case(
+            When(stock__gt=0, then=True), default=False, output_field=BooleanField(),
+        ))
+        .values('material', 'color', 'assembly_required', 'in_stock')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+
+
+def _facet_cache_name(category_slug, filters):
+    return f'facets:{category_slug}:{filters.min_price}:{filters.max_price}'
+
+
+def facet_rows(category_slug, filters):
+    """Счётчики по комбинациям значений фасетов — один GROUP BY на категорию"""
+    return catalog_cache.remember(
+        _facet_cache_name(category_slug, filters),
+        [catalog_cache.category_scope(category_slug)],
+        lambda: list(_facet_queryset(category_slug, filters)),
+    )
+
+
+async def afacet_rows(category_slug, filters):
+    async def compute():
+        return [row async for row in _facet_queryset(category_slug, filters)]
+
+    return await catalog_cache.aremember(
+        _facet_cache_name(category_slug, filters),
+        [catalog_cache.category_scope(category_slug)],
+        compute,
+    )
+
+
+def build_facets(rows, filters):
+    """Список фасетов для шаблона: значения, счётчики и отметка выбора"""
+    facets = []
+    for name, label in FACET_LABELS.items():
+        counts = {}
+        for row in rows:
+            value = row[name]
+            if value == '' or (name == 'in_stock' and not value):
+                continue
+            counts.setdefault(value, 0)
+            if filters.matches(row, skip=name):
+                counts[value] += row['count']
+
+        selected = filters.selected(name)
+        value_labels = BOOLEAN_VALUE_LABELS.get(name, {})
+        values = [
+            {
+                'value': int(value) if isinstance(value, bool) else value,
+                'label': value_labels.get(value, value),
+                'count': count,
+                'selected': value in selected,
+            }
+            for value, count in sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+            if count or value in selected
+        ]
+        if values:
+            facets.append({'name': name, 'label': label, 'values': values})
+    return facets
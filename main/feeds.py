@@ -0,0 +1,243 @@
+"""Товарный фид для маркетплейсов и рекламных сетей (YML и CSV).
+
+Фид строится потоком: товары читаются из базы итератором пачками
+(на PostgreSQL — серверным курсором), категории заранее загружаются в
+словарь, поэтому память не растёт с размером каталога. Текст сразу
+сжимается gzip и уходит клиенту.
+
+Готовый фид сохраняется в storage под именем с токеном версий кеша
+каталога и отдаётся повторно, пока каталог не изменится: площадки
+забирают фид несколько раз в час, а пересобирать его нужно только после
+правок. Собрать фид заранее можно командой ``export_feed``.
+"""
+import csv
+import gzip
+import hashlib
+import io
+import posixpath
+import tempfile
+import zlib
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.html import escape
+from django.views.decorators.http import require_safe
+
+from .catalog_cache import CATALOG_SCOPE, category_scope, version_token
+from .compression import negotiate
+from .models import Category, Furniture
+
+FEED_DIR = 'feeds'
+FEED_FORMATS = {
+    'yml': 'application/xml; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+ITERATOR_CHUNK = 2000
+# Строк фида в одном куске текста перед сжатием
+WRITE_CHUNK = 500
+GZIP_CHUNK = 64 * 1024
+
+FEED_COLUMNS = (
+    'id', 'sku', 'name', 'category_id', 'price', 'old_price', 'stock', 'slug', 'image',
+    'material', 'color', 'description',
+)
+CSV_HEADER = (
+    'id', 'sku', 'name', 'category', 'price', 'old_price', 'available', 'url', 'picture',
+    'material', 'color', 'description',
+)
+
+
+def feed_token(base_url):
+    """Меняется при любой правке каталога (версии всех категорий) и адреса сайта"""
+    slugs = Category.objects.order_by('slug').values_list('slug', flat=True)
+    token = version_token(CATALOG_SCOPE, *map(category_scope, slugs))
+    return hashlib.md5(f'{token}|{base_url}'.encode()).hexdigest()[:16]
+
+
+def feed_name(fmt, token):
+    return posixpath.join(FEED_DIR, f'products-{token}.{fmt}.gz')
+
+
+class FeedContext:
+    """Всё, что нужно для строк фида, кроме самих товаров"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.categories = dict(Category.objects.values_list('id', 'name'))
+        # reverse() один раз, дальше — подстановка slug
+        self.product_url = self.base_url + reverse('main:furniture_detail', args=['__slug__'])
+        self.media_url = default_storage.url('')
+
+    def url(self, slug):
+        return self.product_url.replace('__slug__', slug)
+
+    def picture(self, image):
+        if not image:
+            return ''
+        url = self.media_url + image
+        return url if url.startswith(('http://', 'https://')) else self.base_url + url
+
+
+def iter_products():
+    return (
+        Furniture.objects.filter(is_active=True)
+        .order_by('id')
+        .values_list(*FEED_COLUMNS)
+        .iterator(chunk_size=ITERATOR_CHUNK)
+    )
+
+
+def _batched(rows, size=WRITE_CHUNK):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_yml(context):
+    now = timezone.localtime().strftime('%Y-%m-%dT%H:%M:%S%z')
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<yml_catalog date="{now}">\n<shop>\n'
+        '<name>BlackWood</name>\n<company>BlackWood</company>\n'
+        f'<url>{escape(context.base_url)}/</url>\n'
+        '<currencies><currency id="RUR" rate="1"/></currencies>\n<categories>\n'
+    )
+    yield ''.join(
+        f'<category id="{pk}">{escape(name)}</category>\n' for pk, name in context.categories.items()
+    )
+    yield '</categories>\n<offers>\n'
+    for batch in _batched(iter_products()):
+        parts = []
+        for pk, sku, name, category_id, price, old_price, stock, slug, image, material, color, description in batch:
+            parts.append(
+                f'<offer id="{pk}" available="{"true" if stock > 0 else "false"}">'
+                f'<url>{escape(context.url(slug))}</url><price>{price}</price>'
+                + (f'<oldprice>{old_price}</oldprice>' if old_price and old_price > price else '')
+                + f'<currencyId>RUR</currencyId><categoryId>{category_id}</categoryId>'
+                + (f'<picture>{escape(context.picture(image))}</picture>' if image else '')
+                + f'<name>{escape(name)}</name><vendorCode>{escape(sku or "")}</vendorCode>'
+                f'<description>{escape(description)}</description>'
+                + (f'<param name="Материал">{escape(material)}</param>' if material else '')
+                + (f'<param name="Цвет">{escape(color)}</param>' if color else '')
+                + '</offer>\n'
+            )
+        yield ''.join(parts)
+    yield '</offers>\n</shop>\n</yml_catalog>\n'
+
+
+def iter_csv(context):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for batch in _batched(iter_products()):
+        for pk, sku, name, category_id, price, old_price, stock, slug, image, material, color, description in batch:
+            writer.writerow((
+                pk, sku or '', name, context.categories.get(category_id, ''), price, old_price or '',
+                int(stock > 0), context.url(slug), context.picture(image), material, color, description,
+            ))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+FEED_WRITERS = {'yml': iter_yml, 'csv': iter_csv}
+
+
+def gzip_chunks(chunks):
+    """Сжимает поток строк на лету, отдавая блоки примерно по GZIP_CHUNK байт"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    pending = []
+    size = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            pending.append(data)
+            size += len(data)
+        if size >= GZIP_CHUNK:
+            yield b''.join(pending)
+            pending, size = [], 0
+    pending.append(compressor.flush())
+    yield b''.join(pending)
+
+
+def build_feed(fmt, base_url, token=None):
+    """Сжатые блоки фида и сохранение готового файла в storage по окончании"""
+    name = feed_name(fmt, token or feed_token(base_url))
+    with tempfile.TemporaryFile() as spool:
+        for block in gzip_chunks(FEED_WRITERS[fmt](FeedContext(base_url))):
+            spool.write(block)
+            yield block
+        spool.seek(0)
+        # Параллельная сборка могла успеть раньше — тогда наш файл не нужен
+        if not default_storage.exists(name):
+            default_storage.save(name, File(spool))
+            remove_stale_feeds(fmt, keep=name)
+
+
+def remove_stale_feeds(fmt, keep):
+    try:
+        _, files = default_storage.listdir(FEED_DIR)
+    except FileNotFoundError:
+        return
+    for filename in files:
+        path = posixpath.join(FEED_DIR, filename)
+        if path != keep and filename.endswith(f'.{fmt}.gz'):
+            default_storage.delete(path)
+
+
+def _gunzip_chunks(fileobj):
+    with gzip.GzipFile(fileobj=fileobj) as source:
+        while chunk := source.read(GZIP_CHUNK):
+            yield chunk
+
+
+def feed_base_url(request):
+    return getattr(settings, 'FEED_BASE_URL', '') or request.build_absolute_uri('/')
+
+
+@require_safe
+def product_feed(request, fmt):
+    if fmt not in FEED_FORMATS:
+        raise Http404('Неизвестный формат фида')
+
+    base_url = feed_base_url(request)
+    token = feed_token(base_url)
+    etag = f'"{token}-{fmt}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+
+    accepts_gzip = 'gzip' in negotiate(request.headers.get('Accept-Encoding', ''))
+    name = feed_name(fmt, token)
+    if default_storage.exists(name):
+        fileobj = default_storage.open(name, 'rb')
+        if accepts_gzip:
+            response = FileResponse(fileobj, content_type=FEED_FORMATS[fmt])
+        else:
+            response = StreamingHttpResponse(_gunzip_chunks(fileobj), content_type=FEED_FORMATS[fmt])
+    elif accepts_gzip:
+        response = StreamingHttpResponse(build_feed(fmt, base_url, token), content_type=FEED_FORMATS[fmt])
+    else:
+        # Редкий клиент без gzip: отдаём текст как есть, без сохранения копии
+        chunks = FEED_WRITERS[fmt](FeedContext(base_url))
+        response = StreamingHttpResponse((chunk.encode() for chunk in chunks), content_type=FEED_FORMATS[fmt])
+
+    if accepts_gzip:
+        response['Content-Encoding'] = 'gzip'
+    response['ETag'] = etag
+    response['Content-Disposition'] = f'inline; filename="products.{fmt}"'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
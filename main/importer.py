@@ -0,0 +1,282 @@
+"""Потоковый импорт каталога поставщика (CSV / JSONL).
+
+Строки читаются по одной и собираются в пачки; на пачку приходится
+фиксированное число запросов:
+
+* один SELECT существующих товаров по артикулам;
+* один SELECT занятых slug-ов;
+* ``bulk_update`` для найденных и ``bulk_create`` для новых товаров;
+  у найденных обновляются только столбцы, заполненные в строке файла —
+  частичный фид не снимает «Рекомендуемый», не возвращает в продажу
+  скрытые товары и не затирает фото значениями по умолчанию;
+* один ``bulk_update`` артикулов ``FUR<id>`` для новых строк без артикула.
+
+Память не растёт с размером файла: в ней держится только текущая пачка
+и словарь категорий. Сигналы при bulk-операциях не срабатывают, поэтому
+поисковый индекс обновляется по пачкам, а кеш каталога и похожие товары
+пересчитываются в конце для затронутых категорий.
+"""
+import csv
+import json
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import catalog_cache, inventory, related
+from .models import Category, Furniture, StockBucket, sku_for_id
+from .search import get_search_backend
+
+UPDATE_FIELDS = [
+    'category', 'name', 'description', 'price', 'old_price', 'stock', 'is_active', 'is_featured',
+    'material', 'color', 'dimensions', 'weight', 'assembly_required', 'warranty', 'image',
+]
+
+MAX_REPORTED_ERRORS = 100
+
+TRUE_VALUES = {'1', 'true', 'yes', 'да', 'y'}
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+@dataclass
+class ImportStats:
+    created: int = 0
+    updated: int = 0
+    skipped: int = 0
+    errors: list = field(default_factory=list)
+    category_ids: set = field(default_factory=set)
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def processed(self):
+        return self.created + self.updated + self.skipped
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.processed / elapsed if elapsed else 0.0
+
+
+def read_rows(fileobj, fmt):
+    """Построчно отдаёт словари из CSV или JSONL; вместо битой строки JSONL —
+    ``ImportRowError``, чтобы импорт пропустил её, а не остановился"""
+    if fmt == 'csv':
+        yield from csv.DictReader(fileobj)
+    elif fmt == 'jsonl':
+        for line in fileobj:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield ImportRowError(f'неверный JSON: {exc.msg}')
+                continue
+            yield row if isinstance(row, dict) else ImportRowError('строка JSONL должна быть объектом')
+    else:
+        raise ValueError(f'Неизвестный формат: {fmt}')
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _decimal(value, name, required=False):
+    if value in (None, ''):
+        if required:
+            raise ImportRowError(f'не указано поле {name}')
+        return None
+    try:
+        result = Decimal(str(value).replace(',', '.').replace(' ', ''))
+    except InvalidOperation:
+        raise ImportRowError(f'{name}: неверное число {value!r}')
+    if not result.is_finite():
+        raise ImportRowError(f'{name}: неверное число {value!r}')
+    if result < 0:
+        raise ImportRowError(f'{name}: отрицательное значение')
+    return result
+
+
+def _flag(value, default):
+    if value in (None, ''):
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+class CatalogImporter:
+    def __init__(self, batch_size=1000, create_categories=False, rebuild_related=True, progress=None):
+        self.batch_size = batch_size
+        self.create_categories = create_categories
+        self.rebuild_related = rebuild_related
+        self.progress = progress
+        self.stats = ImportStats()
+        self.categories = {}
+        for pk, slug, name in Category.objects.values_list('id', 'slug', 'name'):
+            self.categories[slug] = pk
+            self.categories[name.lower()] = pk
+
+    def run(self, rows):
+        batch = []
+        for line_number, row in enumerate(rows, 1):
+            try:
+                obj = self.build(row)
+            except ImportRowError as exc:
+                self.skip(line_number, exc)
+            else:
+                obj.import_line = line_number
+                batch.append(obj)
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        if batch:
+            self.flush(batch)
+        self.finish()
+        return self.stats
+
+    def skip(self, line_number, reason):
+        self.stats.skipped += 1
+        if len(self.stats.errors) < MAX_REPORTED_ERRORS:
+            self.stats.errors.append(f'строка {line_number}: {reason}')
+
+    def category_id(self, value):
+        key = _text(value)
+        if not key:
+            raise ImportRowError('не указана категория')
+        pk = self.categories.get(key) or self.categories.get(key.lower())
+        if pk is None:
+            if not self.create_categories:
+                raise ImportRowError(f'неизвестная категория {key!r}')
+            category = Category.objects.create(name=key, slug=slugify(key) or f'category-{len(self.categories)}')
+            pk = self.categories[category.slug] = self.categories[key.lower()] = category.pk
+        return pk
+
+    def build(self, row):
+        if isinstance(row, ImportRowError):
+            raise row
+        name = _text(row.get('name'))
+        if not name:
+            raise ImportRowError('не указано название')
+        obj = Furniture(
+            sku=_text(row.get('sku')) or None,
+            slug=_text(row.get('slug')),
+            category_id=self.category_id(row.get('category')),
+            name=name[:200],
+            description=_text(row.get('description')),
+            price=_decimal(row.get('price'), 'price', required=True),
+            old_price=_decimal(row.get('old_price'), 'old_price'),
+            stock=int(_decimal(row.get('stock'), 'stock') or 0),
+            is_active=_flag(row.get('is_active'), True),
+            is_featured=_flag(row.get('is_featured'), False),
+            material=_text(row.get('material')),
+            color=_text(row.get('color')),
+            dimensions=_text(row.get('dimensions')),
+            weight=_text(row.get('weight')),
+            assembly_required=_flag(row.get('assembly_required'), True),
+            warranty=_text(row.get('warranty')) or '5 лет',
+            image=_text(row.get('image')),
+        )
+        # Значения по умолчанию — только для новых товаров; существующему
+        # обновятся лишь столбцы, которые есть в строке
+        obj.import_fields = tuple(name for name in UPDATE_FIELDS if row.get(name) not in (None, ''))
+        return obj
+
+    @transaction.atomic
+    def flush(self, batch):
+        # Повтор артикула внутри пачки — берём последнюю строку, прежнюю считаем пропущенной
+        by_sku = {}
+        without_sku = []
+        for obj in batch:
+            if obj.sku:
+                if obj.sku in by_sku:
+                    dropped = by_sku[obj.sku]
+                    self.skip(dropped.import_line, f'артикул {obj.sku} повторяется в строке {obj.import_line}')
+                by_sku[obj.sku] = obj
+            else:
+                without_sku.append(obj)
+
+        existing = {
+            row['sku']: row
+            for row in Furniture.objects.filter(sku__in=list(by_sku)).values('id', 'sku', 'slug')
+        }
+        to_update, to_create = [], list(without_sku)
+        for sku, obj in by_sku.items():
+            if sku in existing:
+                obj.pk = existing[sku]['id']
+                obj.slug = existing[sku]['slug']
+                to_update.append(obj)
+            else:
+                to_create.append(obj)
+
+        self.allocate_slugs(to_create)
+        now = timezone.now()
+        for obj in to_update:
+            obj.updated_at = now
+        # Строки с одинаковым набором столбцов — одним bulk_update
+        by_fields = defaultdict(list)
+        for obj in to_update:
+            by_fields[obj.import_fields].append(obj)
+        for fields, objects in by_fields.items():
+            Furniture.objects.bulk_update(objects, [*fields, 'updated_at'], batch_size=self.batch_size)
+        # У разбитых товаров остаток живёт в частях — раскладываем новый по ним
+        restocked = {obj.pk: obj.stock for obj in to_update if 'stock' in obj.import_fields}
+        if restocked:
+            split = StockBucket.objects.filter(product_id__in=list(restocked)).values_list('product_id', flat=True)
+            for product_id in set(split):
+                inventory.set_stock(product_id, restocked[product_id])
+        created = Furniture.objects.bulk_create(to_create, batch_size=self.batch_size)
+
+        # Артикулы FUR<id> — как у Furniture.save(), но одним запросом на пачку
+        needs_sku = [obj for obj in created if not obj.sku]
+        for obj in needs_sku:
+            obj.sku = sku_for_id(obj.pk)
+        if needs_sku:
+            Furniture.objects.bulk_update(needs_sku, ['sku'], batch_size=self.batch_size)
+
+        touched = to_update + created
+        get_search_backend().update([obj.pk for obj in touched])
+        self.stats.category_ids.update(obj.category_id for obj in touched)
+        self.stats.created += len(created)
+        self.stats.updated += len(to_update)
+        if self.progress:
+            self.progress(self.stats)
+
+    def allocate_slugs(self, objects):
+        """Уникальные slug-и для всей пачки — не больше двух запросов"""
+        bases = Counter()
+        for obj in objects:
+            obj.slug = (slugify(obj.slug) or slugify(obj.name) or slugify(obj.sku or '') or 'product')[:140]
+            bases[obj.slug] += 1
+
+        taken = set(Furniture.objects.filter(slug__in=list(bases)).values_list('slug', flat=True))
+        clashing = taken | {base for base, count in bases.items() if count > 1}
+        if clashing:
+            taken.update(Furniture.objects.filter(
+                reduce(or_, (Q(slug__startswith=f'{base}-') for base in clashing))
+            ).values_list('slug', flat=True))
+
+        for obj in objects:
+            slug, counter = obj.slug, 2
+            while slug in taken:
+                slug = f'{obj.slug}-{counter}'
+                counter += 1
+            taken.add(slug)
+            obj.slug = slug
+
+    def finish(self):
+        if self.stats.category_ids:
+            slugs = Category.objects.filter(pk__in=self.stats.category_ids).values_list('slug', flat=True)
+            catalog_cache.bump(catalog_cache.CATALOG_SCOPE, *map(catalog_cache.category_scope, slugs))
+            if self.rebuild_related:
+                related.rebuild(sorted(self.stats.category_ids))
@@ -0,0 +1,214 @@
+"""Время запроса по частям: SQL, шаблоны, сессия и сообщения.
+
+``ServerTimingMiddleware`` (включается ``REQUEST_TIMING=1``) замеряет
+запрос и отдаёт результат в заголовке ``Server-Timing`` — его показывает
+вкладка Network в DevTools::
+
+    Server-Timing: db;dur=12.4;desc="7 SQL", tpl;dur=8.1, session;dur=0.6,
+                   messages;dur=0.1, app;dur=3.2, total;dur=24.4
+
+* ``db`` — SQL всех подключений: обёртка из ``execute_wrappers``
+  (механизм ``connection.execute_wrapper``) ставится на подключение при
+  его создании — под ASGI запросы к базе идут из потоков ``sync_to_async``
+  со своими подключениями, а замер запроса доходит до них через contextvar;
+* ``tpl`` — рендеринг шаблонов (бэкенд ``TimedDjangoTemplates``);
+* ``session`` и ``messages`` — загрузка и сохранение сессии
+  (``main/sessions.py``) и сообщений (``TimedMessageStorage``);
+* ``app`` — всё остальное: код видов, middleware, сериализация.
+
+Время вложенных участков вычитается из внешнего: SQL ленивого queryset,
+выполненный при рендеринге, попадает в ``db``, а не в ``tpl``, и части
+в сумме дают ``total``. Тело потокового ответа отдаётся уже после
+middleware, его время в замер не входит.
+
+Запросы дольше ``SLOW_REQUEST_MS`` пишутся в лог ``main.instrumentation``
+с самыми медленными и самыми частыми SQL — второе и есть N+1.
+
+Выключенный middleware поднимает ``MiddlewareNotUsed``: в цепочку он не
+попадает и обёртку SQL не ставит, а в шаблонах, сессии и сообщениях
+остаётся одно чтение contextvar.
+Заголовок виден всем клиентам — в продакшене включайте его на время
+разбора, а не постоянно.
+"""
+import logging
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger(__name__)
+
+# Порядок частей в заголовке
+PARTS = ('db', 'tpl', 'session', 'messages')
+# Сколько SQL показывать в логе медленного запроса
+LOG_STATEMENTS = 3
+LOG_SQL_LENGTH = 300
+
+_timings = ContextVar('request_timings', default=None)
+_span = ContextVar('request_timing_span', default=None)
+
+
+class Span:
+    """Замер участка запроса; вне замеряемого запроса ничего не делает"""
+    __slots__ = ('name', 'timings', 'token', 'started', 'child_ms', 'elapsed')
+
+    def __init__(self, name):
+        self.name = name
+        self.timings = _timings.get()
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        if self.timings is not None:
+            self.child_ms = 0.0
+            self.token = _span.set(self)
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is None:
+            return
+        self.elapsed = (time.perf_counter() - self.started) * 1000
+        _span.reset(self.token)
+        self.timings.parts[self.name] += self.elapsed - self.child_ms
+        parent = _span.get()
+        if parent is not None:
+            parent.child_ms += self.elapsed
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.parts = defaultdict(float)
+        # (подключение, SQL, мс) в порядке выполнения
+        self.statements = []
+
+    @contextmanager
+    def collect(self):
+        token = _timings.set(self)
+        try:
+            yield self
+        finally:
+            _timings.reset(token)
+            self.total = (time.perf_counter() - self.started) * 1000
+
+    def header(self):
+        metrics = [f'db;dur={self.parts["db"]:.1f};desc="{len(self.statements)} SQL"']
+        metrics += [f'{name};dur={self.parts[name]:.1f}' for name in PARTS[1:] if name in self.parts]
+        app = self.total - sum(self.parts.values())
+        metrics += [f'app;dur={max(app, 0):.1f}', f'total;dur={self.total:.1f}']
+        return ', '.join(metrics)
+
+    def slowest(self, count=LOG_STATEMENTS):
+        return sorted(self.statements, key=lambda statement: -statement[2])[:count]
+
+    def most_repeated(self, count=LOG_STATEMENTS):
+        counts = Counter((alias, sql) for alias, sql, _ in self.statements)
+        return [(alias, sql, times) for (alias, sql), times in counts.most_common(count) if times > 1]
+
+    def log_if_slow(self, request, response):
+        if self.total < settings.SLOW_REQUEST_MS:
+            return
+        lines = [
+            f'Медленный запрос {request.method} {request.get_full_path()} -> {response.status_code}: '
+            f'{self.header()}'
+        ]
+        lines += [
+            f'  {elapsed:.1f} мс [{alias}] {sql[:LOG_SQL_LENGTH]}'
+            for alias, sql, elapsed in self.slowest()
+        ]
+        lines += [f'  {times}× [{alias}] {sql[:LOG_SQL_LENGTH]}' for alias, sql, times in self.most_repeated()]
+        logger.warning('\n'.join(lines))
+
+    def finish(self, request, response):
+        response['Server-Timing'] = self.header()
+        self.log_if_slow(request, response)
+        return response
+
+
+def record_sql(execute, sql, params, many, context):
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    current = Span('db')
+    try:
+        with current:
+            return execute(sql, params, many, context)
+    finally:
+        timings.statements.append((context['connection'].alias, sql, current.elapsed))
+
+
+def install_sql_wrapper(connection, **kwargs):
+    if record_sql not in connection.execute_wrappers:
+        # В начало списка: execute_wrapper() снимает обёртки с конца
+        connection.execute_wrappers.insert(0, record_sql)
+
+
+class ServerTimingMiddleware:
+    """Ставится первым в MIDDLEWARE, чтобы total охватывал весь запрос"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        connection_created.connect(install_sql_wrapper, dispatch_uid='main.instrumentation')
+        for connection in connections.all(initialized_only=True):
+            install_sql_wrapper(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings = RequestTimings()
+        with timings.collect():
+            response = self.get_response(request)
+        return timings.finish(request, response)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        with timings.collect():
+            response = await self.get_response(request)
+        return timings.finish(request, response)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with Span('tpl'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблоны Django с замером рендеринга для Server-Timing"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class TimedMessageStorage(FallbackStorage):
+    """Хранилище сообщений по умолчанию с замером чтения и сохранения"""
+
+    def _get(self, *args, **kwargs):
+        with Span('messages'):
+            return super()._get(*args, **kwargs)
+
+    def update(self, response):
+        with Span('messages'):
+            return super().update(response)
@@ -0,0 +1,337 @@
+"""Резервирование остатков товара.
+
+``Furniture.stock`` — доступный к продаже остаток. Резерв сразу уменьшает
+его условным ``UPDATE ... SET stock = stock - n WHERE stock >= n``, так что
+остаток не уходит в минус даже при одновременных покупках, и записывает
+``StockReservation`` со сроком действия. Дальше резерв либо подтверждается
+покупкой (``confirm``), либо снимается (``release``) — вручную или
+командой ``sweep_reservations`` по истечении срока.
+
+Популярные товары распродаж принимают почти весь поток, и условный UPDATE
+одной строки выстраивает покупателей в очередь за её блокировкой. Остаток
+такого товара разбивается на несколько строк ``StockBucket``
+(``split_stock``): резерв списывает из случайной части, при нехватке — из
+соседних по кругу, а если целиком не хватает ни в одной, набирает
+количество из нескольких, блокируя их по порядку номеров. Одновременные
+покупатели попадают в разные строки и ждут друг друга реже. Возврат
+(``release``, sweeper) кладёт товар в случайную часть.
+
+У разбитого товара ``Furniture.stock`` — сумма частей для витрины, фасетов
+и фида. Резерв её не трогает, иначе строка товара снова стала бы общей
+блокировкой: сумма обновляется сразу, только когда товар закончился или
+снова появился, а точное число — ``sync_split_stock`` в каждом проходе
+``sweep_reservations``. Новый остаток из админки и импорта проходит через
+``set_stock``: он раскладывается по тем же частям, и синхронизация его не
+перезапишет.
+
+Строка остатка в транзакции резерва изменяется последним оператором прямо
+перед COMMIT, а sweeper возвращает остаток одним UPDATE на товар за пачку,
+а не на каждый резерв.
+
+Кеш каталога сбрасывается только когда товар заканчивается или снова
+появляется в наличии — от этого зависят фасет «В наличии» и витрина.
+"""
+import random
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from . import catalog_cache, db_router
+from .models import Category, Furniture, StockBucket, StockReservation
+
+RESERVATION_TTL = timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_MINUTES', 15))
+SWEEP_BATCH = 500
+
+DECREMENT_SQL = (
+    'UPDATE main_furniture SET stock = stock - %s '
+    'WHERE id = %s AND stock >= %s RETURNING stock, category_id'
+)
+RESTOCK_SQL = 'UPDATE main_furniture SET stock = stock + %s WHERE id = %s RETURNING stock, category_id'
+BUCKET_DECREMENT_SQL = (
+    'UPDATE main_stockbucket SET stock = stock - %s '
+    'WHERE product_id = %s AND number = %s AND stock >= %s RETURNING stock'
+)
+
+RETURNING_VENDORS = {'postgresql', 'sqlite'}
+
+
+class _OutOfStock(Exception):
+    pass
+
+
+def _change_stock(using, product_id, delta):
+    """Атомарно меняет остаток; False, если товара нет или остатка не хватает"""
+    # Остаток читается с реплик — покупатель должен сразу увидеть своё изменение
+    db_router.pin_primary()
+    buckets = dict(
+        StockBucket.objects.using(using).filter(product_id=product_id).order_by('number')
+        .values_list('number', 'stock')
+    )
+    if buckets:
+        return _change_bucket_stock(using, product_id, delta, buckets)
+
+    changed = _change_row_stock(using, product_id, delta)
+    if changed is None:
+        return False
+    # Списали последнее или вернули товар, которого не было
+    if changed[0] == (0 if delta < 0 else delta):
+        _availability_changed(using, changed[1])
+    return True
+
+
+def _change_row_stock(using, product_id, delta):
+    """Остаток в строке товара; (новый остаток, id категории) или None"""
+    connection = connections[using]
+    if connection.vendor in RETURNING_VENDORS:
+        with connection.cursor() as cursor:
+            if delta < 0:
+                cursor.execute(DECREMENT_SQL, [-delta, product_id, -delta])
+            else:
+                cursor.execute(RESTOCK_SQL, [delta, product_id])
+            return cursor.fetchone()
+
+    products = Furniture.objects.using(using).filter(pk=product_id)
+    if delta < 0:
+        products = products.filter(stock__gte=-delta)
+    if not products.update(stock=F('stock') + delta):
+        return None
+    return Furniture.objects.using(using).filter(pk=product_id).values_list('stock', 'category_id').first()
+
+
+def _change_bucket_stock(using, product_id, delta, buckets):
+    """Остаток разбитого товара; ``buckets`` — {номер: остаток}, прочитанные без блокировки"""
+    numbers = list(buckets)
+    start = random.randrange(len(numbers))
+    if delta > 0:
+        StockBucket.objects.using(using).filter(product_id=product_id, number=numbers[start]).update(
+            stock=F('stock') + delta
+        )
+        _sync_total(using, product_id, stock=0)
+        return True
+
+    quantity = -delta
+    # Сначала случайная часть, потом соседние по кругу; где заведомо не хватает — не пробуем
+    for number in numbers[start:] + numbers[:start]:
+        if buckets[number] < quantity:
+            continue
+        left = _take_from_bucket(using, product_id, number, quantity)
+        if left is not None:
+            break
+    else:
+        left = _take_spread(using, product_id, quantity)
+        if left is None:
+            return False
+    if left == 0:
+        _sync_total(using, product_id, stock__gt=0)
+    return True
+
+
+def _take_from_bucket(using, product_id, number, quantity):
+    """Списывает из одной части; её новый остаток или None, если не хватило"""
+    connection = connections[using]
+    if connection.vendor in RETURNING_VENDORS:
+        with connection.cursor() as cursor:
+            cursor.execute(BUCKET_DECREMENT_SQL, [quantity, product_id, number, quantity])
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    buckets = StockBucket.objects.using(using).filter(product_id=product_id, number=number)
+    if not buckets.filter(stock__gte=quantity).update(stock=F('stock') - quantity):
+        return None
+    return buckets.values_list('stock', flat=True).first()
+
+
+def _take_spread(using, product_id, quantity):
+    """Целиком ни в одной части не хватает — набираем из нескольких;
+    остаток в затронутых частях или None"""
+    buckets = list(
+        StockBucket.objects.using(using).select_for_update()
+        .filter(product_id=product_id, stock__gt=0).order_by('number')
+        .values_list('number', 'stock')
+    )
+    available = sum(stock for _, stock in buckets)
+    if available < quantity:
+        return None
+    remaining = quantity
+    for number, stock in buckets:
+        take = min(stock, remaining)
+        StockBucket.objects.using(using).filter(product_id=product_id, number=number).update(
+            stock=F('stock') - take
+        )
+        remaining -= take
+        if not remaining:
+            break
+    return available - quantity
+
+
+def _bucket_total():
+    return Subquery(
+        StockBucket.objects.filter(product_id=OuterRef('pk')).order_by()
+        .values('product_id').annotate(total=Sum('stock')).values('total')
+    )
+
+
+def _sync_total(using, product_id, total=None, **stock_filter):
+    """Записывает в ``Furniture.stock`` сумму частей (или ``total``), если
+    строка товара подходит под фильтр; сбрасывает кеш, если изменилось наличие"""
+    products = Furniture.objects.using(using).filter(pk=product_id, **stock_filter)
+    row = products.values_list('stock', 'category_id').first()
+    if row is None:
+        return
+    if total is None:
+        products.update(stock=_bucket_total())
+        total = Furniture.objects.using(using).values_list('stock', flat=True).get(pk=product_id)
+    else:
+        products.update(stock=total)
+    if (row[0] == 0) != (total == 0):
+        _availability_changed(using, row[1])
+
+
+def _availability_changed(using, category_id):
+    """Товар закончился или снова появился — сбрасываем кеш его категории"""
+    def bump():
+        slug = Category.objects.using(using).filter(pk=category_id).values_list('slug', flat=True).first()
+        if slug:
+            catalog_cache.bump(catalog_cache.category_scope(slug))
+
+    transaction.on_commit(bump, using=using)
+
+
+def reserve(product_id, quantity=1, user_id=None, ttl=None, using='default'):
+    """Резервирует товар; возвращает ``StockReservation`` или None, если остатка нет"""
+    if quantity <= 0:
+        raise ValueError('quantity должно быть положительным')
+    try:
+        with transaction.atomic(using=using):
+            reservation = StockReservation.objects.using(using).create(
+                product_id=product_id,
+                user_id=user_id,
+                quantity=quantity,
+                expires_at=timezone.now() + (ttl or RESERVATION_TTL),
+            )
+            # Строка остатка блокируется только отсюда и до COMMIT
+            if not _change_stock(using, product_id, -quantity):
+                raise _OutOfStock
+    except _OutOfStock:
+        return None
+    return reservation
+
+
+def release(reservation_id, using='default'):
+    """Снимает резерв и возвращает товар в остаток; False, если резерва уже нет"""
+    with transaction.atomic(using=using):
+        reservations = StockReservation.objects.using(using).filter(pk=reservation_id)
+        row = reservations.values_list('product_id', 'quantity').first()
+        # Удалить резерв мог параллельный release или sweeper — возвращает тот, кто удалил
+        if row is None or not reservations.delete()[0]:
+            return False
+        _restock(using, Counter({row[0]: row[1]}))
+    return True
+
+
+def confirm(reservation_id, using='default'):
+    """Покупка: действующий резерв превращается в продажу, остаток уже списан"""
+    deleted, _ = StockReservation.objects.using(using).filter(
+        pk=reservation_id, expires_at__gt=timezone.now()
+    ).delete()
+    return bool(deleted)
+
+
+def _restock(using, quantities):
+    # Порядок по id — параллельные транзакции блокируют товары в одном порядке
+    for product_id in sorted(quantities):
+        _change_stock(using, product_id, quantities[product_id])
+
+
+def sweep_expired(now=None, batch_size=SWEEP_BATCH, using='default'):
+    """Снимает просроченные резервы пачками; возвращает число снятых"""
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic(using=using):
+            rows = list(
+                StockReservation.objects.using(using)
+                .select_for_update(skip_locked=True)
+                .filter(expires_at__lte=now)
+                .order_by('expires_at')
+                .values_list('id', 'product_id', 'quantity')[:batch_size]
+            )
+            if not rows:
+                break
+            StockReservation.objects.using(using).filter(pk__in=[row[0] for row in rows]).delete()
+            quantities = Counter()
+            for _, product_id, quantity in rows:
+                quantities[product_id] += quantity
+            _restock(using, quantities)
+        released += len(rows)
+        if len(rows) < batch_size:
+            break
+    return released
+
+
+def split_stock(product_id, buckets, using='default'):
+    """Разбивает остаток товара поровну на ``buckets`` частей; уже разбитый —
+    перераспределяет"""
+    if buckets < 2:
+        raise ValueError('Частей должно быть хотя бы две')
+    with transaction.atomic(using=using):
+        total = merge_stock(product_id, using)
+        StockBucket.objects.using(using).bulk_create(
+            StockBucket(product_id=product_id, number=number, stock=total // buckets + (number < total % buckets))
+            for number in range(buckets)
+        )
+    return total
+
+
+def set_stock(product_id, stock, using='default'):
+    """Задаёт остаток товара; у разбитого — поровну по его частям"""
+    with transaction.atomic(using=using):
+        numbers = list(
+            StockBucket.objects.using(using).select_for_update().filter(product_id=product_id)
+            .order_by('number').values_list('number', flat=True)
+        )
+        for index, number in enumerate(numbers):
+            StockBucket.objects.using(using).filter(product_id=product_id, number=number).update(
+                stock=stock // len(numbers) + (index < stock % len(numbers))
+            )
+        _sync_total(using, product_id, total=stock)
+
+
+def is_split(product_id, using='default'):
+    return StockBucket.objects.using(using).filter(product_id=product_id).exists()
+
+
+def merge_stock(product_id, using='default'):
+    """Собирает части обратно в ``Furniture.stock``; возвращает остаток"""
+    with transaction.atomic(using=using):
+        # Части, затем товар — в том же порядке, что и резерв, который опустошил часть
+        buckets = StockBucket.objects.using(using).filter(product_id=product_id)
+        parts = list(buckets.select_for_update().order_by('number').values_list('stock', flat=True))
+        stock = (
+            Furniture.objects.using(using).select_for_update()
+            .values_list('stock', flat=True).get(pk=product_id)
+        )
+        if parts:
+            stock = sum(parts)
+            buckets.delete()
+            _sync_total(using, product_id, total=stock)
+    return stock
+
+
+def sync_split_stock(using='default'):
+    """Обновляет ``Furniture.stock`` разбитых товаров суммой частей;
+    возвращает число исправленных товаров"""
+    stale = list(
+        Furniture.objects.using(using)
+        .filter(pk__in=StockBucket.objects.using(using).values('product_id'))
+        .annotate(bucket_total=_bucket_total())
+        .exclude(stock=F('bucket_total'))
+        .values_list('pk', flat=True)
+    )
+    for product_id in stale:
+        _sync_total(using, product_id)
+    return len(stale)
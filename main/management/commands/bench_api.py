@@ -0,0 +1,57 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from main.models import Category
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность JSON API и HTML-страницы категории'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', help='slug категории; по умолчанию — самая большая')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=24, help='Товаров на странице (как на сайте)')
+
+    def handle(self, *args, **options):
+        slug = options['category'] or (
+            Category.objects.annotate(n=Count('products')).order_by('-n').values_list('slug', flat=True).first()
+        )
+        if not slug:
+            raise CommandError('Каталог пуст — сначала загрузите товары')
+
+        targets = [
+            ('HTML', reverse('main:furniture', args=[slug]), {}),
+            ('API', reverse('main:api_products'), {'category': slug, 'limit': options['limit']}),
+            ('API ?fields', reverse('main:api_products'),
+             {'category': slug, 'limit': options['limit'], 'fields': 'id,name,price'}),
+        ]
+        self.stdout.write(f'Категория {slug}, {options["requests"]} запросов, кеш отключён')
+        host = next((h for h in settings.ALLOWED_HOSTS if '*' not in h and not h.startswith('.')), 'localhost')
+        client = Client(HTTP_HOST=host)
+        # Без кеша, чтобы мерить рендеринг и сериализацию, а не попадания в кеш
+        with override_settings(CACHES=NO_CACHE, DEBUG=True):
+            for label, url, params in targets:
+                client.get(url, params)
+                size = queries = 0
+                started = time.perf_counter()
+                for _ in range(options['requests']):
+                    reset_queries()
+                    response = client.get(url, params)
+                    body = b''.join(response.streaming_content) if response.streaming else response.content
+                    size += len(body)
+                    queries += len(connection.queries)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{label:<12} {options["requests"] / elapsed:>8.0f} req/s  '
+                    f'{elapsed / options["requests"] * 1000:.2f} ms/запрос  '
+                    f'{size / options["requests"] / 1024:.1f} KiB  '
+                    f'{queries / options["requests"]:.1f} запросов к БД'
+                )
@@ -0,0 +1,112 @@
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+
+from main.inventory import reserve, split_stock, sweep_expired, sync_split_stock
+from main.models import Category, Furniture, StockReservation
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест резервов: параллельные покупатели бьют в один популярный товар. '
+        'С --buckets 1,4,16 прогоняется по разу на каждое число частей остатка '
+        '(см. split_stock в main/inventory.py) — видно, как растёт пропускная способность'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--stock', type=int, default=10 ** 6, help='Начальный остаток товара')
+        parser.add_argument('--buckets', default='1', help='Числа частей остатка через запятую; 1 — без разбиения')
+
+    def handle(self, *args, **options):
+        try:
+            bucket_counts = [int(value) for value in options['buckets'].split(',')]
+        except ValueError:
+            raise CommandError('--buckets: целые числа через запятую, например 1,4,16')
+        if any(count < 1 for count in bucket_counts):
+            raise CommandError('--buckets: число частей не меньше 1')
+        if connection.vendor == 'sqlite' and max(bucket_counts) > 1:
+            self.stdout.write(self.style.WARNING(
+                'SQLite пропускает одного писателя на всю базу: разбиение остатка здесь не ускорит '
+                'резервы, замеряйте на PostgreSQL'
+            ))
+
+        category, _ = Category.objects.get_or_create(slug='bench-inventory', defaults={'name': 'Bench inventory'})
+        rates = []
+        try:
+            for buckets in bucket_counts:
+                rates.append(self.run(category, buckets, options))
+        finally:
+            if not category.products.exists():
+                category.delete()
+
+        if len(rates) > 1 and rates[0]:
+            self.stdout.write('Масштабирование по частям остатка:')
+            for buckets, rate in zip(bucket_counts, rates):
+                self.stdout.write(f'  {buckets:>3}: {rate:.0f} резервов/с, ×{rate / rates[0]:.2f}')
+
+    def run(self, category, buckets, options):
+        """Один прогон; возвращает резервов в секунду"""
+        product = Furniture.objects.create(
+            category=category, name='Bench inventory', slug='bench-inventory-product',
+            description='', price=Decimal('1'), stock=options['stock'], image='bench.jpg',
+        )
+        if buckets > 1:
+            split_stock(product.pk, buckets)
+        results = {'reserved': 0, 'rejected': 0, 'retries': 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['threads'])
+        deadline = []
+
+        def buyer():
+            reserved = rejected = retries = 0
+            try:
+                barrier.wait()
+                while time.monotonic() < deadline[0]:
+                    try:
+                        if reserve(product.pk, ttl=timedelta(seconds=-1)):
+                            reserved += 1
+                        else:
+                            rejected += 1
+                    except OperationalError:
+                        # SQLite: писатель один, остальные ждут busy_timeout и иногда сдаются
+                        retries += 1
+            finally:
+                connections.close_all()
+                with lock:
+                    results['reserved'] += reserved
+                    results['rejected'] += rejected
+                    results['retries'] += retries
+
+        threads = [threading.Thread(target=buyer) for _ in range(options['threads'])]
+        deadline.append(time.monotonic() + options['seconds'])
+        started = time.monotonic()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.monotonic() - started
+            rate = results['reserved'] / elapsed
+
+            sync_split_stock()
+            product.refresh_from_db(fields=['stock'])
+            held = StockReservation.objects.filter(product=product).count()
+            self.stdout.write(
+                f'Частей остатка {buckets}, {options["threads"]} потоков, {elapsed:.1f} с: '
+                f'{rate:.0f} резервов/с, отказов {results["rejected"]}, повторов {results["retries"]}'
+            )
+            self.stdout.write(f'  Остаток {product.stock} + в резерве {held} = {product.stock + held} '
+                              f'(было {options["stock"]})')
+
+            started = time.monotonic()
+            released = sweep_expired()
+            self.stdout.write(f'  Sweeper: {released} резервов за {time.monotonic() - started:.2f} с')
+        finally:
+            product.delete()
+        return rate
@@ -0,0 +1,55 @@
+import os
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from main.media import serve_file
+
+MODES = ('django', 'django-range', 'x-accel', 'x-sendfile')
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает режимы отдачи MEDIA: время воркера Python на один запрос'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=2 * 1024 * 1024, help='Размер файла в байтах')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на режим')
+
+    def handle(self, *args, **options):
+        name = 'bench/media-bench.bin'
+        full_path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as f:
+            f.write(os.urandom(options['size']))
+
+        factory = RequestFactory()
+        try:
+            self.stdout.write(f'Файл {options["size"]} байт, {options["requests"]} запросов на режим')
+            for mode in MODES:
+                headers = {'Range': 'bytes=0-65535'} if mode == 'django-range' else {}
+                timings, sent = [], 0
+                for _ in range(options['requests']):
+                    request = factory.get(f'/media/{name}', headers=headers)
+                    started = time.perf_counter()
+                    response = serve_file(request, name, mode=mode.replace('-range', ''))
+                    # Воркер занят, пока не отдаст весь ответ
+                    body = b''.join(response.streaming_content) if response.streaming else response.content
+                    response.close()
+                    timings.append(time.perf_counter() - started)
+                    sent += len(body)
+                timings.sort()
+                self.stdout.write(
+                    f'{mode:<13} {len(timings) / sum(timings):>9.0f} req/s  '
+                    f'p50 {statistics.median(timings) * 1000:.3f} ms  '
+                    f'p95 {timings[int(len(timings) * 0.95) - 1] * 1000:.3f} ms  '
+                    f'через Python {sent / len(timings) / 1024:.0f} KiB/запрос'
+                )
+        finally:
+            os.remove(full_path)
+            try:
+                os.rmdir(os.path.dirname(full_path))
+            except OSError:
+                pass
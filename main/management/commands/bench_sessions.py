@@ -0,0 +1,63 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from main.models import Furniture
+
+ENGINES = (
+    ('db', 'django.contrib.sessions.backends.db'),
+    ('cached_db', 'django.contrib.sessions.backends.cached_db'),
+    ('main.sessions', 'main.sessions'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает накладные расходы движков сессий: гость кладёт товар в корзину, '
+        'смотрит корзину и страницу товара — время и запросы к django_session на запрос'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=200, help='Повторов сценария из трёх запросов')
+        parser.add_argument('--interval', type=int, default=60, help='SESSION_DB_WRITE_INTERVAL для main.sessions')
+
+    def handle(self, *args, **options):
+        product = Furniture.objects.filter(is_active=True).values('pk', 'slug').first()
+        if product is None:
+            raise CommandError('Каталог пуст — сначала загрузите товары')
+        requests = [
+            ('post', reverse('main:add_to_cart', args=[product['pk']])),
+            ('get', reverse('main:cart')),
+            ('get', reverse('main:furniture_detail', args=[product['slug']])),
+        ]
+        host = next((h for h in settings.ALLOWED_HOSTS if '*' not in h and not h.startswith('.')), 'localhost')
+        total = options['rounds'] * len(requests)
+        self.stdout.write(f'{options["rounds"]} повторов сценария, {total} запросов на движок')
+
+        for label, engine in ENGINES:
+            with override_settings(
+                SESSION_ENGINE=engine, SESSION_DB_WRITE_INTERVAL=options['interval'], DEBUG=True,
+            ):
+                client = Client(HTTP_HOST=host)
+                reads = writes = 0
+                started = time.perf_counter()
+                for _ in range(options['rounds']):
+                    for method, url in requests:
+                        reset_queries()
+                        getattr(client, method)(url)
+                        for query in connection.queries:
+                            if 'django_session' in query['sql']:
+                                if query['sql'].startswith('SELECT'):
+                                    reads += 1
+                                else:
+                                    writes += 1
+                elapsed = time.perf_counter() - started
+                client.session.flush()
+            self.stdout.write(
+                f'{label:<14} {elapsed / total * 1000:.2f} мс/запрос  '
+                f'чтений django_session: {reads / total:.2f}  записей: {writes / total:.2f} на запрос'
+            )
@@ -0,0 +1,55 @@
+import resource
+import sys
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from main.feeds import FEED_FORMATS, FEED_WRITERS, FeedContext, build_feed, feed_name, feed_token, gzip_chunks
+
+
+class Command(BaseCommand):
+    help = 'Выгружает товарный фид (YML/CSV) потоком; без --output — обновляет копию, которую отдаёт сайт'
+
+    def add_arguments(self, parser):
+        parser.add_argument('format', choices=sorted(FEED_FORMATS))
+        parser.add_argument('-o', '--output', help='Файл или "-" для stdout')
+        parser.add_argument('--gzip', action='store_true', help='Сжимать вывод (для *.gz включено всегда)')
+        parser.add_argument('--base-url', default=settings.FEED_BASE_URL or 'http://localhost:8000')
+
+    def handle(self, *args, **options):
+        fmt, base_url, output = options['format'], options['base_url'], options['output']
+        started = time.monotonic()
+
+        if output is None:
+            token = feed_token(base_url)
+            name = feed_name(fmt, token)
+            if default_storage.exists(name):
+                self.stdout.write(f'Фид актуален: {name}')
+                return
+            size = sum(len(block) for block in build_feed(fmt, base_url, token))
+        else:
+            compress = options['gzip'] or output.endswith('.gz')
+            if output == '-' and compress:
+                raise CommandError('Сжатый фид в stdout не выводится — укажите файл')
+            chunks = FEED_WRITERS[fmt](FeedContext(base_url))
+            if output == '-':
+                size = 0
+                for chunk in chunks:
+                    sys.stdout.write(chunk)
+                    size += len(chunk)
+                return
+            blocks = gzip_chunks(chunks) if compress else (chunk.encode() for chunk in chunks)
+            size = 0
+            with open(output, 'wb') as target:
+                for block in blocks:
+                    target.write(block)
+                    size += len(block)
+            name = output
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(
+            f'{name}: {size / 1024:.0f} KiB за {time.monotonic() - started:.2f} с, '
+            f'пик памяти процесса {peak:.0f} MiB'
+        )
@@ -0,0 +1,64 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.synthetic import PASSWORD, DatasetGenerator
+
+PREFIX_RE = re.compile(r'^[a-z0-9][a-z0-9-]{0,19}$')
+
+STAGES = {
+    'categories': ('категорий', 'categories'),
+    'products': ('товаров', 'products'),
+    'users': ('пользователей', 'users'),
+    'carts': ('строк корзин', 'cart_items'),
+    'related': ('похожие товары пересчитаны', None),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическим каталогом для нагрузочных тестов: категории, товары, '
+        'пользователи и корзины с правдоподобными распределениями (см. main/synthetic.py)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=10_000)
+        parser.add_argument('--users', type=int, default=1_000)
+        parser.add_argument('--carts', type=int, default=500, help='Не больше, чем пользователей')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='synthetic', help='Метка slug-ов, артикулов и логинов набора')
+        parser.add_argument('--seed', type=int, default=0, help='Одинаковый seed — одинаковые данные')
+        parser.add_argument('--skip-related', action='store_true',
+                            help='Не пересчитывать похожие товары (потом: rebuild_related)')
+
+    def handle(self, *args, **options):
+        if not PREFIX_RE.match(options['prefix']):
+            raise CommandError('Префикс: латиница в нижнем регистре, цифры и дефис, до 20 символов')
+
+        def progress(stage, stats):
+            label, attribute = STAGES[stage]
+            count = f'{getattr(stats, attribute)} ' if attribute else ''
+            self.stdout.write(f'{count}{label}, {stats.elapsed:.1f} с')
+
+        try:
+            generator = DatasetGenerator(
+                categories=options['categories'],
+                products=options['products'],
+                users=options['users'],
+                carts=options['carts'],
+                batch_size=options['batch_size'],
+                prefix=options['prefix'],
+                seed=options['seed'],
+                rebuild_related=not options['skip_related'],
+                progress=progress,
+            )
+            stats = generator.run()
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {stats.elapsed:.1f} с: категорий {stats.categories}, товаров {stats.products}, '
+            f'пользователей {stats.users} (пароль «{PASSWORD}»), '
+            f'корзин {stats.carts} с {stats.cart_items} строками'
+        ))
@@ -0,0 +1,40 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from main.models import Category, Furniture
+from main.renditions import generate_renditions
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие рендишены (WebP/JPEG) для фотографий товаров и категорий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Число потоков')
+        parser.add_argument('--force', action='store_true', help='Пересоздать существующие файлы')
+
+    def handle(self, *args, **options):
+        names = set()
+        for model in (Category, Furniture):
+            names.update(
+                model.objects.exclude(image='').values_list('image', flat=True).distinct().iterator()
+            )
+
+        started = time.monotonic()
+        created = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(generate_renditions, name, options['force']): name for name in names}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    created += future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'{futures[future]}: {exc}')
+                if done % 100 == 0:
+                    self.stdout.write(f'{done}/{len(names)} изображений')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {len(names)} изображений, {created} файлов создано, '
+            f'{failed} ошибок за {time.monotonic() - started:.1f} с'
+        ))
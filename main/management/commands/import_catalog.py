@@ -0,0 +1,50 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.importer import CatalogImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Потоковый импорт каталога поставщика из CSV или JSONL (upsert по артикулу)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл CSV/JSONL или "-" для stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='По умолчанию — по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Создавать неизвестные категории вместо пропуска строк')
+        parser.add_argument('--skip-related', action='store_true',
+                            help='Не пересчитывать похожие товары (потом: rebuild_related)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        if path == '-' and not options['format']:
+            raise CommandError('Для stdin укажите --format')
+
+        def progress(stats):
+            self.stdout.write(
+                f'{stats.processed} строк: +{stats.created} ~{stats.updated} '
+                f'пропущено {stats.skipped}, {stats.rate:.0f} строк/с'
+            )
+
+        importer = CatalogImporter(
+            batch_size=options['batch_size'],
+            create_categories=options['create_categories'],
+            rebuild_related=not options['skip_related'],
+            progress=progress,
+        )
+        fileobj = sys.stdin if path == '-' else open(path, encoding='utf-8-sig', newline='')
+        try:
+            stats = importer.run(read_rows(fileobj, fmt))
+        finally:
+            if fileobj is not sys.stdin:
+                fileobj.close()
+
+        for error in stats.errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: создано {stats.created}, обновлено {stats.updated}, '
+            f'пропущено {stats.skipped}; {stats.rate:.0f} строк/с'
+        ))
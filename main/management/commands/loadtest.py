@@ -0,0 +1,135 @@
+import http.client
+import itertools
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.urls import reverse
+
+from main.models import Category, Furniture
+from main.perf import percentile
+
+
+class Worker(threading.Thread):
+    """Поток с одним keep-alive соединением: запросы подряд до дедлайна"""
+
+    def __init__(self, base_url, paths, deadline, bust_cache):
+        super().__init__(daemon=True)
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.paths = paths
+        self.deadline = deadline
+        self.bust_cache = bust_cache
+        self.latencies = []
+        self.errors = 0
+
+    def connect(self):
+        return http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    def run(self):
+        connection = self.connect()
+        for number, path in enumerate(itertools.cycle(self.paths)):
+            if time.perf_counter() >= self.deadline:
+                break
+            if self.bust_cache:
+                # Уникальный адрес — мимо кеша страниц и фрагментов
+                path += f'{"&" if "?" in path else "?"}_={id(self)}-{number}'
+            started = time.perf_counter()
+            try:
+                connection.request('GET', self.prefix + path)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status < 400
+            except (OSError, http.client.HTTPException):
+                ok = False
+                connection.close()
+                connection = self.connect()
+            if ok:
+                self.latencies.append(time.perf_counter() - started)
+            else:
+                self.errors += 1
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест страниц каталога: запросы в секунду и хвостовые задержки. '
+        'Сравнение WSGI и ASGI на одних данных — запустите оба сервера на общей базе, например '
+        '«gunicorn config.wsgi -w 4 --threads 8 -b 127.0.0.1:8001» и '
+        '«uvicorn config.asgi:application --workers 4 --port 8002», затем '
+        '--target wsgi=http://127.0.0.1:8001 --target asgi=http://127.0.0.1:8002'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', metavar='ИМЯ=URL',
+            help='Сервер для теста; можно указать несколько (по умолчанию http://127.0.0.1:8000)',
+        )
+        parser.add_argument('--path', action='append', help='Адрес страницы; по умолчанию — страницы каталога')
+        parser.add_argument('--concurrency', type=int, default=16, help='Одновременных соединений')
+        parser.add_argument('--duration', type=float, default=10.0, help='Секунд на каждый сервер')
+        parser.add_argument('--warmup', type=float, default=1.0, help='Секунд прогрева перед замером')
+        parser.add_argument('--bust-cache', action='store_true', help='Мерить рендеринг, а не попадания в кеш')
+
+    def default_paths(self):
+        category = Category.objects.annotate(n=Count('products')).order_by('-n').first()
+        if category is None:
+            raise CommandError('Каталог пуст — сначала загрузите товары (generate_catalog или import_catalog)')
+        product_slug = (
+            Furniture.objects.filter(category=category, is_active=True).values_list('slug', flat=True).first()
+        )
+        paths = [reverse('main:category'), reverse('main:furniture', args=[category.slug])]
+        if product_slug:
+            paths.append(reverse('main:furniture_detail', args=[product_slug]))
+        return paths
+
+    def parse_targets(self, targets):
+        result = []
+        for target in targets or ['http://127.0.0.1:8000']:
+            label, _, url = target.rpartition('=')
+            if not url.startswith('http://'):
+                raise CommandError(f'Ожидается ИМЯ=http://хост:порт, получено {target!r}')
+            result.append((label or url, url))
+        return result
+
+    def run_load(self, url, paths, concurrency, duration, bust_cache):
+        deadline = time.perf_counter() + duration
+        workers = [Worker(url, paths, deadline, bust_cache) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        latencies = sorted(latency for worker in workers for latency in worker.latencies)
+        return {
+            'requests': len(latencies),
+            'errors': sum(worker.errors for worker in workers),
+            'rps': len(latencies) / elapsed if elapsed else 0.0,
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1] if latencies else 0.0,
+        }
+
+    def handle(self, *args, **options):
+        paths = options['path'] or self.default_paths()
+        targets = self.parse_targets(options['target'])
+        self.stdout.write(
+            f'Страницы: {", ".join(paths)}; {options["concurrency"]} соединений, '
+            f'{options["duration"]:g} с на сервер' + (', мимо кеша' if options['bust_cache'] else '')
+        )
+        self.stdout.write(
+            f'{"сервер":<10} {"req/s":>8} {"p50, мс":>9} {"p95, мс":>9} {"p99, мс":>9} {"max, мс":>9} {"ошибок":>7}'
+        )
+        for label, url in targets:
+            if options['warmup'] > 0:
+                self.run_load(url, paths, options['concurrency'], options['warmup'], options['bust_cache'])
+            result = self.run_load(url, paths, options['concurrency'], options['duration'], options['bust_cache'])
+            self.stdout.write(
+                f'{label:<10} {result["rps"]:>8.0f} {result["p50"] * 1000:>9.1f} {result["p95"] * 1000:>9.1f} '
+                f'{result["p99"] * 1000:>9.1f} {result["max"] * 1000:>9.1f} {result["errors"]:>7}'
+            )
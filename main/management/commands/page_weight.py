@@ -0,0 +1,46 @@
+import gzip
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from main.models import Category, Furniture
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+# Свои ассеты из base.html; при повторных просмотрах они берутся из кеша браузера
+SITE_ASSETS = ('css/site.css', 'js/site.js')
+
+
+class Command(BaseCommand):
+    help = 'Байты на просмотр страницы: HTML без сжатия и с gzip, плюс свои ассеты при первом визите'
+
+    def pages(self):
+        pages = [reverse('main:index'), reverse('main:category')]
+        category = Category.objects.values_list('slug', flat=True).first()
+        if category:
+            pages.append(reverse('main:furniture', args=[category]))
+        product = Furniture.objects.filter(is_active=True).values_list('slug', flat=True).first()
+        if product:
+            pages.append(reverse('main:furniture_detail', args=[product]))
+        return pages
+
+    def handle(self, *args, **options):
+        host = next((h for h in settings.ALLOWED_HOSTS if '*' not in h and not h.startswith('.')), 'localhost')
+        client = Client(HTTP_HOST=host)
+        self.stdout.write(f'{"страница":<40} {"HTML, Б":>9} {"gzip, Б":>9}')
+        with override_settings(CACHES=NO_CACHE):
+            for url in self.pages():
+                plain = len(client.get(url).content)
+                compressed = len(client.get(url, headers={'Accept-Encoding': 'gzip'}).content)
+                self.stdout.write(f'{url:<40} {plain:>9} {compressed:>9}')
+
+        for asset in SITE_ASSETS:
+            path = finders.find(asset)
+            if path:
+                with open(path, 'rb') as source:
+                    data = source.read()
+                self.stdout.write(
+                    f'{asset:<40} {len(data):>9} {len(gzip.compress(data, 9)):>9}  (один раз, дальше immutable-кеш)'
+                )
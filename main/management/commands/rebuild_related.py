@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.related import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Полностью пересчитывает таблицу похожих товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', type=int, action='append', dest='categories',
+                            help='id категории (можно несколько раз); по умолчанию все')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def progress(category_id, total):
+            self.stdout.write(f'Категория {category_id}: всего {total} товаров')
+
+        total = rebuild(options['categories'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {total} товаров за {time.monotonic() - started:.1f} с'
+        ))
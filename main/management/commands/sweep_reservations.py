@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.inventory import SWEEP_BATCH, sweep_expired, sync_split_stock
+
+
+class Command(BaseCommand):
+    help = (
+        'Снимает просроченные резервы товаров и возвращает их в остаток; '
+        'у товаров с разбитым остатком обновляет Furniture.stock'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH)
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='Работать постоянно, повторяя проход с этим интервалом')
+
+    def handle(self, *args, **options):
+        while True:
+            released = sweep_expired(batch_size=options['batch_size'])
+            synced = sync_split_stock()
+            if released or not options['loop']:
+                self.stdout.write(f'Снято резервов: {released}')
+            if synced:
+                self.stdout.write(f'Обновлён остаток разбитых товаров: {synced}')
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
@@ -0,0 +1,142 @@
+"""Отдача загруженных файлов (MEDIA).
+
+Режим задаётся настройкой ``MEDIA_SERVE_MODE``:
+
+* ``x-accel`` — nginx: Django только проверяет путь и отвечает
+  заголовком ``X-Accel-Redirect``, байты отдаёт сам nginx из
+  ``internal``-локации ``MEDIA_ACCEL_PREFIX``;
+* ``x-sendfile`` — то же для Apache (mod_xsendfile) и lighttpd;
+* ``django`` — файл отдаёт ``FileResponse`` с поддержкой Range,
+  ETag и долгим immutable-кешем (для разработки и как запасной вариант).
+
+Имена загрузок не переиспользуются (storage добавляет суффикс при
+совпадении), поэтому ответ можно кешировать навсегда.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def resolve_media_path(path):
+    """Абсолютный путь файла внутри MEDIA_ROOT; всё прочее — 404"""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except (SuspiciousFileOperation, ValueError):
+        raise Http404('Файл не найден')
+    if not os.path.isfile(full_path):
+        raise Http404('Файл не найден')
+    return full_path
+
+
+def file_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """(начало, конец) для одного диапазона, None — отдать файл целиком, ValueError — 416"""
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        length = int(end)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _range_iterator(fileobj, start, length):
+    try:
+        fileobj.seek(start)
+        while length > 0:
+            chunk = fileobj.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        fileobj.close()
+
+
+def _set_validators(response, stat, etag):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = CACHE_CONTROL
+    response['Accept-Ranges'] = 'bytes'
+
+
+def _offload(mode, path, full_path, content_type):
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel':
+        prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+        # Заголовок — только ASCII: кириллицу Django закодировал бы по MIME, и nginx не нашёл бы файл
+        response['X-Accel-Redirect'] = quote(prefix.rstrip('/') + '/' + path.lstrip('/'))
+    else:
+        response['X-Sendfile'] = quote(full_path)
+    return response
+
+
+def serve_file(request, path, mode=None):
+    """Отдаёт файл ``path`` из MEDIA_ROOT выбранным способом"""
+    full_path = resolve_media_path(path)
+    stat = os.stat(full_path)
+    etag = file_etag(stat)
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+        _set_validators(response, stat, etag)
+        return response
+
+    mode = mode or getattr(settings, 'MEDIA_SERVE_MODE', 'django')
+    if mode in ('x-accel', 'x-sendfile'):
+        # Range, If-Range и отдачу байтов берёт на себя фронтовой сервер
+        response = _offload(mode, path, full_path, content_type)
+        _set_validators(response, stat, etag)
+        return response
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if not if_range or if_range == etag:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+    fileobj = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(fileobj, content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(_range_iterator(fileobj, start, length), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Length'] = str(length)
+    _set_validators(response, stat, etag)
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    return serve_file(request, path)
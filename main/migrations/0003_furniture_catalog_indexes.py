@@ -0,0 +1,51 @@
+from django.db import migrations, models
+
+
+class AddIndexConcurrentlyOnPostgres(migrations.AddIndex):
+    """На PostgreSQL строит индекс через CREATE INDEX CONCURRENTLY,
+    чтобы не блокировать запись в таблицу; на остальных СУБД — обычный AddIndex."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql":
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql":
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+
+class Migration(migrations.Migration):
+
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ("main", "0002_cart_cartitem"),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name="furniture",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["category", "-created_at", "-id"],
+                name="furniture_active_cat_idx",
+            ),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name="furniture",
+            index=models.Index(
+                condition=models.Q(
+                    ("is_active", True), ("is_featured", True), ("stock__gt", 0)
+                ),
+                fields=["-created_at"],
+                name="furniture_featured_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+PG_VECTOR_SQL = (
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(material, '')), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(description, '')), 'C')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(
+            "ALTER TABLE main_furniture ADD COLUMN IF NOT EXISTS search_vector tsvector"
+        )
+        schema_editor.execute(f"UPDATE main_furniture SET search_vector = {PG_VECTOR_SQL}")
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS furniture_search_gin "
+            "ON main_furniture USING GIN (search_vector)"
+        )
+    elif vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS main_furniture_fts USING fts5("
+            "name, material, description, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            "INSERT INTO main_furniture_fts (rowid, name, material, description) "
+            "SELECT id, name, material, description FROM main_furniture"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS furniture_search_gin")
+        schema_editor.execute("ALTER TABLE main_furniture DROP COLUMN IF EXISTS search_vector")
+    elif vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS main_furniture_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0003_furniture_catalog_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,50 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0006_stock_reservation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("number", models.PositiveSmallIntegerField(verbose_name="Номер")),
+                (
+                    "stock",
+                    models.PositiveIntegerField(default=0, verbose_name="Остаток"),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_buckets",
+                        to="main.furniture",
+                        verbose_name="Товар",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Часть остатка",
+                "verbose_name_plural": "Части остатков",
+                "ordering": ["product", "number"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("product", "number"), name="stock_bucket_number_uniq"
+                    )
+                ],
+            },
+        ),
+    ]
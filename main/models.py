@@ -1,8 +1,16 @@
+from dataclasses import dataclass
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Count, F, Sum, Window
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator
 
 
+def sku_for_id(pk):
+    return f"FUR{pk:06d}"
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name='Название категории')
     description = models.TextField(verbose_name="Описание категории", blank=True)
@@ -60,10 +68,16 @@ class Furniture(models.Model):
             self.slug = slugify(self.name)
 
         if not self.sku:
-            self.sku = f"FUR{self.id:06d}" if self.id else "FUR000000"
+            self.sku = sku_for_id(self.id) if self.id else None
 
         super().save(*args, **kwargs)
 
+        if self.sku is None:
+            # id появляется только после INSERT; до него артикул оставляем NULL,
+            # иначе все новые товары получили бы одинаковый FUR000000
+            self.sku = sku_for_id(self.id)
+            type(self).objects.filter(pk=self.pk).update(sku=self.sku)
+
     def has_discount(self):
         return self.old_price and self.old_price > self.price
 
@@ -79,9 +93,37 @@ class Furniture(models.Model):
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
         ordering = ['-created_at']
+        indexes = [
+            # Страница категории и «похожие товары»: активные товары категории по дате
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='furniture_active_cat_idx',
+            ),
+            # Витрина рекомендуемых товаров в наличии
+            models.Index(
+                fields=['-created_at'],
+                condition=models.Q(is_active=True, is_featured=True, stock__gt=0),
+                name='furniture_featured_idx',
+            ),
+        ]
+
+
+
 
+@dataclass(frozen=True)
+class CartSummary:
+    """Сводка корзины: позиции, количество позиций и итоговая сумма"""
+    items: list
+    item_count: int
+    total: Decimal
 
 
+LINE_TOTAL = models.ExpressionWrapper(
+    F('product__price') * F('quantity'),
+    output_field=models.DecimalField(max_digits=12, decimal_places=2),
+)
+
 
 class Cart(models.Model):
     """Корзина пользователя"""
@@ -98,8 +140,38 @@ class Cart(models.Model):
         return f'Корзина пользователя {self.user.username}'
 
     def total_price(self):
-        """Общая стоимость корзины"""
-        return sum(item.total_price() for item in self.items.all())
+        """Общая стоимость корзины (считается в БД)"""
+        total = self.items.aggregate(total=Sum(LINE_TOTAL))['total']
+        return total if total is not None else Decimal('0')
+
+    def _summary_queryset(self):
+        return (
+            self.items
+            .select_related('product__category')
+            .annotate(
+                line_total=LINE_TOTAL,
+                cart_item_count=Window(Count('id')),
+                cart_total=Window(Sum(LINE_TOTAL)),
+            )
+            .order_by('id')
+        )
+
+    @staticmethod
+    def _build_summary(items):
+        if not items:
+            return CartSummary(items=[], item_count=0, total=Decimal('0'))
+        return CartSummary(
+            items=items,
+            item_count=items[0].cart_item_count,
+            total=items[0].cart_total,
+        )
+
+    def summary(self):
+        """Позиции с товарами и категориями, количество и сумма — одним запросом"""
+        return self._build_summary(list(self._summary_queryset()))
+
+    async def asummary(self):
+        return self._build_summary([item async for item in self._summary_queryset()])
 
     @property
     def item_count(self):
@@ -136,4 +208,85 @@ class CartItem(models.Model):
     class Meta:
         verbose_name = 'Товар в корзине'
         verbose_name_plural = 'Товары в корзине'
-        unique_together = ['cart', 'product']
\ No newline at end of file
+        unique_together = ['cart', 'product']
+
+
+class RelatedProduct(models.Model):
+    """Предрасчитанные похожие товары (заполняет main/related.py)"""
+    product = models.ForeignKey(
+        Furniture,
+        on_delete=models.CASCADE,
+        related_name='related_links',
+        verbose_name='Товар'
+    )
+    related = models.ForeignKey(
+        Furniture,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий товар'
+    )
+    position = models.PositiveSmallIntegerField(verbose_name='Позиция')
+    score = models.FloatField(verbose_name='Оценка сходства')
+
+    def __str__(self):
+        return f'{self.product_id} -> {self.related_id} ({self.score:.2f})'
+
+    class Meta:
+        verbose_name = 'Похожий товар'
+        verbose_name_plural = 'Похожие товары'
+        ordering = ['product', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'position'], name='related_product_position_uniq'),
+        ]
+
+
+class StockReservation(models.Model):
+    """Временный резерв товара; остаток уже уменьшен (см. main/inventory.py)"""
+    product = models.ForeignKey(
+        Furniture,
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        verbose_name='Товар'
+    )
+    user = models.ForeignKey(
+        'users.User',
+        on_delete=models.CASCADE,
+        related_name='stock_reservations',
+        null=True,
+        blank=True,
+        verbose_name='Пользователь'
+    )
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='Действует до')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.product_id} x {self.quantity} до {self.expires_at:%H:%M:%S}'
+
+    class Meta:
+        verbose_name = 'Резерв товара'
+        verbose_name_plural = 'Резервы товаров'
+
+
+class StockBucket(models.Model):
+    """Часть остатка популярного товара: резервы расходятся по нескольким
+    строкам вместо одной (см. main/inventory.py)"""
+    product = models.ForeignKey(
+        Furniture,
+        on_delete=models.CASCADE,
+        related_name='stock_buckets',
+        verbose_name='Товар'
+    )
+    number = models.PositiveSmallIntegerField(verbose_name='Номер')
+    stock = models.PositiveIntegerField(default=0, verbose_name='Остаток')
+
+    def __str__(self):
+        return f'{self.product_id} #{self.number}: {self.stock}'
+
+    class Meta:
+        verbose_name = 'Часть остатка'
+        verbose_name_plural = 'Части остатков'
+        ordering = ['product', 'number']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'number'], name='stock_bucket_number_uniq'),
+        ]
@@ -0,0 +1,117 @@
+"""Keyset-пагинация (по курсору) для больших списков товаров.
+
+В отличие от OFFSET, запрос глубокой страницы стоит столько же, сколько
+первой: база сразу переходит по индексу к позиции ``(created_at, id)``
+из курсора. Курсор передаётся в URL как непрозрачная строка.
+Страницы строятся и из моделей, и из словарей ``values()`` — во втором
+случае в выборке должны быть ``id`` и ``created_at``.
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from functools import partial
+
+from django.db.models import Q
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def cursor_key(obj):
+    """(created_at, id) модели или строки ``values()``"""
+    if isinstance(obj, dict):
+        return obj['created_at'], obj['id']
+    return obj.created_at, obj.pk
+
+
+def encode_cursor(obj, direction):
+    created_at, pk = cursor_key(obj)
+    payload = json.dumps([created_at.isoformat(), pk, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (created_at, id, направление) или бросает Http404"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, pk, direction = json.loads(base64.urlsafe_b64decode(padded))
+        created_at = parse_datetime(created_at)
+        if created_at is None or direction not in (NEXT, PREVIOUS):
+            raise ValueError(token)
+        return created_at, int(pk), direction
+    except (ValueError, TypeError, binascii.Error):
+        raise Http404('Неверный курсор страницы')
+
+
+@dataclass
+class KeysetPage:
+    """Страница выборки; повторяет интерфейс Page, нужный шаблонам"""
+    object_list: list
+    next_cursor: str = None
+    previous_cursor: str = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Пагинация по убыванию ``(created_at, id)``"""
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset.order_by('-created_at', '-id')
+        self.per_page = per_page
+
+    def page(self, token=None):
+        queryset, build = self._plan(token)
+        return build(list(queryset))
+
+    async def apage(self, token=None):
+        """``page`` для асинхронных представлений — тот же запрос через async-итерацию"""
+        queryset, build = self._plan(token)
+        return build([row async for row in queryset])
+
+    def _plan(self, token):
+        """Запрос страницы и функция, строящая из его строк ``KeysetPage``"""
+        if not token:
+            return self.queryset[:self.per_page + 1], partial(self._build, has_previous=False)
+
+        created_at, pk, direction = decode_cursor(token)
+        if direction == NEXT:
+            after = Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            return self.queryset.filter(after)[:self.per_page + 1], partial(self._build, has_previous=True)
+
+        before = Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+        return self.queryset.filter(before).reverse()[:self.per_page + 1], self._build_backward
+
+    def _build_backward(self, rows):
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return KeysetPage(
+            object_list=rows,
+            next_cursor=encode_cursor(rows[-1], NEXT) if rows else None,
+            previous_cursor=encode_cursor(rows[0], PREVIOUS) if rows and has_previous else None,
+        )
+
+    def _build(self, rows, has_previous):
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return KeysetPage(
+            object_list=rows,
+            next_cursor=encode_cursor(rows[-1], NEXT) if rows and has_next else None,
+            previous_cursor=encode_cursor(rows[0], PREVIOUS) if rows and has_previous else None,
+        )
@@ -0,0 +1,308 @@
+"""Бюджеты запросов и времени ответа для страниц сайта.
+
+Регрессионный набор ``PerformanceBudgetTests`` (``main/tests.py``)
+наполняет тестовую базу каталогом, похожим на боевой (``seed_catalog``),
+и проходит по каждому адресу из ``main/urls.py`` и ``users/urls.py`` —
+гостем и авторизованным пользователем. Для каждого сценария считаются
+запросы к базе и перцентили времени ответа; они сравниваются с бюджетом
+из ``main/perf_budgets.json``. Тест падает, если вид превысил бюджет
+(например, появился N+1) или если у нового адреса нет сценария.
+
+Число запросов проверяется всегда — оно не зависит от машины. Время
+ответа на общем CI скачет, поэтому p95 сверяется с бюджетом только по
+запросу: ``PERF_LATENCY=1`` (на выделенной машине, вместе с ``PERF_RUNS``
+побольше); без него время лишь попадает в отчёт.
+
+Кеш на время замера выключен (DummyCache): бюджет описывает холодный
+путь, который кеш страниц и фрагментов иначе бы скрыл.
+
+Запуск на SQLite::
+
+    python manage.py test main.tests.PerformanceBudgetTests
+
+На PostgreSQL — с теми же переменными окружения, что и у сайта
+(``ENGINE=django.db.backends.postgresql NAME=... USER=... HOST=...``).
+Если число запросов на другой СУБД или под ASGI (``ASYNC_VIEWS=1``)
+отличается, бюджет уточняется в разделе ``overrides`` файла бюджетов —
+по имени СУБД (``postgresql``) или ``asgi``. ``PERF_RUNS`` — повторов
+на сценарий, ``PERF_REPORT`` — путь для JSON-отчёта с перцентилями.
+"""
+import json
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Cart, CartItem, Category, Furniture
+from .related import rebuild
+
+BUDGETS_PATH = Path(__file__).resolve().parent / 'perf_budgets.json'
+
+DEFAULT_RUNS = 5
+# Сверять ли p95 с бюджетом (PERF_LATENCY=1)
+CHECK_LATENCY = os.getenv('PERF_LATENCY', '') == '1'
+PASSWORD = 'perf-password'
+
+# Доли категорий в каталоге: несколько крупных и хвост мелких
+CATEGORY_SHARES = (0.35, 0.2, 0.15, 0.1, 0.08, 0.06, 0.04, 0.02)
+MATERIALS = ('Дуб', 'Ясень', 'Бук', 'Сосна', 'Орех', 'Велюр', 'Кожа', 'Рогожка', 'Металл', 'Стекло')
+COLORS = ('Белый', 'Серый', 'Графит', 'Бежевый', 'Натуральный', 'Зелёный', 'Синий', 'Терракотовый')
+
+
+def percentile(values, fraction):
+    """Перцентиль по отсортированному списку (метод ближайшего ранга)"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, round(fraction * len(values) + 0.5) - 1))
+    return values[index]
+
+
+@dataclass
+class Catalog:
+    """Что создал ``seed_catalog``: сценарии берут отсюда адреса"""
+    categories: list
+    products: list
+    user: object
+    cart_size: int = 0
+
+    @property
+    def category(self):
+        return self.categories[0]
+
+    @property
+    def product(self):
+        return self.products[0]
+
+
+def seed_catalog(products=240, cart_size=12, seed=0):
+    """Каталог с неравными категориями, длинным хвостом материалов и корзиной на десяток строк"""
+    rng = random.Random(seed)
+    categories = [
+        Category.objects.create(name=f'Категория {number}', slug=f'category-{number}', image='category/test.jpg')
+        for number in range(len(CATEGORY_SHARES))
+    ]
+    created = []
+    for number in range(products):
+        category = rng.choices(categories, weights=CATEGORY_SHARES)[0]
+        price = Decimal(rng.randrange(3000, 250000, 100))
+        created.append(Furniture.objects.create(
+            category=category, name=f'Товар {number}', slug=f'product-{number}', sku=f'PERF-{number}',
+            description='Массив, съёмные чехлы, доставка и сборка по городу.',
+            price=price, old_price=price * Decimal('1.2') if rng.random() < 0.2 else None,
+            material=MATERIALS[min(int(rng.expovariate(0.5)), len(MATERIALS) - 1)],
+            color=COLORS[min(int(rng.expovariate(0.6)), len(COLORS) - 1)],
+            stock=rng.choice((0, 1, 3, 10, 25)), is_featured=rng.random() < 0.1,
+            image='furniture/test.jpg',
+        ))
+    # Сигналы пересчитывают похожие товары после коммита; в тестовой транзакции — сразу
+    rebuild()
+
+    # Первый товар — в самой большой категории, его страница самая тяжёлая
+    categories.sort(key=lambda category: -category.products.count())
+    created.sort(key=lambda product: product.category_id != categories[0].pk)
+
+    user = get_user_model().objects.create_user('perf', 'perf@example.com', PASSWORD)
+    cart = Cart.objects.create(user=user)
+    CartItem.objects.bulk_create(
+        CartItem(cart=cart, product=product, quantity=rng.randint(1, 3)) for product in created[:cart_size]
+    )
+    return Catalog(categories=categories, products=created, user=user, cart_size=cart_size)
+
+
+def fill_guest_cart(client, catalog):
+    for product in catalog.products[:catalog.cart_size]:
+        client.post(reverse('main:add_to_cart', args=[product.pk]))
+
+
+def user_cart_item(catalog):
+    """Первая строка корзины пользователя; сценарий удаления возвращает её обратно"""
+    item = CartItem.objects.filter(cart__user=catalog.user, product=catalog.product).first()
+    if item is None:
+        item = CartItem.objects.create(cart=Cart.objects.get(user=catalog.user), product=catalog.product)
+    return item.pk
+
+
+def fresh_login(client, catalog):
+    client.logout()
+    client.force_login(catalog.user)
+
+
+@dataclass
+class Scenario:
+    """Один замеряемый запрос; ``name`` — ключ бюджета"""
+    name: str
+    url_name: str
+    args: Callable = None
+    query: str = ''
+    method: str = 'get'
+    data: dict = field(default_factory=dict)
+    login: bool = False
+    # Готовит клиента до каждого повтора, вне замера
+    prepare: Callable = None
+    status: int = 200
+
+    def url(self, catalog):
+        url = reverse(self.url_name, args=self.args(catalog) if self.args else ())
+        return f'{url}?{self.query}' if self.query else url
+
+
+def _category(catalog):
+    return [catalog.category.slug]
+
+
+def _product_slug(catalog):
+    return [catalog.product.slug]
+
+
+def _product_id(catalog):
+    return [catalog.product.pk]
+
+
+SCENARIOS = [
+    Scenario('index', 'main:index'),
+    Scenario('index_user', 'main:index', login=True),
+    Scenario('category', 'main:category'),
+    Scenario('category_user', 'main:category', login=True),
+    Scenario('furniture', 'main:furniture', _category),
+    Scenario('furniture_filtered', 'main:furniture', _category, query=f'material={MATERIALS[0]}'),
+    Scenario('furniture_user', 'main:furniture', _category, login=True),
+    Scenario('furniture_detail', 'main:furniture_detail', _product_slug),
+    Scenario('furniture_detail_user', 'main:furniture_detail', _product_slug, login=True),
+    Scenario('search', 'main:search', query='q=товар'),
+    Scenario('about', 'main:about'),
+    Scenario('design_projects', 'main:design_projects'),
+    Scenario('contacts', 'main:contacts'),
+    Scenario('cart_guest', 'main:cart', prepare=fill_guest_cart),
+    Scenario('cart_user', 'main:cart', login=True),
+    Scenario('add_to_cart_guest', 'main:add_to_cart', _product_id, method='post', status=302),
+    Scenario('add_to_cart_user', 'main:add_to_cart', _product_id, method='post', login=True, status=302),
+    Scenario(
+        'remove_from_cart_guest', 'main:remove_from_cart', _product_id,
+        method='post', prepare=fill_guest_cart, status=302,
+    ),
+    Scenario(
+        'remove_from_cart_user', 'main:remove_from_cart', lambda catalog: [user_cart_item(catalog)],
+        method='post', login=True, status=302,
+    ),
+    Scenario(
+        'update_cart_guest', 'main:update_cart', _product_id,
+        method='post', data={'quantity': 2}, prepare=fill_guest_cart, status=302,
+    ),
+    Scenario(
+        'update_cart_user', 'main:update_cart', lambda catalog: [user_cart_item(catalog)],
+        method='post', data={'quantity': 2}, login=True, status=302,
+    ),
+    Scenario('api_categories', 'main:api_categories'),
+    Scenario('api_products', 'main:api_products'),
+    Scenario('api_products_category', 'main:api_products', query='category=category-0&limit=100'),
+    Scenario('api_product', 'main:api_product', _product_slug),
+    Scenario('product_feed_yml', 'main:product_feed', lambda catalog: ['yml']),
+    Scenario('product_feed_csv', 'main:product_feed', lambda catalog: ['csv']),
+    Scenario('register', 'users:register'),
+    Scenario('login', 'users:login'),
+    Scenario(
+        'login_submit', 'users:login', method='post',
+        data={'username': 'perf', 'password': PASSWORD}, prepare=lambda client, catalog: client.logout(),
+        status=302,
+    ),
+    Scenario('logout', 'users:logout', method='post', prepare=fresh_login, status=302),
+    Scenario('profile', 'users:profile', login=True),
+    Scenario(
+        'profile_submit', 'users:profile', method='post', login=True,
+        data={'first_name': 'Иван', 'last_name': 'Петров', 'email': 'perf@example.com', 'phone': ''},
+        status=302,
+    ),
+]
+
+
+@dataclass
+class Measurement:
+    name: str
+    queries: int
+    timings: list
+
+    def as_dict(self):
+        timings = sorted(self.timings)
+        return {
+            'queries': self.queries,
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'max_ms': round(timings[-1], 2),
+        }
+
+
+def measure(client, scenario, catalog, runs=DEFAULT_RUNS):
+    """Прогрев и ``runs`` повторов; берётся наибольшее число запросов за повтор"""
+    if scenario.login:
+        client.force_login(catalog.user)
+    queries, timings = 0, []
+    for number in range(runs + 1):
+        if scenario.prepare:
+            scenario.prepare(client, catalog)
+        url = scenario.url(catalog)
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = getattr(client, scenario.method)(url, scenario.data)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code != scenario.status:
+            raise AssertionError(f'{scenario.name}: {url} ответил {response.status_code}, ждали {scenario.status}')
+        if number:
+            queries = max(queries, len(captured))
+            timings.append(elapsed)
+    return Measurement(scenario.name, queries, timings)
+
+
+def budget_profiles():
+    """Разделы ``overrides``, которые применяются в текущем окружении"""
+    profiles = [connection.vendor]
+    if settings.ASYNC_VIEWS:
+        profiles.append('asgi')
+    return profiles
+
+
+def load_budgets(profiles=(), path=BUDGETS_PATH):
+    """Бюджеты сценариев с поправками из ``overrides`` для ``profiles``"""
+    with open(path, encoding='utf-8') as source:
+        data = json.load(source)
+    budgets = {name: dict(budget) for name, budget in data['views'].items()}
+    for profile in profiles:
+        for name, override in data.get('overrides', {}).get(profile, {}).items():
+            budgets.setdefault(name, {}).update(override)
+    return budgets
+
+
+def check_budget(measurement, budget, latency=CHECK_LATENCY):
+    """Список нарушений бюджета; пустой — всё в порядке. p95 — только при ``latency``"""
+    problems = []
+    if measurement.queries > budget['queries']:
+        problems.append(f'{measurement.name}: {measurement.queries} запросов при бюджете {budget["queries"]}')
+    if not latency:
+        return problems
+    p95 = percentile(sorted(measurement.timings), 0.95)
+    if p95 > budget['p95_ms']:
+        problems.append(f'{measurement.name}: p95 {p95:.1f} мс при бюджете {budget["p95_ms"]} мс')
+    return problems
+
+
+def write_report(measurements, path=None):
+    """JSON-отчёт с перцентилями, если задан PERF_REPORT"""
+    path = path or os.getenv('PERF_REPORT')
+    if not path:
+        return
+    report = {
+        'profiles': budget_profiles(),
+        'views': {measurement.name: measurement.as_dict() for measurement in measurements},
+    }
+    with open(path, 'w', encoding='utf-8') as target:
+        json.dump(report, target, ensure_ascii=False, indent=2)
@@ -0,0 +1,194 @@
+"""Расчёт блока «Похожие товары».
+
+Похожие товары ищутся внутри категории товара. Кандидат получает баллы
+за совпадение материала и цвета и за попадание в ценовой диапазон;
+при равенстве баллов выше тот, у кого цена ближе. Для каждого товара
+хранятся ``RELATED_LIMIT`` лучших кандидатов в ``RelatedProduct``, и
+страница товара читает их одним запросом по индексу ``(product, position)``.
+
+При изменении товара пересчитывается его собственный список и списки
+тех соседей по категории, в которые он входил или теперь должен войти.
+Полный пересчёт выполняет команда ``rebuild_related``.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import Furniture, RelatedProduct
+
+RELATED_LIMIT = 8
+
+MATERIAL_WEIGHT = 3.0
+COLOR_WEIGHT = 2.0
+PRICE_BAND_WEIGHT = 2.0
+# Цены различаются не больше чем на 30% — один ценовой диапазон
+PRICE_BAND = Decimal('0.3')
+
+CANDIDATE_FIELDS = ('id', 'category_id', 'material', 'color', 'price', 'is_active')
+
+
+def score(product, candidate):
+    """Сходство двух товаров одной категории"""
+    value = 0.0
+    if product['material'] and product['material'] == candidate['material']:
+        value += MATERIAL_WEIGHT
+    if product['color'] and product['color'] == candidate['color']:
+        value += COLOR_WEIGHT
+
+    top = max(product['price'], candidate['price'])
+    difference = abs(product['price'] - candidate['price'])
+    if top and difference <= top * PRICE_BAND:
+        value += PRICE_BAND_WEIGHT
+    # Близость цены в [0, 1) — только чтобы упорядочить равные баллы
+    value += 1 - float(difference / top) if top else 1.0
+    return value
+
+
+def top_related(product, candidates, limit=RELATED_LIMIT):
+    """[(id, оценка)] лучших активных кандидатов для товара"""
+    scored = [
+        (score(product, candidate), candidate['id'])
+        for candidate in candidates
+        if candidate['id'] != product['id'] and candidate['is_active']
+    ]
+    scored.sort(key=lambda item: (-item[0], -item[1]))
+    return [(pk, value) for value, pk in scored[:limit]]
+
+
+def category_rows(category_id):
+    return list(Furniture.objects.filter(category_id=category_id).values(*CANDIDATE_FIELDS))
+
+
+def store(lists):
+    """Перезаписывает списки похожих товаров: {id товара: [(id, оценка)]}"""
+    if not lists:
+        return
+    with transaction.atomic():
+        RelatedProduct.objects.filter(product_id__in=list(lists)).delete()
+        RelatedProduct.objects.bulk_create([
+            RelatedProduct(product_id=product_id, related_id=related_id, position=position, score=value)
+            for product_id, entries in lists.items()
+            for position, (related_id, value) in enumerate(entries)
+        ], batch_size=1000)
+
+
+def refresh_product(product_id, category_ids=(), affected=()):
+    """Точечный пересчёт после изменения товара.
+
+    ``category_ids`` — категории, которых касается изменение (текущая и
+    прежняя, если товар переносили); ``affected`` — товары, чьи списки
+    нужно пересчитать в любом случае (например, ссылавшиеся на удалённый).
+    """
+    affected = set(affected) | set(
+        RelatedProduct.objects.filter(related_id=product_id).values_list('product_id', flat=True)
+    )
+    rows_by_category = {category_id: category_rows(category_id) for category_id in set(category_ids) if category_id}
+
+    product = None
+    for rows in rows_by_category.values():
+        product = next((row for row in rows if row['id'] == product_id), product)
+
+    if product is not None:
+        affected.add(product_id)
+        if product['is_active']:
+            # Соседи, в чей список товар теперь проходит по оценке
+            worst = {
+                row['product_id']: (row['score'], row['position'])
+                for row in RelatedProduct.objects
+                .filter(product__category_id=product['category_id'])
+                .order_by('product_id', 'position')
+                .values('product_id', 'score', 'position')
+            }
+            for row in rows_by_category[product['category_id']]:
+                if row['id'] == product_id:
+                    continue
+                current = worst.get(row['id'])
+                if current is None or current[1] < RELATED_LIMIT - 1 or score(row, product) > current[0]:
+                    affected.add(row['id'])
+
+    lists = {}
+    rows_by_id = {row['id']: row for rows in rows_by_category.values() for row in rows}
+    missing = affected - set(rows_by_id)
+    if missing:
+        # Соседи из категорий, которые не затронуты изменением напрямую
+        for category_id in set(
+            Furniture.objects.filter(id__in=missing).values_list('category_id', flat=True)
+        ):
+            rows = category_rows(category_id)
+            rows_by_category[category_id] = rows
+            rows_by_id.update((row['id'], row) for row in rows)
+
+    for pk in affected:
+        row = rows_by_id.get(pk)
+        if row is not None:
+            lists[pk] = top_related(row, rows_by_category[row['category_id']])
+    store(lists)
+
+
+def rebuild(category_ids=None, progress=None):
+    """Полный пересчёт по категориям; возвращает число обработанных товаров"""
+    if category_ids is None:
+        # order_by() снимает Meta.ordering: иначе created_at попадёт в DISTINCT и категории повторятся
+        category_ids = Furniture.objects.values_list('category_id', flat=True).order_by().distinct()
+
+    total = 0
+    for category_id in category_ids:
+        rows = category_rows(category_id)
+        lists = {}
+        groups = _price_groups(rows)
+        for row in rows:
+            lists[row['id']] = top_related(row, _candidates(row, groups))
+            if len(lists) >= 1000:
+                store(lists)
+                total += len(lists)
+                lists = {}
+        store(lists)
+        total += len(lists)
+        if progress:
+            progress(category_id, total)
+    return total
+
+
+def _price_groups(rows):
+    """Активные товары категории по ценам: все, по материалу, по цвету и по паре материал + цвет"""
+    groups = defaultdict(list)
+    for row in sorted((row for row in rows if row['is_active']), key=lambda row: row['price']):
+        groups[None].append(row)
+        if row['material']:
+            groups['material', row['material']].append(row)
+        if row['color']:
+            groups['color', row['color']].append(row)
+        if row['material'] and row['color']:
+            groups['both', row['material'], row['color']].append(row)
+    return groups
+
+
+def _nearest(group, price):
+    index = bisect_left(group, price, key=lambda candidate: candidate['price'])
+    window = RELATED_LIMIT + 1
+    return group[max(index - window, 0):index + window]
+
+
+def _candidates(row, groups):
+    """Кандидаты, способные попасть в топ: ближайшие по цене в каждой группе совпадений.
+
+    Внутри группы (тот же материал, тот же цвет, оба, любые) оценка с
+    каждой стороны по цене только падает с удалением, а более близкий
+    кандидат из группы с тем же или большим набором совпадений не хуже.
+    Поэтому топ товара — среди ``RELATED_LIMIT + 1`` ближайших с каждой
+    стороны в каждой группе, и перебирать весь материал не нужно: на
+    большой категории с популярным материалом это были тысячи кандидатов.
+    """
+    keys = [None]
+    if row['material']:
+        keys.append(('material', row['material']))
+    if row['color']:
+        keys.append(('color', row['color']))
+    if row['material'] and row['color']:
+        keys.append(('both', row['material'], row['color']))
+    candidates = {}
+    for key in keys:
+        candidates.update((candidate['id'], candidate) for candidate in _nearest(groups.get(key, []), row['price']))
+    return candidates.values()
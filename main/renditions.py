@@ -0,0 +1,114 @@
+"""Уменьшенные копии (рендишены) фотографий товаров и категорий.
+
+Для каждой загруженной картинки готовятся WebP и JPEG фиксированных
+ширин; шаблоны подключают их через ``{% responsive_image %}`` с
+``srcset``/``sizes``. Файлы лежат рядом с медиа:
+
+    renditions/<имя оригинала>/<ширина>.<формат>
+
+После сохранения модели генерация уходит в пул потоков и не задерживает
+запрос. Если рендишена ещё нет, его создаёт ``rendition_view`` при первом
+обращении, а команда ``generate_renditions`` досоздаёт их для старых
+картинок.
+"""
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+RENDITION_WIDTHS = (320, 640, 960, 1280)
+RENDITION_FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'progressive': True, 'optimize': True}),
+}
+RENDITION_PREFIX = 'renditions'
+
+_executor = None
+
+
+def rendition_name(source_name, width, fmt):
+    return posixpath.join(RENDITION_PREFIX, source_name, f'{width}.{fmt}')
+
+
+def parse_rendition_name(path):
+    """``<оригинал>/<ширина>.<формат>`` -> (оригинал, ширина, формат) или None"""
+    source_name, _, filename = path.rpartition('/')
+    width, _, fmt = filename.partition('.')
+    if not source_name or not width.isdigit() or fmt not in RENDITION_FORMATS:
+        return None
+    if int(width) not in RENDITION_WIDTHS:
+        return None
+    normalized = posixpath.normpath(source_name)
+    if normalized != source_name or normalized.startswith(('/', '..')):
+        return None
+    return source_name, int(width), fmt
+
+
+def rendition_url(source_name, width, fmt):
+    return default_storage.url(rendition_name(source_name, width, fmt))
+
+
+def _render(image, width, fmt):
+    pil_format, _, options = RENDITION_FORMATS[fmt]
+    copy = image.copy()
+    if copy.width > width:
+        copy.thumbnail((width, width * 10), Image.LANCZOS)
+    if pil_format == 'JPEG' and copy.mode not in ('RGB', 'L'):
+        copy = copy.convert('RGB')
+    buffer = BytesIO()
+    copy.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def generate_renditions(source_name, force=False, only=None):
+    """Создаёт недостающие рендишены картинки; возвращает число созданных файлов"""
+    targets = [only] if only else [
+        (width, fmt) for width in RENDITION_WIDTHS for fmt in RENDITION_FORMATS
+    ]
+    if not force:
+        targets = [
+            (width, fmt) for width, fmt in targets
+            if not default_storage.exists(rendition_name(source_name, width, fmt))
+        ]
+    if not targets or not default_storage.exists(source_name):
+        return 0
+
+    with default_storage.open(source_name, 'rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    for width, fmt in targets:
+        name = rendition_name(source_name, width, fmt)
+        if force and default_storage.exists(name):
+            default_storage.delete(name)
+        default_storage.save(name, ContentFile(_render(image, width, fmt)))
+    return len(targets)
+
+
+def _generate_safely(source_name):
+    try:
+        generate_renditions(source_name)
+    except Exception:
+        logger.exception('Не удалось подготовить рендишены для %s', source_name)
+
+
+def schedule_renditions(source_name):
+    """Запускает генерацию в пуле потоков (или сразу, если RENDITION_WORKERS = 0)"""
+    global _executor
+    if not source_name:
+        return
+    workers = getattr(settings, 'RENDITION_WORKERS', 2)
+    if workers <= 0:
+        _generate_safely(source_name)
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='renditions')
+    _executor.submit(_generate_safely, source_name)
@@ -0,0 +1,181 @@
+"""Полнотекстовый поиск по товарам.
+
+Бэкенд выбирается по СУБД подключения:
+
+* PostgreSQL — столбец ``main_furniture.search_vector`` (tsvector,
+  конфигурация ``russian``) с GIN-индексом;
+* SQLite — виртуальная таблица FTS5 ``main_furniture_fts``;
+* остальные — ``icontains`` по названию, только для разработки.
+
+Структуры создаёт миграция ``0004_furniture_search``, а индекс
+обновляется точечно из сигналов ``Furniture`` (см. ``main/signals.py``).
+"""
+import re
+from dataclasses import dataclass
+
+from django.db import connections
+
+from .models import Furniture
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Вес полей: название важнее материала, материал важнее описания
+PG_VECTOR_SQL = (
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(material, '')), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(description, '')), 'C')"
+)
+
+
+def query_terms(query):
+    """Слова запроса без операторов — пользовательский ввод не попадает в синтаксис FTS"""
+    return [word.lower() for word in WORD_RE.findall(query or '')][:10]
+
+
+@dataclass
+class SearchPage:
+    """Страница результатов поиска, отсортированных по релевантности"""
+    object_list: list
+    number: int
+    has_next_page: bool
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.number > 1
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+class BaseSearchBackend:
+    def __init__(self, using='default'):
+        self.using = using
+        self.connection = connections[using]
+
+    def update(self, ids):
+        """Переиндексировать товары с указанными id"""
+        raise NotImplementedError
+
+    def remove(self, ids):
+        raise NotImplementedError
+
+    def ranked_ids(self, terms, limit, offset, active_only=True):
+        """id товаров (по умолчанию только активных) по убыванию релевантности"""
+        raise NotImplementedError
+
+    def search(self, query, page=1, per_page=24):
+        terms = query_terms(query)
+        page = max(int(page), 1)
+        if not terms:
+            return SearchPage(object_list=[], number=page, has_next_page=False)
+
+        ids = self.ranked_ids(terms, per_page + 1, (page - 1) * per_page)
+        has_next = len(ids) > per_page
+        ids = ids[:per_page]
+        products = Furniture.objects.using(self.using).select_related('category').in_bulk(ids)
+        return SearchPage(
+            object_list=[products[pk] for pk in ids if pk in products],
+            number=page,
+            has_next_page=has_next,
+        )
+
+    def _fetch_ids(self, sql, params):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    def update(self, ids):
+        if not ids:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE main_furniture SET search_vector = {PG_VECTOR_SQL} WHERE id = ANY(%s)',
+                [list(ids)],
+            )
+
+    def remove(self, ids):
+        # Вектор хранится в самой строке товара и удаляется вместе с ней
+        pass
+
+    def ranked_ids(self, terms, limit, offset, active_only=True):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return self._fetch_ids(
+            "SELECT f.id FROM main_furniture f, to_tsquery('russian', %s) q "
+            f"WHERE f.search_vector @@ q{' AND f.is_active' if active_only else ''} "
+            "ORDER BY ts_rank(f.search_vector, q) DESC, f.id DESC LIMIT %s OFFSET %s",
+            [tsquery, limit, offset],
+        )
+
+
+class SqliteSearchBackend(BaseSearchBackend):
+    def update(self, ids):
+        if not ids:
+            return
+        placeholders = ', '.join(['%s'] * len(ids))
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM main_furniture_fts WHERE rowid IN ({placeholders})', list(ids))
+            cursor.execute(
+                'INSERT INTO main_furniture_fts (rowid, name, material, description) '
+                f'SELECT id, name, material, description FROM main_furniture WHERE id IN ({placeholders})',
+                list(ids),
+            )
+
+    def remove(self, ids):
+        if not ids:
+            return
+        placeholders = ', '.join(['%s'] * len(ids))
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM main_furniture_fts WHERE rowid IN ({placeholders})', list(ids))
+
+    def ranked_ids(self, terms, limit, offset, active_only=True):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return self._fetch_ids(
+            'SELECT f.id FROM main_furniture_fts s JOIN main_furniture f ON f.id = s.rowid '
+            f"WHERE main_furniture_fts MATCH %s{' AND f.is_active' if active_only else ''} "
+            'ORDER BY bm25(main_furniture_fts, 10.0, 3.0, 1.0), f.id DESC LIMIT %s OFFSET %s',
+            [match, limit, offset],
+        )
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Поиск подстрокой без индекса — запасной вариант для прочих СУБД"""
+
+    def update(self, ids):
+        pass
+
+    def remove(self, ids):
+        pass
+
+    def ranked_ids(self, terms, limit, offset, active_only=True):
+        queryset = Furniture.objects.using(self.using)
+        if active_only:
+            queryset = queryset.filter(is_active=True)
+        for term in terms:
+            queryset = queryset.filter(name__icontains=term)
+        return list(queryset.order_by('-id').values_list('id', flat=True)[offset:offset + limit])
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SqliteSearchBackend,
+}
+
+
+def get_search_backend(using='default'):
+    return BACKENDS.get(connections[using].vendor, SimpleSearchBackend)(using)
@@ -0,0 +1,181 @@
+"""Сессии в кеше с редкой записью в базу (``SESSION_ENGINE = 'main.sessions'``).
+
+Как ``cached_db``, сессия читается из кеша, а база — запасная копия на
+случай вытеснения. Но строка ``django_session`` перезаписывается не при
+каждом изменении, а только когда:
+
+* меняется набор ключей сессии или пользователь (вход, выход, первая
+  покупка гостя, ``set_expiry``) — такое должно пережить потерю кеша;
+* с прошлой записи прошло ``SESSION_DB_WRITE_INTERVAL`` секунд — тогда в
+  базу уходят накопленные изменения значений (количества в корзине гостя,
+  сообщения) и продлевается срок жизни строки.
+
+Запись в кеш живёт не дольше строки в базе, поэтому очистка просроченных
+сессий не удалит строку, пока сессия ещё читается из кеша. При потере
+кеша теряются изменения значений за последний интервал — только они.
+
+Кеш процесса (locmem) не общий для воркеров: с ним интервал выставляется
+в 0, и движок пишет в базу каждое изменение, как ``cached_db``.
+Просроченные сессии удаляются пачками (``manage.py clearsessions``).
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.utils import timezone
+
+from .instrumentation import Span
+
+AUTH_KEYS = (SESSION_KEY, BACKEND_SESSION_KEY, HASH_SESSION_KEY)
+
+CLEAR_BATCH = 1000
+
+
+def _signature(data):
+    """То, при изменении чего сессию нужно сразу записать в базу"""
+    return sorted(data), [data.get(key) for key in AUTH_KEYS]
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = 'main.sessions'
+
+    def __init__(self, session_key=None):
+        # Состояние строки в базе: подпись данных, время записи, срок жизни
+        self._db_state = None
+        super().__init__(session_key)
+
+    def _record(self, data):
+        return {'data': data, 'db': self._db_state}
+
+    def _db_lifetime(self):
+        # Кеш не должен пережить строку в базе
+        return max(0, int(self._db_state['expires'] - time.time()))
+
+    def _from_cache(self, record):
+        self._db_state = record['db']
+        return record['data']
+
+    def _from_db(self, session):
+        data = self.decode(session.session_data)
+        self._db_state = {
+            'signature': _signature(data),
+            'written': time.time(),
+            'expires': session.expire_date.timestamp(),
+        }
+        return data
+
+    def _needs_db_write(self, data, must_create):
+        if must_create or self._db_state is None:
+            return True
+        if _signature(data) != self._db_state['signature']:
+            return True
+        interval = getattr(settings, 'SESSION_DB_WRITE_INTERVAL', 0)
+        return time.time() - self._db_state['written'] >= interval
+
+    def _written(self, data):
+        self._db_state = {
+            'signature': _signature(data),
+            'written': time.time(),
+            'expires': self.get_expiry_date().timestamp(),
+        }
+
+    def load(self):
+        with Span('session'):
+            return self._load_data()
+
+    async def aload(self):
+        with Span('session'):
+            return await self._aload_data()
+
+    def save(self, must_create=False):
+        with Span('session'):
+            return self._write(must_create)
+
+    async def asave(self, must_create=False):
+        with Span('session'):
+            return await self._awrite(must_create)
+
+    def _load_data(self):
+        try:
+            record = self._cache.get(self.cache_key)
+        except Exception:
+            record = None
+        if record is not None:
+            return self._from_cache(record)
+
+        session = self._get_session_from_db()
+        if not session:
+            self._db_state = None
+            return {}
+        data = self._from_db(session)
+        self._cache.set(self.cache_key, self._record(data), self._db_lifetime())
+        return data
+
+    async def _aload_data(self):
+        try:
+            record = await self._cache.aget(await self.acache_key())
+        except Exception:
+            record = None
+        if record is not None:
+            return self._from_cache(record)
+
+        session = await self._aget_session_from_db()
+        if not session:
+            self._db_state = None
+            return {}
+        data = self._from_db(session)
+        await self._cache.aset(await self.acache_key(), self._record(data), self._db_lifetime())
+        return data
+
+    def _write(self, must_create):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        # Записи нет в кеше — сессию могли удалить (выход в соседней вкладке):
+        # идём в базу, чтобы не воскресить её одним кешем
+        if self._needs_db_write(data, must_create) or not self._cache.has_key(self.cache_key):
+            DBStore.save(self, must_create)
+            self._written(data)
+        self._cache.set(self.cache_key, self._record(data), min(self.get_expiry_age(), self._db_lifetime()))
+
+    async def _awrite(self, must_create):
+        if self.session_key is None:
+            return await self.acreate()
+        data = await self._aget_session(no_load=must_create)
+        if self._needs_db_write(data, must_create) or not await self._cache.ahas_key(await self.acache_key()):
+            await DBStore.asave(self, must_create)
+            self._written(data)
+        timeout = min(await self.aget_expiry_age(), self._db_lifetime())
+        await self._cache.aset(await self.acache_key(), self._record(data), timeout)
+
+    @classmethod
+    def clear_expired(cls, batch_size=CLEAR_BATCH):
+        """Удаляет просроченные сессии пачками — без долгой блокировки таблицы"""
+        model = cls.get_model_class()
+        now = timezone.now()
+        while True:
+            keys = list(
+                model.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:batch_size]
+            )
+            if not keys:
+                break
+            model.objects.filter(session_key__in=keys).delete()
+            if len(keys) < batch_size:
+                break
+
+    @classmethod
+    async def aclear_expired(cls, batch_size=CLEAR_BATCH):
+        model = cls.get_model_class()
+        now = timezone.now()
+        while True:
+            keys = [
+                key async for key in
+                model.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:batch_size]
+            ]
+            if not keys:
+                break
+            await model.objects.filter(session_key__in=keys).adelete()
+            if len(keys) < batch_size:
+                break
@@ -1,16 +1,128 @@
 # main/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.db import transaction
 from django.dispatch import receiver
-from django.contrib.auth import get_user_model
-from .models import Cart
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import cache
+from . import catalog_cache
+from .cart import merge_session_cart
+from .context_processors import cart_count_cache_key
+from .renditions import schedule_renditions
+from .search import get_search_backend
+from .models import Cart, CartItem, Category, Furniture, RelatedProduct
+from .related import refresh_product
 
-User = get_user_model()
 
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Корзина гостя из сессии переезжает в корзину пользователя"""
+    session = getattr(request, 'session', None)
+    if session is not None:
+        merge_session_cart(session, user.pk)
 
-@receiver(post_save, sender=User)
-def create_user_cart(sender, instance, created, **kwargs):
-    """Создаём корзину при создании пользователя"""
-    if created:
-        Cart.objects.create(user=instance)
 
+def invalidate_cart_count(cart_id):
+    """Сбрасываем закешированное количество товаров в корзине"""
+    user_id = Cart.objects.filter(pk=cart_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        cache.delete(cart_count_cache_key(user_id))
 
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def cart_item_changed(sender, instance, **kwargs):
+    """Значок корзины пересчитается при следующем запросе"""
+    invalidate_cart_count(instance.cart_id)
+
+
+@receiver(pre_save, sender=Category)
+def remember_category_slug(sender, instance, **kwargs):
+    """Запоминаем прежний slug, чтобы сбросить кеш и по старому адресу"""
+    instance._previous_slug = (
+        Category.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    scopes = {catalog_cache.CATALOG_SCOPE, catalog_cache.category_scope(instance.slug)}
+    previous_slug = getattr(instance, '_previous_slug', None)
+    if previous_slug:
+        scopes.add(catalog_cache.category_scope(previous_slug))
+    catalog_cache.bump(*scopes)
+
+
+@receiver(pre_save, sender=Furniture)
+def remember_furniture_location(sender, instance, **kwargs):
+    """Запоминаем прежние категорию и slug товара"""
+    instance._previous = (
+        Furniture.objects.filter(pk=instance.pk)
+        .values('slug', 'category_id', 'category__slug').first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Furniture)
+@receiver(post_delete, sender=Furniture)
+def furniture_changed(sender, instance, created=False, **kwargs):
+    """Сбрасываем кеш только категории товара, а не всего каталога"""
+    category_slug = Category.objects.filter(pk=instance.category_id).values_list('slug', flat=True).first()
+    scopes = {catalog_cache.category_scope(category_slug)}
+    previous = getattr(instance, '_previous', None)
+    deleted = kwargs.get('signal') is post_delete
+
+    if previous and previous['category__slug'] != category_slug:
+        scopes.add(catalog_cache.category_scope(previous['category__slug']))
+        catalog_cache.forget_product_category(previous['slug'])
+    if created or deleted or (previous and previous['category__slug'] != category_slug):
+        # Меняется число товаров в категориях на общей странице
+        scopes.add(catalog_cache.CATALOG_SCOPE)
+    catalog_cache.forget_product_category(instance.slug)
+    catalog_cache.bump(*scopes)
+
+
+@receiver(post_save, sender=Furniture)
+def reindex_furniture(sender, instance, **kwargs):
+    """Точечно обновляем поисковый индекс товара"""
+    get_search_backend().update([instance.pk])
+
+
+@receiver(post_delete, sender=Furniture)
+def unindex_furniture(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Furniture)
+def prepare_renditions(sender, instance, **kwargs):
+    """Готовим уменьшенные копии фото после коммита, вне запроса"""
+    if instance.image:
+        name = instance.image.name
+        transaction.on_commit(lambda: schedule_renditions(name))
+
+
+@receiver(post_save, sender=Furniture)
+def refresh_related_products(sender, instance, **kwargs):
+    """Пересчитываем похожие товары для товара и затронутых соседей"""
+    previous = getattr(instance, '_previous', None) or {}
+    product_id = instance.pk
+    category_ids = [instance.category_id, previous.get('category_id')]
+    transaction.on_commit(lambda: refresh_product(product_id, category_ids))
+
+
+@receiver(pre_delete, sender=Furniture)
+def remember_related_referrers(sender, instance, **kwargs):
+    instance._related_referrers = list(
+        RelatedProduct.objects.filter(related_id=instance.pk).values_list('product_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Furniture)
+def refill_related_products(sender, instance, **kwargs):
+    """Соседям, у которых был удалённый товар, подбираем замену"""
+    referrers = getattr(instance, '_related_referrers', [])
+    if referrers:
+        product_id, category_id = instance.pk, instance.category_id
+        transaction.on_commit(lambda: refresh_product(product_id, [category_id], referrers))
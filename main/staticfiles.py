@@ -0,0 +1,96 @@
+"""Статика с хешем в имени и заранее сжатыми копиями.
+
+``collectstatic`` через ``CompressedManifestStaticFilesStorage`` пишет
+файлы с хешем содержимого в имени (``site.3f2a9c1b7e4d.css``) и рядом —
+``.gz`` и ``.br`` (см. ``main/compression.py``). Имя меняется вместе с
+содержимым, поэтому такие файлы кешируются навсегда (``immutable``).
+
+В продакшене статику отдаёт nginx (``gzip_static on; brotli_static on;
+expires max;`` для ``/static/``), ``serve_static`` — запасной путь с
+теми же заголовками, если перед Django нет фронтового сервера; он
+подключается только явно, ``SERVE_STATIC=1``.
+"""
+import mimetypes
+import os
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .compression import ENCODINGS, negotiate, precompress
+from .media import CACHE_CONTROL, file_etag
+
+# Файлы без хеша в имени могут измениться — только с перепроверкой
+REVALIDATE_CACHE_CONTROL = 'public, no-cache'
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = {}
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names[hashed_name] = name
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for hashed_name, name in hashed_names.items():
+            for path in precompress(self.path(hashed_name)):
+                yield name, os.path.relpath(path, self.location), True
+
+
+@lru_cache(maxsize=1)
+def _read_hashed_names(manifest_path, mtime_ns):
+    return frozenset(staticfiles_storage.load_manifest()[0].values())
+
+
+def _hashed_names():
+    """Имена с хешем из манифеста; перечитываются, когда collectstatic его обновил"""
+    manifest_storage = getattr(staticfiles_storage, 'manifest_storage', None)
+    if manifest_storage is None:
+        return frozenset()
+    manifest_path = manifest_storage.path(staticfiles_storage.manifest_name)
+    try:
+        mtime_ns = os.stat(manifest_path).st_mtime_ns
+    except FileNotFoundError:
+        return frozenset()
+    return _read_hashed_names(manifest_path, mtime_ns)
+
+
+@require_safe
+def serve_static(request, path):
+    """Файл из STATIC_ROOT, сжатая копия — если клиент её принимает"""
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except (SuspiciousFileOperation, ValueError):
+        raise Http404('Файл не найден')
+    if not os.path.isfile(full_path):
+        raise Http404('Файл не найден')
+
+    encoding = None
+    for candidate in negotiate(request.headers.get('Accept-Encoding', '')):
+        if os.path.isfile(full_path + ENCODINGS[candidate]):
+            encoding, full_path = candidate, full_path + ENCODINGS[candidate]
+            break
+
+    stat = os.stat(full_path)
+    etag = file_etag(stat)
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        response = FileResponse(
+            open(full_path, 'rb'), content_type=content_type, filename=os.path.basename(path)
+        )
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = CACHE_CONTROL if path in _hashed_names() else REVALIDATE_CACHE_CONTROL
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,270 @@
+"""Синтетический каталог для нагрузочных тестов и замеров масштабирования.
+
+``DatasetGenerator`` заполняет базу категориями, товарами, пользователями
+и корзинами с правдоподобными распределениями:
+
+* размеры категорий по закону Ципфа — несколько огромных и длинный хвост;
+* материалы и цвета — десяток частых и сотни редких значений;
+* цены логнормальные, часть товаров со скидкой, без остатка или скрыта;
+* в большинстве корзин до десятка строк, в нескольких процентах — 50 и больше.
+
+Всё пишется ``bulk_create`` пачками. У пользователей общий заранее
+посчитанный хеш пароля ``PASSWORD``: ``make_password`` на каждую строку
+занял бы часы. Картинки — несколько маленьких JPEG, общих для всех
+товаров. Сигналы при bulk-операциях не срабатывают, поэтому, как в
+``main/importer.py``, поисковый индекс обновляется по пачкам, а кеш
+каталога и похожие товары — в конце.
+
+Строки помечаются префиксом (``slug``, артикул, логин), чтобы несколько
+наборов уживались в одной базе и их было видно среди настоящих данных.
+"""
+import random
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from io import BytesIO
+from itertools import accumulate
+
+from PIL import Image, ImageDraw
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from . import catalog_cache, related
+from .models import Cart, CartItem, Category, Furniture
+from .search import get_search_backend
+
+# Пароль всех сгенерированных пользователей
+PASSWORD = 'synthetic-password'
+
+CATEGORY_NAMES = (
+    'Диваны', 'Кровати', 'Столы', 'Стулья', 'Шкафы', 'Комоды', 'Кресла', 'Стеллажи', 'Тумбы', 'Пуфы',
+)
+MATERIALS = (
+    'Дуб', 'Ясень', 'Бук', 'Сосна', 'Орех', 'Берёза', 'МДФ', 'ЛДСП', 'Велюр', 'Рогожка',
+    'Экокожа', 'Кожа', 'Металл', 'Стекло', 'Ротанг',
+)
+COLORS = (
+    'Белый', 'Серый', 'Графит', 'Бежевый', 'Натуральный', 'Чёрный', 'Зелёный', 'Синий',
+    'Терракотовый', 'Горчичный',
+)
+ADJECTIVES = ('Классический', 'Угловой', 'Модульный', 'Складной', 'Компактный', 'Мягкий', 'Лофт', 'Сканди')
+SERIES = ('Oslo', 'Bergen', 'Malmö', 'Turku', 'Aarhus', 'Riga', 'Tallinn', 'Lund', 'Odense', 'Visby')
+
+# Всего значений вместе с редкими «Материал 16», «Цвет 11»…
+MATERIAL_VALUES = 300
+COLOR_VALUES = 150
+# Показатели степени закона Ципфа: чем больше, тем сильнее перекос
+CATEGORY_SKEW = 1.1
+VALUE_SKEW = 1.3
+
+# Цена ~ логнормальная с медианой около 27 000
+PRICE_MU = 10.2
+PRICE_SIGMA = 0.75
+MIN_PRICE = 990
+
+DISCOUNT_SHARE = 0.15
+OUT_OF_STOCK_SHARE = 0.15
+INACTIVE_SHARE = 0.03
+FEATURED_SHARE = 0.02
+
+LARGE_CART_SHARE = 0.05
+LARGE_CART_LINES = (50, 120)
+MAX_SMALL_CART_LINES = 10
+
+IMAGE_COUNT = 8
+IMAGE_SIZE = (96, 64)
+
+
+def zipf_cum_weights(count, skew):
+    """Накопленные веса рангов 1..count для ``random.choices``"""
+    return list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+def long_tail(common, total, label):
+    """Частые значения и хвост редких до ``total`` штук"""
+    return list(common) + [f'{label} {number}' for number in range(len(common) + 1, total + 1)]
+
+
+@dataclass
+class DatasetStats:
+    categories: int = 0
+    products: int = 0
+    users: int = 0
+    carts: int = 0
+    cart_items: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+
+class DatasetGenerator:
+    def __init__(
+        self, categories=20, products=10_000, users=1_000, carts=500, batch_size=5000,
+        prefix='synthetic', seed=0, rebuild_related=True, progress=None,
+    ):
+        if carts > users:
+            raise ValueError('Корзин не может быть больше, чем пользователей: у пользователя одна корзина')
+        if products and not categories:
+            raise ValueError('Товарам нужна хотя бы одна категория')
+        self.counts = {'categories': categories, 'products': products, 'users': users, 'carts': carts}
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.rng = random.Random(seed)
+        self.rebuild_related = rebuild_related
+        self.progress = progress
+        self.stats = DatasetStats()
+        self.images = []
+        self.categories = []
+        self.product_ids = []
+        self.user_ids = []
+
+    def exists(self):
+        return Category.objects.filter(slug__startswith=f'{self.prefix}-').exists()
+
+    def run(self):
+        if self.exists():
+            raise ValueError(f'Набор с префиксом «{self.prefix}» уже есть в базе')
+        self.images = self.make_images()
+        self.create_categories()
+        self.create_products()
+        self.create_users()
+        self.create_carts()
+        self.finish()
+        return self.stats
+
+    def report(self, stage):
+        if self.progress:
+            self.progress(stage, self.stats)
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(self.batch_size, total - start)
+
+    def make_images(self):
+        """Несколько маленьких JPEG: силуэт «мебели» на цветном фоне"""
+        names = []
+        width, height = IMAGE_SIZE
+        for number in range(IMAGE_COUNT):
+            background = tuple(self.rng.randrange(150, 250) for _ in range(3))
+            image = Image.new('RGB', IMAGE_SIZE, background)
+            draw = ImageDraw.Draw(image)
+            shade = tuple(channel - 100 for channel in background)
+            draw.rectangle((width // 6, height // 3, width * 5 // 6, height * 3 // 4), fill=shade)
+            buffer = BytesIO()
+            image.save(buffer, 'JPEG', quality=70)
+            names.append(default_storage.save(f'furniture/{self.prefix}-{number}.jpg', ContentFile(buffer.getvalue())))
+        return names
+
+    def create_categories(self):
+        self.categories = Category.objects.bulk_create([
+            Category(
+                name=f'{CATEGORY_NAMES[number % len(CATEGORY_NAMES)]} · {self.prefix}-{number}',
+                slug=f'{self.prefix}-{number}',
+                description='Синтетическая категория для нагрузочных тестов.',
+                image=self.images[number % len(self.images)],
+            )
+            for number in range(self.counts['categories'])
+        ])
+        self.stats.categories = len(self.categories)
+        self.report('categories')
+
+    def create_products(self):
+        rng = self.rng
+        category_weights = zipf_cum_weights(len(self.categories), CATEGORY_SKEW)
+        materials = long_tail(MATERIALS, MATERIAL_VALUES, 'Материал')
+        material_weights = zipf_cum_weights(len(materials), VALUE_SKEW)
+        colors = long_tail(COLORS, COLOR_VALUES, 'Цвет')
+        color_weights = zipf_cum_weights(len(colors), VALUE_SKEW)
+        backend = get_search_backend()
+
+        for start, size in self.batches(self.counts['products']):
+            picks = zip(
+                range(start, start + size),
+                rng.choices(self.categories, cum_weights=category_weights, k=size),
+                rng.choices(materials, cum_weights=material_weights, k=size),
+                rng.choices(colors, cum_weights=color_weights, k=size),
+            )
+            batch = [self.build_product(*pick) for pick in picks]
+            with transaction.atomic():
+                created = Furniture.objects.bulk_create(batch, batch_size=self.batch_size)
+                backend.update([obj.pk for obj in created])
+            self.product_ids.extend(obj.pk for obj in created)
+            self.stats.products += len(created)
+            self.report('products')
+
+    def build_product(self, number, category, material, color):
+        rng = self.rng
+        price = max(MIN_PRICE, int(round(rng.lognormvariate(PRICE_MU, PRICE_SIGMA), -1)))
+        discounted = rng.random() < DISCOUNT_SHARE
+        in_stock = rng.random() >= OUT_OF_STOCK_SHARE
+        return Furniture(
+            category=category,
+            name=f'{rng.choice(ADJECTIVES)} {rng.choice(SERIES)} {number}',
+            description=f'{material}, цвет «{color}». Доставка и сборка по городу.',
+            sku=f'{self.prefix.upper()}-{number}',
+            slug=f'{self.prefix}-{number}',
+            is_active=rng.random() >= INACTIVE_SHARE,
+            is_featured=rng.random() < FEATURED_SHARE,
+            stock=min(int(rng.expovariate(1 / 8)) + 1, 500) if in_stock else 0,
+            price=Decimal(price),
+            old_price=Decimal(price * 5 // 4) if discounted else None,
+            material=material,
+            color=color,
+            dimensions=f'{rng.randrange(40, 220, 5)}×{rng.randrange(40, 320, 5)}×{rng.randrange(30, 120, 5)} см',
+            weight=f'{rng.randrange(2, 150)} кг',
+            assembly_required=rng.random() < 0.7,
+            image=rng.choice(self.images),
+        )
+
+    def create_users(self):
+        User = get_user_model()
+        password = make_password(PASSWORD)
+        for start, size in self.batches(self.counts['users']):
+            created = User.objects.bulk_create([
+                User(
+                    username=f'{self.prefix}-user-{number}',
+                    email=f'{self.prefix}-user-{number}@example.com',
+                    password=password,
+                )
+                for number in range(start, start + size)
+            ], batch_size=self.batch_size)
+            self.user_ids.extend(user.pk for user in created)
+            self.stats.users += len(created)
+            self.report('users')
+
+    def cart_lines(self, number):
+        # Первая корзина всегда большая — чтобы она была и в маленьком наборе
+        if number == 0 or self.rng.random() < LARGE_CART_SHARE:
+            return self.rng.randint(*LARGE_CART_LINES)
+        return min(int(self.rng.expovariate(0.4)) + 1, MAX_SMALL_CART_LINES)
+
+    def create_carts(self):
+        if not self.product_ids:
+            return
+        rng = self.rng
+        owners = rng.sample(self.user_ids, self.counts['carts'])
+        for start, size in self.batches(len(owners)):
+            carts = Cart.objects.bulk_create(
+                [Cart(user_id=user_id) for user_id in owners[start:start + size]], batch_size=self.batch_size
+            )
+            items = [
+                CartItem(cart_id=cart.pk, product_id=product_id, quantity=rng.choice((1, 1, 1, 2, 3)))
+                for number, cart in enumerate(carts, start)
+                for product_id in rng.sample(self.product_ids, min(self.cart_lines(number), len(self.product_ids)))
+            ]
+            CartItem.objects.bulk_create(items, batch_size=self.batch_size)
+            self.stats.carts += len(carts)
+            self.stats.cart_items += len(items)
+            self.report('carts')
+
+    def finish(self):
+        slugs = [category.slug for category in self.categories]
+        catalog_cache.bump(catalog_cache.CATALOG_SCOPE, *map(catalog_cache.category_scope, slugs))
+        if self.rebuild_related and self.product_ids:
+            related.rebuild([category.pk for category in self.categories])
+            self.report('related')
@@ -0,0 +1,39 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from main.renditions import RENDITION_WIDTHS, rendition_url
+
+register = template.Library()
+
+
+def _srcset(name, fmt, widths):
+    return ', '.join(f'{rendition_url(name, width, fmt)} {width}w' for width in widths)
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes='100vw', max_width=None, css_class='', style='', lazy=True):
+    """<picture> с WebP/JPEG-рендишенами вместо оригинальной фотографии.
+
+    ``max_width`` ограничивает набор ширин: карточке шириной 300px не нужен
+    вариант на 1280px.
+    """
+    if not image:
+        return ''
+    widths = [w for w in RENDITION_WIDTHS if max_width is None or w <= int(max_width)] or [RENDITION_WIDTHS[0]]
+    attrs = [
+        ('src', rendition_url(image.name, widths[-1], 'jpg')),
+        ('srcset', _srcset(image.name, 'jpg', widths)),
+        ('sizes', sizes),
+        ('alt', alt),
+        ('class', css_class),
+        ('style', style),
+        ('decoding', 'async'),
+    ]
+    if lazy:
+        attrs.append(('loading', 'lazy'))
+    return format_html(
+        '<picture style="display: contents"><source type="image/webp" srcset="{}" sizes="{}"><img {}></picture>',
+        _srcset(image.name, 'webp', widths),
+        sizes,
+        format_html_join(' ', '{}="{}"', [(key, value) for key, value in attrs if value]),
+    )
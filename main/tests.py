@@ -1,3 +1,1544 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import quote, unquote
 
-# Create your tests here.
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.base import UpdateError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import OperationalError, connection, connections
+from django.db.models import Count
+from django.http import HttpResponse
+from django.core.cache import cache, caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.test import (
+    Client, LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, reverse
+from django.utils import timezone
+from django.utils.asyncio import async_unsafe
+
+from main import cart as cart_ops
+from main import catalog_cache, db_router, instrumentation, inventory, perf
+from main.context_processors import cart_badge
+from main.importer import CatalogImporter, read_rows
+from main.renditions import generate_renditions, rendition_name
+from main.search import get_search_backend
+from main.staticfiles import _hashed_names
+from main.sessions import SessionStore
+from main.synthetic import PASSWORD as SYNTHETIC_PASSWORD
+from main.models import Cart, CartItem, Category, Furniture, RelatedProduct, StockBucket, StockReservation
+from main import related
+from main.related import rebuild
+
+User = get_user_model()
+
+
+def make_category(name='Диваны', slug='sofas'):
+    return Category.objects.create(name=name, slug=slug, image='category/test.jpg')
+
+
+def make_product(category, name, slug, price='1000.00', **kwargs):
+    kwargs.setdefault('image', 'furniture/test.jpg')
+    return Furniture.objects.create(
+        category=category, name=name, slug=slug, sku=f'SKU-{slug}',
+        description='Описание', price=Decimal(price), **kwargs
+    )
+
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pass12345')
+        self.cart = Cart.objects.create(user=self.user)
+        category = make_category()
+        for i in range(10):
+            product = make_product(category, f'Диван {i}', f'sofa-{i}', price='100.50')
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+
+    def test_summary_totals(self):
+        summary = self.cart.summary()
+        self.assertEqual(summary.item_count, 10)
+        self.assertEqual(summary.total, Decimal('2010.00'))
+        self.assertEqual(self.cart.total_price(), Decimal('2010.00'))
+        self.assertEqual(summary.items[0].line_total, Decimal('201.00'))
+
+    def test_summary_is_single_query(self):
+        with self.assertNumQueries(1):
+            summary = self.cart.summary()
+            for item in summary.items:
+                item.product.category.name
+
+    def test_empty_cart(self):
+        self.cart.items.all().delete()
+        summary = self.cart.summary()
+        self.assertEqual(summary.item_count, 0)
+        self.assertEqual(summary.total, Decimal('0'))
+
+    def test_cart_view_query_count_does_not_grow_with_items(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('main:cart'))
+        self.assertContains(response, 'Диван 9')
+
+        category = Category.objects.get()
+        for i in range(10, 50):
+            product = make_product(category, f'Диван {i}', f'sofa-{i}')
+            CartItem.objects.create(cart=self.cart, product=product)
+
+        with self.assertNumQueries(len(ctx.captured_queries)):
+            response = self.client.get(reverse('main:cart'))
+        self.assertEqual(len(response.context['items']), 50)
+
+
+class CartBadgeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('buyer', password='pass12345')
+        self.cart = Cart.objects.create(user=self.user)
+        self.product = make_product(make_category(), 'Кресло', 'chair')
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def test_cache_hit_costs_no_queries(self):
+        self.assertEqual(cart_badge(self.request), {'cart_item_count': 0})
+        with self.assertNumQueries(0):
+            self.assertEqual(cart_badge(self.request), {'cart_item_count': 0})
+
+    def test_invalidated_by_item_save_and_delete(self):
+        cart_badge(self.request)
+        item = CartItem.objects.create(cart=self.cart, product=self.product)
+        self.assertEqual(cart_badge(self.request)['cart_item_count'], 1)
+        item.delete()
+        self.assertEqual(cart_badge(self.request)['cart_item_count'], 0)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sofas = make_category()
+        self.beds = make_category('Кровати', 'beds')
+        self.sofa = make_product(self.sofas, 'Диван Oslo', 'oslo')
+        self.bed = make_product(self.beds, 'Кровать Nord', 'nord')
+
+    def test_page_served_from_cache_without_queries(self):
+        url = reverse('main:furniture', args=['sofas'])
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, 'Диван Oslo')
+
+    def test_edit_invalidates_only_its_category(self):
+        sofas_url = reverse('main:furniture', args=['sofas'])
+        beds_url = reverse('main:furniture', args=['beds'])
+        self.client.get(sofas_url)
+        self.client.get(beds_url)
+
+        self.sofa.name = 'Диван Bergen'
+        self.sofa.save()
+
+        self.assertContains(self.client.get(sofas_url), 'Диван Bergen')
+        with self.assertNumQueries(0):
+            self.client.get(beds_url)
+
+    def test_detail_page_follows_category_version(self):
+        url = reverse('main:furniture_detail', args=['oslo'])
+        self.client.get(url)
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product(self.sofas, 'Диван Malmo', 'malmo')
+        self.assertContains(self.client.get(url), 'Диван Malmo')
+
+    def test_authenticated_users_bypass_page_cache(self):
+        user = User.objects.create_user('buyer', password='pass12345')
+        self.client.force_login(user)
+        url = reverse('main:furniture_detail', args=['oslo'])
+        self.client.get(url)
+        self.assertContains(self.client.get(url), 'buyer')
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': tempfile.mkdtemp(prefix='catalog-cache-'),
+}})
+class FileCatalogCacheTests(CatalogCacheTests):
+    pass
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = make_category()
+        for i in range(60):
+            make_product(self.category, f'Диван {i}', f'sofa-{i}')
+        # Половина товаров с одинаковым created_at — порядок держится на id
+        Furniture.objects.filter(id__lte=Furniture.objects.order_by('id')[30].id).update(
+            created_at=Furniture.objects.order_by('id').first().created_at
+        )
+        self.url = reverse('main:furniture', args=['sofas'])
+        self.expected = list(
+            Furniture.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+
+    def page_ids(self, response):
+        return [product.id for product in response.context['fur']]
+
+    def test_walk_forward_and_back(self):
+        seen, pages, cursor = [], [], None
+        while True:
+            response = self.client.get(self.url, {'cursor': cursor} if cursor else {})
+            pages.append(response)
+            seen.extend(self.page_ids(response))
+            page = response.context['page_obj']
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(pages), 3)
+
+        back = self.client.get(self.url, {'cursor': pages[-1].context['page_obj'].previous_cursor})
+        self.assertEqual(self.page_ids(back), self.page_ids(pages[1]))
+
+    def test_category_resolved_with_products(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['category'], self.category)
+        standalone = [q for q in ctx.captured_queries if q['sql'].split(' FROM ')[1].startswith('"main_category"')]
+        self.assertEqual(standalone, [])
+
+    def test_bad_cursor_is_404(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'garbage'}).status_code, 404)
+
+    def test_empty_category_still_renders(self):
+        make_category('Шкафы', 'wardrobes')
+        response = self.client.get(reverse('main:furniture', args=['wardrobes']))
+        self.assertContains(response, 'Шкафы')
+        self.assertEqual(self.client.get(reverse('main:furniture', args=['nope'])).status_code, 404)
+
+
+class CatalogIndexPlanTests(TestCase):
+    """Планы горячих запросов каталога должны идти по индексам из 0003"""
+
+    def setUp(self):
+        self.category = make_category()
+        for i in range(30):
+            make_product(self.category, f'Диван {i}', f'sofa-{i}', is_featured=i % 3 == 0, stock=i % 2)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_category_page(self):
+        queryset = Furniture.objects.filter(
+            category__slug='sofas', is_active=True
+        ).order_by('-created_at', '-id')[:25]
+        self.assertUsesIndex(queryset, 'furniture_active_cat_idx')
+
+    def test_related_products(self):
+        queryset = Furniture.objects.filter(
+            category=self.category, is_active=True
+        ).exclude(id=1)[:4]
+        self.assertUsesIndex(queryset, 'furniture_active_cat_idx')
+
+    def test_featured_in_stock(self):
+        queryset = Furniture.objects.filter(is_active=True, is_featured=True, stock__gt=0)[:8]
+        self.assertUsesIndex(queryset, 'furniture_featured_idx')
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        category = make_category()
+        self.leather = make_product(category, 'Диван Честерфилд', 'chesterfield', material='Натуральная кожа')
+        self.oak = make_product(category, 'Стол обеденный', 'oak-table', material='Массив дуба')
+        self.hidden = make_product(category, 'Диван архивный', 'archived', is_active=False)
+
+    def search(self, query, **kwargs):
+        return get_search_backend().search(query, **kwargs).object_list
+
+    def test_matches_name_material_and_prefix(self):
+        self.assertEqual(self.search('честерф'), [self.leather])
+        self.assertEqual(self.search('дуба'), [self.oak])
+        self.assertEqual(self.search('диван кожа'), [self.leather])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.oak.name = 'Стол журнальный'
+        self.oak.save()
+        self.assertEqual(self.search('журнальный'), [self.oak])
+        self.oak.delete()
+        self.assertEqual(self.search('журнальный'), [])
+
+    def test_inactive_and_operator_input_ignored(self):
+        self.assertEqual(self.search('архивный'), [])
+        self.assertEqual(self.search('"диван*" ('), [self.leather])
+
+    def test_search_view_paginates(self):
+        category = Category.objects.get()
+        for i in range(30):
+            make_product(category, f'Кресло {i}', f'armchair-{i}')
+        response = self.client.get(reverse('main:search'), {'q': 'кресло'})
+        self.assertEqual(len(response.context['results']), 24)
+        self.assertTrue(response.context['page_obj'].has_next())
+        response = self.client.get(reverse('main:search'), {'q': 'кресло', 'page': 2})
+        self.assertEqual(len(response.context['results']), 6)
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = make_category()
+        make_product(self.category, 'Диван 1', 'd1', price='100', material='Кожа', color='Чёрный', stock=1)
+        make_product(self.category, 'Диван 2', 'd2', price='200', material='Кожа', color='Белый', stock=0)
+        make_product(self.category, 'Диван 3', 'd3', price='300', material='Велюр', color='Чёрный', stock=5,
+                     assembly_required=False)
+        self.url = reverse('main:furniture', args=['sofas'])
+
+    def facet(self, response, name):
+        facet = next(f for f in response.context['facets'] if f['name'] == name)
+        return {option['label']: option['count'] for option in facet['values']}
+
+    def test_counts_respect_other_facets_only(self):
+        response = self.client.get(self.url, {'material': 'Кожа'})
+        self.assertEqual(len(response.context['fur']), 2)
+        self.assertEqual(self.facet(response, 'material'), {'Кожа': 2, 'Велюр': 1})
+        self.assertEqual(self.facet(response, 'color'), {'Чёрный': 1, 'Белый': 1})
+        self.assertEqual(self.facet(response, 'in_stock'), {'В наличии': 1})
+
+    def test_stock_and_price_filters(self):
+        response = self.client.get(self.url, {'in_stock': '1', 'max_price': '250'})
+        self.assertEqual([p.slug for p in response.context['fur']], ['d1'])
+        self.assertEqual(self.facet(response, 'assembly_required'), {'Требуется сборка': 1})
+
+    def test_non_finite_prices_ignored(self):
+        for value in ('NaN', 'sNaN', 'Infinity', '-Infinity', '-5', 'abc'):
+            response = self.client.get(self.url, {'min_price': value, 'max_price': value})
+            self.assertEqual(response.status_code, 200, value)
+            self.assertEqual(len(response.context['fur']), 3)
+
+    def test_facet_counts_are_one_cached_query(self):
+        # валидаторы страницы + товары страницы + одна группировка для всех фасетов
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {'color': 'Чёрный'})
+        with self.assertNumQueries(1):
+            self.client.get(self.url, {'color': 'Белый'})
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='media-'), RENDITION_WORKERS=0)
+class RenditionTests(TestCase):
+    def setUp(self):
+        buffer = BytesIO()
+        Image.new('RGB', (1600, 1000), 'brown').save(buffer, 'JPEG')
+        self.name = default_storage.save('furniture/sofa.jpg', ContentFile(buffer.getvalue()))
+        cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def test_generates_all_widths_and_formats(self):
+        self.assertEqual(generate_renditions(self.name), 8)
+        self.assertEqual(generate_renditions(self.name), 0)
+        with default_storage.open(rendition_name(self.name, 640, 'webp')) as f:
+            self.assertEqual(Image.open(f).size, (640, 400))
+
+    def test_missing_rendition_generated_on_demand(self):
+        response = self.client.get(reverse('rendition', args=[f'{self.name}/320.webp']))
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertTrue(default_storage.exists(rendition_name(self.name, 320, 'webp')))
+        self.assertEqual(self.client.get(reverse('rendition', args=['../secret/320.webp'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('rendition', args=[f'{self.name}/333.webp'])).status_code, 404)
+
+    def test_rendition_of_non_image_is_404(self):
+        name = default_storage.save('furniture/manual.pdf', ContentFile(b'%PDF-1.4 not an image'))
+        self.assertEqual(self.client.get(reverse('rendition', args=[f'{name}/320.webp'])).status_code, 404)
+        self.assertFalse(default_storage.exists(rendition_name(name, 320, 'webp')))
+
+    def test_template_tag_emits_srcset(self):
+        product = make_product(make_category(), 'Диван', 'sofa', image=self.name)
+        html = self.client.get(reverse('main:furniture', args=['sofas'])).content.decode()
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(f'renditions/{product.image.name}/960.webp 960w', html)
+        self.assertNotIn('1280w', html)
+        self.assertIn('loading="lazy"', html)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='media-'))
+class MediaServingTests(TestCase):
+    def setUp(self):
+        self.name = default_storage.save('furniture/manual.pdf', ContentFile(bytes(range(256)) * 4))
+        self.url = reverse('media', args=[self.name])
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def test_full_file_with_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(256)) * 4)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        not_modified = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=10-19'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=-4'})
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(252, 256)))
+        self.assertEqual(self.client.get(self.url, headers={'Range': 'bytes=5000-'}).status_code, 416)
+
+        stale = self.client.get(self.url, headers={'Range': 'bytes=0-9', 'If-Range': '"old"'})
+        self.assertEqual(stale.status_code, 200)
+
+    def test_path_traversal_rejected(self):
+        for path in ('../settings.py', '/etc/passwd', 'furniture/../../x'):
+            self.assertEqual(self.client.get(reverse('media', args=[path])).status_code, 404)
+
+    def test_offload_headers(self):
+        with self.settings(MEDIA_SERVE_MODE='x-accel'):
+            response = self.client.get(self.url)
+            self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.name}')
+            self.assertEqual(response.content, b'')
+        with self.settings(MEDIA_SERVE_MODE='x-sendfile'):
+            response = self.client.get(self.url)
+            self.assertEqual(response['X-Sendfile'], os.path.join(settings.MEDIA_ROOT, self.name))
+
+
+    def test_offload_headers_percent_encode_non_ascii_names(self):
+        name = default_storage.save('furniture/диван угловой.jpg', ContentFile(b'x' * 10))
+        url = reverse('media', args=[name])
+        with self.settings(MEDIA_SERVE_MODE='x-accel'):
+            response = self.client.get(url)
+            self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{quote(name)}')
+            self.assertTrue(response['X-Accel-Redirect'].isascii())
+        with self.settings(MEDIA_SERVE_MODE='x-sendfile'):
+            response = self.client.get(url)
+            self.assertEqual(unquote(response['X-Sendfile']), os.path.join(settings.MEDIA_ROOT, name))
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = make_category()
+        self.sofa = make_product(self.category, 'Диван Oslo', 'oslo')
+        self.other = make_product(self.category, 'Диван Bergen', 'bergen')
+
+    def assertRevalidates(self, url):
+        first = self.client.get(url)
+        etag = first['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(
+            self.client.get(url, headers={'If-Modified-Since': first['Last-Modified']}).status_code, 304
+        )
+        return etag
+
+    def test_list_and_detail_answer_304(self):
+        for url in (reverse('main:furniture', args=['sofas']), reverse('main:furniture_detail', args=['oslo'])):
+            with self.subTest(url=url):
+                etag = self.assertRevalidates(url)
+                self.other.price = Decimal('1.00')
+                self.other.save()
+                response = self.client.get(url, headers={'If-None-Match': etag})
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_deletion_changes_etag(self):
+        url = reverse('main:furniture', args=['sofas'])
+        etag = self.client.get(url)['ETag']
+        self.other.delete()
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_revalidation_of_cached_page_skips_database(self):
+        url = reverse('main:furniture', args=['sofas'])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+    def test_etag_is_per_user(self):
+        url = reverse('main:furniture_detail', args=['oslo'])
+        anonymous = self.client.get(url)['ETag']
+        self.client.force_login(User.objects.create_user('buyer', password='pass12345'))
+        response = self.client.get(url, headers={'If-None-Match': anonymous})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+
+class RelatedProductsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = make_category()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.oak = make_product(self.category, 'Стол дубовый', 'oak', price='1000', material='Дуб', color='Бежевый')
+            self.oak2 = make_product(self.category, 'Стул дубовый', 'oak2', price='1100', material='Дуб', color='Серый')
+            self.pine = make_product(self.category, 'Стол сосновый', 'pine', price='900', material='Сосна', color='Бежевый')
+            self.glass = make_product(self.category, 'Стол стеклянный', 'glass', price='9000', material='Стекло')
+
+    def related(self, product):
+        return list(RelatedProduct.objects.filter(product=product).values_list('related_id', flat=True))
+
+    def test_ranked_by_material_color_and_price(self):
+        self.assertEqual(self.related(self.oak), [self.oak2.id, self.pine.id, self.glass.id])
+
+    def test_incremental_updates_match_full_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.glass.material = 'Дуб'
+            self.glass.save()
+            self.pine.is_active = False
+            self.pine.save()
+            self.oak2.delete()
+        incremental = list(RelatedProduct.objects.values_list('product_id', 'related_id', 'position'))
+        self.assertNotIn(self.pine.id, self.related(self.oak))
+        rebuild()
+        self.assertEqual(list(RelatedProduct.objects.values_list('product_id', 'related_id', 'position')), incremental)
+
+    def test_full_rebuild_visits_each_category_once(self):
+        make_product(make_category('Стулья', 'chairs'), 'Стул', 'chair')
+        passes = []
+        total = rebuild(progress=lambda category_id, total: passes.append(category_id))
+        self.assertEqual(sorted(passes), sorted(Category.objects.values_list('pk', flat=True)))
+        self.assertEqual(total, Furniture.objects.count())
+
+    def test_price_windows_find_same_top_as_full_scan(self):
+        rng = random.Random(1)
+        rows = [
+            {
+                'id': pk, 'category_id': 1, 'is_active': rng.random() > 0.05,
+                'material': rng.choice(['Дуб', 'Дуб', 'Дуб', 'Сосна', 'Орех', '']),
+                'color': rng.choice(['Белый', 'Белый', 'Серый', 'Чёрный', '']),
+                'price': Decimal(pk * 37 % 1000 + 100),
+            }
+            for pk in range(1, 600)
+        ]
+        groups = related._price_groups(rows)
+        for row in rows:
+            self.assertEqual(
+                related.top_related(row, related._candidates(row, groups)), related.top_related(row, rows)
+            )
+
+    def test_detail_reads_related_in_one_query(self):
+        self.client.get(reverse('main:furniture_detail', args=['oak']))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('main:furniture_detail', args=['oak']), headers={'Cookie': ''})
+        self.assertEqual([p.id for p in response.context['related_products']],
+                         [self.oak2.id, self.pine.id, self.glass.id])
+        self.assertEqual(sum('main_relatedproduct' in q['sql'] for q in ctx.captured_queries), 1)
+
+
+class CatalogImportTests(TestCase):
+    CSV = (
+        'sku,name,category,price,stock,material\n'
+        'A-1,Corner sofa,sofas,"45 000,00",3,Велюр\n'
+        ',Corner sofa,Диваны,39000,0,Рогожка\n'
+        ',Corner sofa,sofas,41000,1,\n'
+        'A-2,Без цены,sofas,,1,\n'
+        'A-3,Кресло,chairs,9000,1,\n'
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.category = make_category()
+        make_product(self.category, 'Corner sofa', 'corner-sofa')
+
+    def run_import(self, text, fmt='csv', **kwargs):
+        return CatalogImporter(batch_size=2, **kwargs).run(read_rows(StringIO(text), fmt))
+
+    def test_csv_rows_created_with_unique_slugs_and_skus(self):
+        stats = self.run_import(self.CSV)
+        self.assertEqual((stats.created, stats.updated, stats.skipped), (3, 0, 2))
+        self.assertEqual(len(stats.errors), 2)
+        imported = Furniture.objects.exclude(slug='corner-sofa').order_by('id')
+        self.assertEqual([p.slug for p in imported], ['corner-sofa-2', 'corner-sofa-3', 'corner-sofa-4'])
+        self.assertEqual(Furniture.objects.get(sku='A-1').price, Decimal('45000.00'))
+        generated = imported.exclude(sku='A-1')
+        self.assertEqual([p.sku for p in generated], [f'FUR{p.id:06d}' for p in generated])
+        self.assertEqual(len(get_search_backend().search('рогожка')), 1)
+
+    def test_jsonl_upserts_by_sku_without_touching_slug_or_image(self):
+        self.run_import('{"sku": "SKU-corner-sofa", "name": "Диван", "category": "sofas", "price": 500}\n', 'jsonl')
+        product = Furniture.objects.get()
+        self.assertEqual((product.slug, product.name, product.price), ('corner-sofa', 'Диван', Decimal('500')))
+        self.assertEqual(product.image.name, 'furniture/test.jpg')
+
+    def test_partial_row_keeps_columns_it_does_not_mention(self):
+        Furniture.objects.filter(slug='corner-sofa').update(
+            is_active=False, is_featured=True, assembly_required=False, warranty='10 лет', stock=7, color='Серый',
+        )
+        self.run_import('sku,name,category,price,color,is_featured\nSKU-corner-sofa,Диван,sofas,500,,0\n')
+        product = Furniture.objects.get()
+        self.assertEqual((product.name, product.price, product.is_featured), ('Диван', Decimal('500'), False))
+        self.assertEqual(
+            (product.is_active, product.assembly_required, product.warranty, product.stock, product.color),
+            (False, False, '10 лет', 7, 'Серый'),
+        )
+        self.assertEqual(product.image.name, 'furniture/test.jpg')
+
+    def test_bad_rows_skipped_without_aborting_import(self):
+        stats = self.run_import(
+            '{"sku": "B-1", "name": "Стол", "category": "sofas", "price": 100}\n'
+            '{"sku": "B-2", "name": "Стул", "category": "sofas", "price": "NaN"}\n'
+            '{"sku": "B-3", "name": "Пуф", "category": "sofas", "price": 50, "stock": "Infinity"}\n'
+            '{"sku": "B-4", "name": \n'
+            '["B-5", "Полка"]\n'
+            '{"sku": "B-6", "name": "Тумба", "category": "sofas", "price": 70}\n',
+            'jsonl',
+        )
+        self.assertEqual((stats.created, stats.skipped), (2, 4))
+        self.assertEqual([error.split(':')[0] for error in stats.errors], [f'строка {n}' for n in (2, 3, 4, 5)])
+        imported = Furniture.objects.filter(sku__startswith='B-').values_list('sku', flat=True)
+        self.assertEqual(set(imported), {'B-1', 'B-6'})
+
+    def test_repeated_sku_in_batch_counted_as_skipped(self):
+        stats = self.run_import('sku,name,category,price\nC-1,Стол,sofas,100\nC-1,Стол большой,sofas,200\n')
+        self.assertEqual((stats.created, stats.skipped), (1, 1))
+        self.assertIn('строка 1: артикул C-1 повторяется в строке 2', stats.errors)
+        self.assertEqual(Furniture.objects.get(sku='C-1').price, Decimal('200'))
+
+    def test_unknown_categories_created_on_request(self):
+        stats = self.run_import(self.CSV, create_categories=True)
+        self.assertEqual(stats.created, 4)
+        self.assertTrue(Category.objects.filter(slug='chairs').exists())
+
+    def test_model_save_assigns_distinct_skus(self):
+        first = Furniture.objects.create(category=self.category, name='A', slug='a', price=1, image='x.jpg')
+        second = Furniture.objects.create(category=self.category, name='B', slug='b', price=1, image='x.jpg')
+        self.assertEqual(Furniture.objects.get(pk=second.pk).sku, f'FUR{second.id:06d}')
+        self.assertNotEqual(first.sku, second.sku)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(self.admin)
+        self.sofas = make_category()
+        self.tables = make_category('Столы', 'tables')
+
+    def add_products(self, count):
+        start = Furniture.objects.count()
+        for index in range(start, start + count):
+            make_product(self.sofas if index % 2 else self.tables, f'Диван {index}', f'sofa-{index}')
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for name in ('main_furniture_changelist', 'main_category_changelist'):
+            url = reverse(f'admin:{name}')
+            self.add_products(2)
+            few = self.queries(url)
+            self.add_products(10)
+            self.assertEqual(self.queries(url), few, name)
+
+    def test_category_counts_annotated(self):
+        self.add_products(3)
+        response = self.client.get(reverse('admin:main_category_changelist'))
+        counts = {category.slug: category.product_count for category in response.context['cl'].result_list}
+        self.assertEqual(counts, {'sofas': 1, 'tables': 2})
+
+    def test_search_uses_index_and_sku_prefix(self):
+        make_product(self.sofas, 'Кресло велюровое', 'chair', material='Велюр', is_active=False)
+        make_product(self.sofas, 'Стол', 'table')
+        url = reverse('admin:main_furniture_changelist')
+        for query, expected in (('велюр', ['chair']), ('SKU-table', ['table']), ('sku-tab', ['table'])):
+            response = self.client.get(url, {'q': query})
+            self.assertEqual([p.slug for p in response.context['cl'].result_list], expected)
+
+
+class CartMutationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('buyer', password='pass12345')
+        Cart.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        self.product = make_product(make_category(), 'Кресло', 'chair')
+
+    def quantity(self):
+        return CartItem.objects.filter(cart__user=self.user).values_list('quantity', flat=True).first()
+
+    def test_add_is_single_upsert(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(cart_ops.add_item(self.user.pk, self.product.pk), 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(cart_ops.add_item(self.user.pk, self.product.pk, 2), 3)
+
+    def test_inactive_product_and_missing_cart(self):
+        Furniture.objects.filter(pk=self.product.pk).update(is_active=False)
+        self.assertIsNone(cart_ops.add_item(self.user.pk, self.product.pk))
+        Furniture.objects.filter(pk=self.product.pk).update(is_active=True)
+        Cart.objects.filter(user=self.user).delete()
+        self.assertEqual(cart_ops.add_item(self.user.pk, self.product.pk), 1)
+
+    def test_views_invalidate_badge(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        self.assertEqual(cart_badge(request)['cart_item_count'], 0)
+        self.client.post(reverse('main:add_to_cart', args=[self.product.pk]))
+        self.assertEqual(cart_badge(request)['cart_item_count'], 1)
+
+        item = CartItem.objects.get(cart__user=self.user)
+        self.client.post(reverse('main:update_cart', args=[item.pk]), {'quantity': 5})
+        self.assertEqual(self.quantity(), 5)
+        remove_url = reverse('main:remove_from_cart', args=[item.pk])
+        self.assertEqual(self.client.get(remove_url).status_code, 405)
+        self.assertEqual(self.quantity(), 5)
+        self.client.post(remove_url)
+        self.assertIsNone(self.quantity())
+        self.assertEqual(cart_badge(request)['cart_item_count'], 0)
+
+    def test_other_users_items_untouched(self):
+        other = User.objects.create_user('other', password='pass12345')
+        cart_ops.add_item(other.pk, self.product.pk)
+        item = CartItem.objects.get(cart__user=other)
+        response = self.client.post(reverse('main:update_cart', args=[item.pk]), {'quantity': 0})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(cart_ops.remove_item(self.user.pk, item.pk))
+        self.assertTrue(CartItem.objects.filter(pk=item.pk).exists())
+
+
+def retry_locked(func, *args):
+    """Тестовая SQLite в памяти не ждёт блокировку, а сразу отвечает
+    «table is locked» — повторяем, как повторил бы busy_timeout"""
+    while True:
+        try:
+            return func(*args)
+        except OperationalError as exc:
+            if 'locked' not in str(exc):
+                raise
+
+
+def run_in_threads(count, target):
+    """Запускает target в count потоках одновременно; возвращает исключения"""
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def run():
+        try:
+            barrier.wait()
+            target()
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+class CartConcurrencyTests(TransactionTestCase):
+    THREADS = 8
+    CLICKS = 10
+
+    def test_parallel_adds_are_not_lost(self):
+        user = User.objects.create_user('buyer', password='pass12345')
+        product = make_product(make_category(), 'Кресло', 'chair')
+        def click():
+            for _ in range(self.CLICKS):
+                retry_locked(cart_ops.add_item, user.pk, product.pk)
+
+        self.assertEqual(run_in_threads(self.THREADS, click), [])
+        self.assertEqual(CartItem.objects.get(cart__user=user).quantity, self.THREADS * self.CLICKS)
+
+
+class InventoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = make_product(make_category(), 'Кресло', 'chair', stock=3)
+
+    def stock(self):
+        return Furniture.objects.values_list('stock', flat=True).get(pk=self.product.pk)
+
+    def test_reserve_never_goes_negative(self):
+        first = inventory.reserve(self.product.pk, 2)
+        self.assertIsNotNone(first)
+        self.assertIsNone(inventory.reserve(self.product.pk, 2))
+        self.assertEqual(self.stock(), 1)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_release_and_confirm(self):
+        held = inventory.reserve(self.product.pk)
+        sold = inventory.reserve(self.product.pk)
+        self.assertTrue(inventory.release(held.pk))
+        self.assertFalse(inventory.release(held.pk))
+        self.assertTrue(inventory.confirm(sold.pk))
+        self.assertFalse(inventory.release(sold.pk))
+        self.assertEqual(self.stock(), 2)
+
+    def test_sweeper_releases_only_expired(self):
+        for _ in range(3):
+            inventory.reserve(self.product.pk, ttl=timedelta(seconds=-1))
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(inventory.sweep_expired(batch_size=2), 3)
+        kept = inventory.reserve(self.product.pk)
+        self.assertEqual(inventory.sweep_expired(), 0)
+        self.assertTrue(StockReservation.objects.filter(pk=kept.pk).exists())
+        self.assertEqual(self.stock(), 2)
+
+    def test_sold_out_bumps_category_cache(self):
+        scope = catalog_cache.category_scope('sofas')
+        before = catalog_cache.get_versions(scope)
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.reserve(self.product.pk, 2)
+        self.assertEqual(catalog_cache.get_versions(scope), before)
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.reserve(self.product.pk)
+        self.assertNotEqual(catalog_cache.get_versions(scope), before)
+
+
+
+class SplitStockTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = make_product(make_category(), 'Кресло', 'chair', stock=10)
+        inventory.split_stock(self.product.pk, 4)
+
+    def stock(self):
+        return Furniture.objects.values_list('stock', flat=True).get(pk=self.product.pk)
+
+    def buckets(self):
+        return list(StockBucket.objects.filter(product=self.product).values_list('stock', flat=True))
+
+    def test_reserve_leaves_product_row_alone(self):
+        self.assertEqual(self.buckets(), [3, 3, 2, 2])
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertIsNotNone(inventory.reserve(self.product.pk))
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertTrue(updates)
+        self.assertFalse(any('main_furniture' in sql for sql in updates))
+        self.assertEqual(sum(self.buckets()), 9)
+        self.assertEqual(self.stock(), 10)
+        self.assertEqual(inventory.sync_split_stock(), 1)
+        self.assertEqual(self.stock(), 9)
+        self.assertEqual(inventory.sync_split_stock(), 0)
+
+    def test_quantity_spread_over_buckets(self):
+        self.assertIsNone(inventory.reserve(self.product.pk, 11))
+        held = inventory.reserve(self.product.pk, 7)
+        self.assertIsNotNone(held)
+        self.assertEqual(sum(self.buckets()), 3)
+        self.assertTrue(inventory.release(held.pk))
+        self.assertEqual(sum(self.buckets()), 10)
+
+    def test_sold_out_and_restock_update_availability(self):
+        scope = catalog_cache.category_scope('sofas')
+        before = catalog_cache.get_versions(scope)
+        with self.captureOnCommitCallbacks(execute=True):
+            held = inventory.reserve(self.product.pk, 10)
+        self.assertEqual(self.stock(), 0)
+        sold_out = catalog_cache.get_versions(scope)
+        self.assertNotEqual(sold_out, before)
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.release(held.pk)
+        self.assertEqual(self.stock(), 10)
+        self.assertNotEqual(catalog_cache.get_versions(scope), sold_out)
+
+    def test_admin_and_import_edits_rebalance_buckets(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pass'))
+        response = self.client.post(reverse('admin:main_furniture_changelist'), {
+            'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '1', 'form-0-id': self.product.pk,
+            'form-0-price': '1000.00', 'form-0-stock': '21', 'form-0-is_active': 'on', '_save': 'Сохранить',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.buckets(), [6, 5, 5, 5])
+
+        CatalogImporter().run(read_rows(StringIO('sku,name,category,price,stock\nSKU-chair,Кресло,sofas,1000,8\n'), 'csv'))
+        self.assertEqual(self.buckets(), [2, 2, 2, 2])
+        self.assertEqual(inventory.sync_split_stock(), 0)
+        self.assertEqual(self.stock(), 8)
+
+    def test_merge_returns_stock_to_product_row(self):
+        inventory.reserve(self.product.pk, 3)
+        self.assertEqual(inventory.merge_stock(self.product.pk), 7)
+        self.assertFalse(StockBucket.objects.exists())
+        self.assertEqual(self.stock(), 7)
+        self.assertIsNotNone(inventory.reserve(self.product.pk))
+        self.assertEqual(self.stock(), 6)
+
+class InventoryConcurrencyTests(TransactionTestCase):
+    def test_parallel_buyers_cannot_oversell(self):
+        product = make_product(make_category(), 'Кресло', 'chair', stock=20)
+
+        def buy():
+            for _ in range(5):
+                retry_locked(inventory.reserve, product.pk)
+
+        self.assertEqual(run_in_threads(8, buy), [])
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(StockReservation.objects.filter(product=product).count(), 20)
+
+    def test_parallel_buyers_cannot_oversell_split_stock(self):
+        product = make_product(make_category(), 'Кресло', 'chair', stock=20)
+        inventory.split_stock(product.pk, 4)
+
+        def buy():
+            for _ in range(5):
+                retry_locked(inventory.reserve, product.pk, 2)
+
+        self.assertEqual(run_in_threads(8, buy), [])
+        self.assertEqual(sum(StockBucket.objects.filter(product=product).values_list('stock', flat=True)), 0)
+        self.assertEqual(StockReservation.objects.filter(product=product).count(), 10)
+        inventory.sync_split_stock()
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+
+
+class SessionCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = make_category()
+        self.chair = make_product(category, 'Кресло', 'chair', price='100')
+        self.sofa = make_product(category, 'Диван', 'sofa', price='1000')
+
+    def add(self, product, times=1):
+        for _ in range(times):
+            self.client.post(reverse('main:add_to_cart', args=[product.pk]))
+
+    def test_guest_cart_lives_in_session(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.add(self.chair, 2)
+        self.assertFalse(any('main_cartitem' in q['sql'] or 'main_cart"' in q['sql'] for q in ctx.captured_queries))
+        self.add(self.sofa)
+        self.client.post(reverse('main:update_cart', args=[self.sofa.pk]), {'quantity': 3})
+
+        response = self.client.get(reverse('main:cart'))
+        summary = response.context['summary']
+        self.assertEqual([(item.product.slug, item.quantity) for item in summary.items], [('chair', 2), ('sofa', 3)])
+        self.assertEqual(summary.total, Decimal('3200'))
+        self.assertEqual(response.context['cart_item_count'], 2)
+        self.assertFalse(Cart.objects.exists())
+
+        self.client.post(reverse('main:remove_from_cart', args=[self.chair.pk]))
+        self.assertEqual(self.client.get(reverse('main:cart')).context['summary'].item_count, 1)
+
+    def test_login_merges_with_one_upsert(self):
+        user = User.objects.create_user('buyer', password='pass12345')
+        cart_ops.add_item(user.pk, self.chair.pk)
+        self.add(self.chair, 2)
+        self.add(self.sofa)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.login(username='buyer', password='pass12345')
+        self.assertEqual(sum(q['sql'].startswith('INSERT INTO main_cartitem') for q in ctx.captured_queries), 1)
+        self.assertEqual(
+            dict(CartItem.objects.filter(cart__user=user).values_list('product__slug', 'quantity')),
+            {'chair': 3, 'sofa': 1},
+        )
+        self.assertNotIn('cart', self.client.session)
+
+    def test_registration_creates_no_cart(self):
+        User.objects.create_user('browser', password='pass12345')
+        self.assertFalse(Cart.objects.exists())
+
+    def test_first_add_by_new_user_creates_cart(self):
+        user = User.objects.create_user('newcomer', password='pass12345')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('main:cart')).context['summary'].item_count, 0)
+        self.assertFalse(Cart.objects.exists())
+
+        self.add(self.chair)
+        self.assertEqual(
+            list(CartItem.objects.filter(cart__user=user).values_list('product__slug', 'quantity')), [('chair', 1)]
+        )
+        response = self.client.get(reverse('main:cart'))
+        self.assertEqual(response.context['summary'].item_count, 1)
+        self.assertEqual(response.context['cart_item_count'], 1)
+
+    def test_guest_with_cart_bypasses_shared_page_cache(self):
+        url = reverse('main:furniture_detail', args=['chair'])
+        response = self.client.get(url)
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        self.assertNotContains(response, 'товаров в корзине')
+        self.add(self.sofa)
+        self.assertContains(self.client.get(url), 'товаров в корзине')
+
+    def test_cached_guest_form_accepts_token_from_cookie(self):
+        client = Client(enforce_csrf_checks=True)
+        response = client.get(reverse('main:furniture_detail', args=['chair']))
+        token = response.cookies[settings.CSRF_COOKIE_NAME].value
+        response = client.post(reverse('main:add_to_cart', args=[self.chair.pk]), {'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(client.session['cart'], {str(self.chair.pk): 1})
+
+
+class CatalogApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = make_category()
+        self.products = [
+            make_product(self.category, f'Диван {index}', f'sofa-{index}', price=f'{index}000', stock=index % 2)
+            for index in range(5)
+        ]
+
+    def get_json(self, url, params=None, **headers):
+        response = self.client.get(url, params or {}, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, json.loads(body) if body else None
+
+    def test_keyset_pages_with_sparse_fields(self):
+        url = reverse('main:api_products')
+        response, data = self.get_json(url, {'category': 'sofas', 'limit': 3, 'fields': 'name,price,in_stock'})
+        self.assertEqual(data['results'][0], {'name': 'Диван 4', 'price': '4000.00', 'in_stock': False})
+        self.assertIsNone(data['previous'])
+        response, data = self.get_json(data['next'])
+        self.assertEqual([row['name'] for row in data['results']], ['Диван 1', 'Диван 0'])
+        self.assertIsNone(data['next'])
+
+    def test_reads_only_selected_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.get_json(reverse('main:api_products'), {'category': 'sofas', 'fields': 'id,name'})
+        select = ctx.captured_queries[-1]['sql']
+        self.assertNotIn('description', select)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_etag_revalidation_and_invalidation(self):
+        url = reverse('main:api_products')
+        response, _ = self.get_json(url, {'category': 'sofas'})
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response, _ = self.get_json(url, {'category': 'sofas'}, if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.products[0].price = Decimal('1')
+        self.products[0].save()
+        response, data = self.get_json(url, {'category': 'sofas'}, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_categories_and_errors(self):
+        _, data = self.get_json(reverse('main:api_product', args=['sofa-1']))
+        self.assertEqual((data['category'], data['url'], data['in_stock']), ('sofas', '/product/sofa-1/', True))
+        self.assertNotIn('stock', data)
+        _, data = self.get_json(reverse('main:api_categories'), {'fields': 'slug,url'})
+        self.assertEqual(data['results'], [{'slug': 'sofas', 'url': '/category/sofas/'}])
+        response, data = self.get_json(reverse('main:api_products'), {'fields': 'name,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', data['error'])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='media-'), FEED_BASE_URL='https://shop.example')
+class ProductFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = make_category()
+        make_product(category, 'Диван <угловой>', 'sofa', price='1000', old_price=Decimal('1200'), stock=2)
+        make_product(category, 'Кресло', 'chair', price='500')
+        make_product(category, 'Скрытый', 'hidden', is_active=False)
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def fetch(self, fmt, **headers):
+        response = self.client.get(reverse('main:product_feed', args=[fmt]), headers=headers)
+        body = b''.join(response.streaming_content)
+        if response.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return response, body.decode()
+
+    def test_yml_feed(self):
+        response, body = self.fetch('yml', accept_encoding='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('<name>Диван &lt;угловой&gt;</name>', body)
+        self.assertIn('<url>https://shop.example/product/sofa/</url>', body)
+        self.assertIn('<oldprice>1200.00</oldprice>', body)
+        self.assertIn('available="false"', body)
+        self.assertNotIn('Скрытый', body)
+        self.assertEqual(body.count('<offer '), 2)
+
+    def test_csv_feed_without_gzip(self):
+        response, body = self.fetch('csv')
+        self.assertNotIn('Content-Encoding', response)
+        rows = list(csv.reader(body.splitlines()))
+        self.assertEqual(rows[0][:4], ['id', 'sku', 'name', 'category'])
+        self.assertEqual([row[2] for row in rows[1:]], ['Диван <угловой>', 'Кресло'])
+
+    def test_gzip_refused_with_zero_quality(self):
+        for header in ('gzip;q=0', 'gzip; q=0.0, identity', 'br, gzip;q=0.000'):
+            response, body = self.fetch('csv', accept_encoding=header)
+            self.assertNotIn('Content-Encoding', response)
+            self.assertIn('Кресло', body)
+        response, _ = self.fetch('csv', accept_encoding='identity;q=0.5, gzip;q=0.8')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_feed_reused_until_catalog_changes(self):
+        _, first = self.fetch('yml', accept_encoding='gzip')
+        with CaptureQueriesContext(connection) as ctx:
+            response, again = self.fetch('yml', accept_encoding='gzip')
+        self.assertEqual(again, first)
+        self.assertFalse(any('main_furniture' in q['sql'] for q in ctx.captured_queries))
+        not_modified = self.client.get(reverse('main:product_feed', args=['yml']), headers={'if_none_match': response['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+
+        Furniture.objects.get(slug='chair').delete()
+        _, changed = self.fetch('yml', accept_encoding='gzip')
+        self.assertEqual(changed.count('<offer '), 1)
+        self.assertEqual(len(default_storage.listdir('feeds')[1]), 1)
+
+
+def reload_urls():
+    import config.urls
+    import main.urls
+
+    importlib.reload(main.urls)
+    importlib.reload(config.urls)
+    clear_url_caches()
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Очистка в обратном порядке: сначала снимается настройка, потом перечитываются URL
+        cls.addClassCleanup(reload_urls)
+        cls.enterClassContext(override_settings(ASYNC_VIEWS=True))
+        reload_urls()
+
+    def setUp(self):
+        cache.clear()
+        category = make_category()
+        self.sofa = make_product(category, 'Диван Oslo', 'oslo', stock=3)
+        self.chair = make_product(category, 'Кресло Bergen', 'bergen', price='100')
+        RelatedProduct.objects.create(product=self.sofa, related=self.chair, position=0, score=1)
+        self.user = User.objects.create_user('buyer', password='pass12345')
+
+    def test_urls_use_async_views(self):
+        from main import async_views
+        from django.urls import resolve
+
+        self.assertIs(resolve(reverse('main:furniture_detail', args=['oslo'])).func, async_views.furniture_detail)
+
+    async def test_detail_and_list_render_with_validators(self):
+        response = await self.async_client.get(reverse('main:furniture_detail', args=['oslo']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['product'], self.sofa)
+        self.assertEqual(response.context['related_products'], [self.chair])
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+
+        url = reverse('main:furniture', args=['sofas'])
+        response = await self.async_client.get(url)
+        self.assertEqual([p.slug for p in response.context['fur']], ['bergen', 'oslo'])
+        self.assertTrue(response.context['facets'])
+        not_modified = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+
+    async def test_cache_not_called_from_event_loop(self):
+        # Блокирующий клиент кеша из цикла событий — SynchronousOnlyOperation
+        backend = type(caches['default'])
+        with mock.patch.multiple(backend, **{
+            name: async_unsafe(getattr(backend, name)) for name in ('get', 'get_many', 'set', 'set_many', 'add', 'incr')
+        }):
+            for url in [
+                reverse('main:category'),
+                reverse('main:furniture', args=['sofas']),
+                reverse('main:furniture_detail', args=['oslo']),
+                reverse('main:furniture_detail', args=['oslo']),
+            ]:
+                self.assertEqual((await self.async_client.get(url)).status_code, 200, url)
+
+    async def test_missing_pages_are_404(self):
+        self.assertEqual((await self.async_client.get(reverse('main:furniture_detail', args=['nope']))).status_code, 404)
+        self.assertEqual((await self.async_client.get(reverse('main:furniture', args=['nope']))).status_code, 404)
+
+    async def test_guest_cart_in_session(self):
+        for _ in range(2):
+            await self.async_client.post(reverse('main:add_to_cart', args=[self.chair.pk]))
+        response = await self.async_client.get(reverse('main:cart'))
+        self.assertEqual([(item.product.slug, item.quantity) for item in response.context['items']], [('bergen', 2)])
+        self.assertEqual(response.context['total'], Decimal('200'))
+
+    async def test_user_cart_in_database(self):
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.post(reverse('main:add_to_cart', args=[self.sofa.pk]))
+        response = await self.async_client.get(reverse('main:cart'))
+        self.assertEqual(response.context['summary'].item_count, 1)
+        self.assertEqual(response.context['cart_item_count'], 1)
+        response = await self.async_client.get(reverse('main:furniture_detail', args=['oslo']))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+
+class LoadTestCommandTests(LiveServerTestCase):
+    # С DB_REPLICAS сервер читает каталог с реплики
+    databases = '__all__'
+
+    def test_reports_throughput_and_latency(self):
+        make_product(make_category(), 'Sofa', 'sofa')
+        out = StringIO()
+        call_command(
+            'loadtest', target=[f'live={self.live_server_url}'], duration=0.3, warmup=0, concurrency=2, stdout=out,
+        )
+        line = out.getvalue().splitlines()[-1].split()
+        self.assertEqual(line[0], 'live')
+        self.assertGreater(float(line[1]), 0)
+        self.assertEqual(line[-1], '0')
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = db_router.ReplicaRouter(replicas=['replica1', 'replica2'])
+        db_router.reset()
+        self.addCleanup(db_router.reset)
+
+    def test_catalog_reads_stay_on_one_replica(self):
+        replica = self.router.db_for_read(Furniture)
+        self.assertIn(replica, ['replica1', 'replica2'])
+        self.assertEqual({self.router.db_for_read(Category) for _ in range(20)}, {replica})
+        self.assertIsNone(self.router.db_for_read(CartItem))
+        self.assertIsNone(self.router.db_for_read(User))
+
+    def test_write_pins_reads_to_primary(self):
+        self.assertEqual(self.router.db_for_write(Furniture), 'default')
+        self.assertEqual(self.router.db_for_read(Furniture), 'default')
+        db_router.reset(pinned=True)
+        self.assertEqual(self.router.db_for_read(Category), 'default')
+
+    def test_no_replicas_no_routing(self):
+        router = db_router.ReplicaRouter(replicas=[])
+        self.assertIsNone(router.db_for_read(Furniture))
+        self.assertIsNone(router.db_for_write(Furniture))
+
+    def test_relations_and_migrations(self):
+        product, cart = Furniture(), Cart()
+        product._state.db, cart._state.db = 'replica1', 'default'
+        self.assertTrue(self.router.allow_relation(product, cart))
+        self.assertFalse(self.router.allow_migrate('replica2', 'main'))
+        self.assertIsNone(self.router.allow_migrate('default', 'main'))
+
+    @override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+    def test_cache_filled_from_primary_right_after_catalog_change(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        sofas, tables = catalog_cache.category_scope('sofas'), catalog_cache.category_scope('tables')
+        catalog_cache.version_token(sofas)
+        self.assertNotEqual(self.router.db_for_read(Furniture), 'default')
+
+        catalog_cache.bump(sofas)
+        for scope, expected_primary in ((tables, False), (sofas, True)):
+            db_router.reset()
+            catalog_cache.version_token(scope)
+            self.assertEqual(self.router.db_for_read(Furniture) == 'default', expected_primary)
+
+        # Через REPLICA_PIN_SECONDS отметка истекает — реплика уже догнала запись
+        cache.delete(catalog_cache._bumped_key(sofas))
+        db_router.reset()
+        catalog_cache.version_token(sofas)
+        self.assertNotEqual(self.router.db_for_read(Furniture), 'default')
+
+    def test_middleware_keeps_session_on_primary_after_write(self):
+        factory = RequestFactory()
+
+        def write_view(request):
+            self.router.db_for_write(Furniture)
+            return HttpResponse()
+
+        response = db_router.ReplicaPinMiddleware(write_view)(factory.post('/'))
+        self.assertIn(db_router.PIN_COOKIE, response.cookies)
+
+        def read_view(request):
+            return HttpResponse(self.router.db_for_read(Furniture))
+
+        request = factory.get('/')
+        request.COOKIES[db_router.PIN_COOKIE] = '1'
+        self.assertEqual(db_router.ReplicaPinMiddleware(read_view)(request).content, b'default')
+        response = db_router.ReplicaPinMiddleware(read_view)(factory.get('/'))
+        self.assertNotEqual(response.content, b'default')
+        self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+
+
+@override_settings(SESSION_DB_WRITE_INTERVAL=60)
+class SessionEngineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = SessionStore()
+        self.store['cart'] = {'1': 1}
+        self.store.save()
+        self.Session = SessionStore.get_model_class()
+
+    def db_data(self):
+        return SessionStore().decode(self.Session.objects.get(session_key=self.store.session_key).session_data)
+
+    def test_value_changes_coalesce_in_cache(self):
+        self.store['cart'] = {'1': 2}
+        with self.assertNumQueries(0):
+            self.store.save()
+        self.assertEqual(SessionStore(self.store.session_key)['cart'], {'1': 2})
+        self.assertEqual(self.db_data()['cart'], {'1': 1})
+
+    def test_new_keys_and_interval_write_through(self):
+        self.store['cart'] = {'1': 2}
+        self.store['_auth_user_id'] = '7'
+        with CaptureQueriesContext(connection) as ctx:
+            self.store.save()
+        self.assertEqual(sum(q['sql'].startswith('UPDATE "django_session"') for q in ctx.captured_queries), 1)
+        self.assertEqual(self.db_data(), {'cart': {'1': 2}, '_auth_user_id': '7'})
+
+        self.store['cart'] = {'1': 3}
+        with override_settings(SESSION_DB_WRITE_INTERVAL=0):
+            self.store.save()
+        self.assertEqual(self.db_data()['cart'], {'1': 3})
+
+    def test_evicted_cache_falls_back_to_database(self):
+        cache.clear()
+        self.assertEqual(SessionStore(self.store.session_key)['cart'], {'1': 1})
+
+    def test_deleted_session_is_not_resurrected(self):
+        stale = SessionStore(self.store.session_key)
+        self.assertEqual(stale['cart'], {'1': 1})
+        SessionStore(self.store.session_key).delete()
+        stale['cart'] = {'1': 5}
+        with self.assertRaises(UpdateError):
+            stale.save()
+        self.assertFalse(SessionStore().exists(self.store.session_key))
+
+    def test_clear_expired_in_batches(self):
+        past = timezone.now() - timedelta(days=1)
+        self.Session.objects.bulk_create([
+            self.Session(session_key=f'expired{number}', session_data='', expire_date=past) for number in range(5)
+        ])
+        with self.assertNumQueries(6):
+            SessionStore.clear_expired(batch_size=2)
+        self.assertEqual(list(self.Session.objects.values_list('session_key', flat=True)), [self.store.session_key])
+
+
+class StaticAssetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = make_category()
+        make_product(category, 'Диван Oslo', 'oslo')
+
+    def test_html_compressed_and_styles_external(self):
+        url = reverse('main:furniture', args=['sofas'])
+        plain = self.client.get(url)
+        self.assertNotContains(plain, '<style>')
+        self.assertContains(plain, 'css/site.css')
+        compressed = self.client.get(url, headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+
+    def test_streaming_json_compressed_but_not_images(self):
+        response = self.client.get(reverse('main:api_products'), headers={'Accept-Encoding': 'gzip'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('oslo', json.loads(gzip.decompress(b''.join(response.streaming_content)))['results'][0]['slug'])
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        os.makedirs(os.path.join(media_root, 'furniture'))
+        with open(os.path.join(media_root, 'furniture', 'a.jpg'), 'wb') as image:
+            image.write(b'\xff' * 1000)
+        with override_settings(MEDIA_ROOT=media_root, MEDIA_SERVE_MODE='django'):
+            response = self.client.get('/media/furniture/a.jpg', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_collectstatic_hashes_and_precompresses(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        # Выполняется после выхода из override_settings — маршрут снова пропадёт
+        self.addCleanup(reload_urls)
+        storages = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'main.staticfiles.CompressedManifestStaticFilesStorage'},
+        }
+        with override_settings(STATIC_ROOT=static_root, STORAGES=storages, SERVE_STATIC=True):
+            reload_urls()
+            call_command('collectstatic', interactive=False, verbosity=0)
+            from django.contrib.staticfiles.storage import staticfiles_storage
+
+            hashed = staticfiles_storage.stored_name('css/site.css')
+            self.assertRegex(hashed, r'^css/site\.[0-9a-f]{12}\.css$')
+            self.assertTrue(os.path.exists(os.path.join(static_root, hashed + '.gz')))
+
+            response = self.client.get(f'/static/{hashed}', headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertIn(':root', gzip.decompress(b''.join(response.streaming_content)).decode())
+            plain = self.client.get('/static/css/site.css')
+            self.assertNotIn('Content-Encoding', plain)
+            self.assertNotIn('immutable', plain['Cache-Control'])
+            revalidated = self.client.get(
+                f'/static/{hashed}', headers={'Accept-Encoding': 'gzip', 'If-None-Match': response['ETag']}
+            )
+            self.assertEqual(revalidated.status_code, 304)
+
+            # Новый collectstatic без перезапуска: манифест перечитывается по mtime
+            renamed = hashed.replace('.css', '.renamed.css')
+            shutil.copy(os.path.join(static_root, hashed), os.path.join(static_root, renamed))
+            self.assertNotIn('immutable', self.client.get(f'/static/{renamed}')['Cache-Control'])
+            manifest_path = os.path.join(static_root, staticfiles_storage.manifest_name)
+            with open(manifest_path, encoding='utf-8') as manifest:
+                data = json.load(manifest)
+            data['paths']['css/site.css'] = renamed
+            with open(manifest_path, 'w', encoding='utf-8') as manifest:
+                json.dump(data, manifest)
+            stat = os.stat(manifest_path)
+            os.utime(manifest_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            self.assertIn(renamed, _hashed_names())
+            self.assertIn('immutable', self.client.get(f'/static/{renamed}')['Cache-Control'])
+
+    def test_static_not_routed_by_default(self):
+        self.assertFalse(settings.SERVE_STATIC)
+        self.assertEqual(self.client.get('/static/css/site.css').status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='media-'))
+class GenerateCatalogTests(TestCase):
+    def generate(self, **options):
+        options = {'categories': 4, 'products': 300, 'users': 12, 'carts': 6, 'batch_size': 64, **options}
+        call_command('generate_catalog', stdout=StringIO(), **options)
+
+    def test_fills_every_table_with_skewed_data(self):
+        self.generate()
+        sizes = list(
+            Category.objects.filter(slug__startswith='synthetic-')
+            .annotate(size=Count('products')).order_by('slug').values_list('size', flat=True)
+        )
+        self.assertEqual(sum(sizes), 300)
+        self.assertEqual(sizes[0], max(sizes))
+        self.assertGreater(Furniture.objects.values('material').distinct().count(), 20)
+        self.assertEqual(Cart.objects.count(), 6)
+        lines = CartItem.objects.values('cart').annotate(lines=Count('id')).values_list('lines', flat=True)
+        self.assertGreaterEqual(max(lines), 50)
+
+        product = Furniture.objects.get(slug='synthetic-0')
+        self.assertTrue(default_storage.exists(product.image.name))
+        self.assertIn(product, get_search_backend().search(product.name).object_list)
+        self.assertEqual(RelatedProduct.objects.filter(product=product).count(), 8)
+
+        users = User.objects.filter(username__startswith='synthetic-user-')
+        self.assertEqual(users.values('password').distinct().count(), 1)
+        self.assertTrue(self.client.login(username='synthetic-user-3', password=SYNTHETIC_PASSWORD))
+
+    def test_same_seed_same_data_and_prefixes_coexist(self):
+        self.generate(prefix='a', products=50, carts=2)
+        self.generate(prefix='b', products=50, carts=2)
+        rows = {
+            prefix: list(Furniture.objects.filter(slug__startswith=f'{prefix}-')
+                         .order_by('pk').values_list('price', 'material', 'color'))
+            for prefix in 'ab'
+        }
+        self.assertEqual(rows['a'], rows['b'])
+        with self.assertRaises(CommandError):
+            self.generate(prefix='a')
+        with self.assertRaises(CommandError):
+            self.generate(prefix='c', users=2, carts=3)
+
+
+def timing_metrics(response):
+    """Server-Timing -> {метрика: (мс, описание)}"""
+    metrics = {}
+    for metric in response['Server-Timing'].split(', '):
+        name, *params = metric.split(';')
+        params = dict(param.split('=', 1) for param in params)
+        metrics[name] = (float(params['dur']), params.get('desc', '').strip('"'))
+    return metrics
+
+
+@override_settings(
+    REQUEST_TIMING=True, SLOW_REQUEST_MS=10_000,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+)
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        self.category = make_category()
+        for number in range(3):
+            make_product(self.category, f'Диван {number}', f'sofa-{number}')
+
+    def test_header_splits_request_into_parts(self):
+        self.client.post(reverse('main:add_to_cart', args=[Furniture.objects.first().pk]))
+        response = self.client.get(reverse('main:cart'))
+        metrics = timing_metrics(response)
+        self.assertTrue({'db', 'tpl', 'session', 'messages', 'app', 'total'} <= set(metrics))
+        self.assertRegex(metrics['db'][1], r'^\d+ SQL$')
+        parts = sum(metrics[name][0] for name in metrics if name != 'total')
+        self.assertAlmostEqual(parts, metrics['total'][0], delta=0.5)
+
+    def test_sql_during_rendering_counts_as_db(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('main:category'))
+        metrics = timing_metrics(response)
+        self.assertEqual(metrics['db'][1], f'{len(ctx)} SQL')
+        self.assertGreater(metrics['tpl'][0], 0)
+
+    def test_slow_request_logs_repeated_statements(self):
+        def n_plus_one(request):
+            for product in Furniture.objects.all():
+                product.category.name
+            return HttpResponse('ok')
+
+        request = RequestFactory().get('/slow/')
+        with override_settings(SLOW_REQUEST_MS=0), self.assertLogs('main.instrumentation', 'WARNING') as logs:
+            response = instrumentation.ServerTimingMiddleware(n_plus_one)(request)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('Медленный запрос GET /slow/', logs.output[0])
+        self.assertIn('3× [default] SELECT', logs.output[0])
+
+    def test_disabled_middleware_is_dropped(self):
+        with override_settings(REQUEST_TIMING=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                instrumentation.ServerTimingMiddleware(lambda request: HttpResponse())
+            self.assertNotIn('Server-Timing', self.client_class().get(reverse('main:category')))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class PerformanceBudgetTests(TestCase):
+    """Запросы (и при PERF_LATENCY=1 время ответа) каждого адреса в пределах perf_budgets.json (см. main/perf.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.catalog = perf.seed_catalog()
+
+    def test_every_url_has_scenario(self):
+        import main.urls
+        import users.urls
+
+        covered = {scenario.url_name for scenario in perf.SCENARIOS}
+        for module in (main.urls, users.urls):
+            for pattern in module.urlpatterns:
+                self.assertIn(f'{module.app_name}:{pattern.name}', covered)
+
+    def test_views_within_budget(self):
+        budgets = perf.load_budgets(perf.budget_profiles())
+        runs = int(os.getenv('PERF_RUNS', perf.DEFAULT_RUNS))
+        measurements = []
+        for scenario in perf.SCENARIOS:
+            with self.subTest(scenario.name):
+                measurement = perf.measure(self.client_class(), scenario, self.catalog, runs)
+                measurements.append(measurement)
+                self.assertIn(scenario.name, budgets, 'нет бюджета в main/perf_budgets.json')
+                self.assertEqual(perf.check_budget(measurement, budgets[scenario.name]), [])
+        perf.write_report(measurements)
+
+    def test_latency_checked_only_on_request(self):
+        slow = perf.Measurement('index', 1, [500.0] * 5)
+        budget = {'queries': 1, 'p95_ms': 100}
+        self.assertEqual(perf.check_budget(slow, budget, latency=False), [])
+        self.assertEqual(len(perf.check_budget(slow, budget, latency=True)), 1)
+        self.assertEqual(len(perf.check_budget(perf.Measurement('index', 2, [1.0]), budget, latency=False)), 1)
@@ -1,18 +1,40 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, feeds, views
 
 app_name = 'main'
 
+if settings.ASYNC_VIEWS:
+    # Под ASGI (см. config/asgi.py) каталог и корзина обслуживаются async-версиями
+    from . import async_views
+
+    category_view = async_views.category_list
+    furniture_view = async_views.furniture_list
+    detail_view = async_views.furniture_detail
+    cart_view = async_views.cart_view
+    add_to_cart_view = async_views.add_to_cart
+else:
+    category_view = views.CategoryList.as_view()
+    furniture_view = views.FurnitureList.as_view()
+    detail_view = views.FurnitureDetail.as_view()
+    cart_view = views.cart_view
+    add_to_cart_view = views.add_to_cart
+
 urlpatterns = [
     path('', views.Template.as_view(), name='index'),
-    path('categories/', views.CategoryList.as_view(), name='category'),
-    path('category/<slug:slug>/', views.FurnitureList.as_view(), name='furniture'),
-    path('product/<slug:product_slug>/', views.FurnitureDetail.as_view(), name='furniture_detail'),
+    path('categories/', category_view, name='category'),
+    path('category/<slug:slug>/', furniture_view, name='furniture'),
+    path('product/<slug:product_slug>/', detail_view, name='furniture_detail'),
+    path('search/', views.SearchView.as_view(), name='search'),
     path('about/', views.AboutView.as_view(), name='about'),
     path('design-projects/', views.DesignProjectsView.as_view(), name='design_projects'),
     path('contacts/', views.ContactsView.as_view(), name='contacts'),
-    path('cart/', views.cart_view, name='cart'),
-    path('cart/add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
+    path('cart/', cart_view, name='cart'),
+    path('cart/add/<int:product_id>/', add_to_cart_view, name='add_to_cart'),
     path('cart/remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('cart/update/<int:item_id>/', views.update_cart_quantity, name='update_cart'),
+    path('api/categories/', api.category_list, name='api_categories'),
+    path('api/products/', api.product_list, name='api_products'),
+    path('api/products/<slug:product_slug>/', api.product_detail, name='api_product'),
+    path('feeds/products.<str:fmt>', feeds.product_feed, name='product_feed'),
 ]
\ No newline at end of file
@@ -1,10 +1,28 @@
+from decimal import Decimal
+
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.views.generic import TemplateView, ListView, DetailView
 from main.models import Category, Furniture
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Furniture, Cart, CartItem
+from django.db.models import Count, Q
+from django.core.files.storage import default_storage
+from django.http import Http404
+from django.views.decorators.http import require_POST, require_safe
+from PIL import UnidentifiedImageError
+from .models import Furniture, Cart, CartItem, CartSummary, RelatedProduct
+from . import cart as cart_ops
+from .conditional import ConditionalGetMixin, catalog_stats
+from .facets import FacetFilters, build_facets, facet_rows
+from .pagination import KeysetPaginator
+from .media import serve_file
+from .renditions import generate_renditions, parse_rendition_name, rendition_name
+from .search import get_search_backend
+from .catalog_cache import (
+    CatalogCacheMixin, CATALOG_SCOPE, category_scope,
+    get_product_category, remember, set_product_category,
+)
 
 class Template(TemplateView):
     template_name = 'main/index.html'
@@ -15,50 +33,117 @@ class Template(TemplateView):
         return context
 
 
-class CategoryList(ListView):
+class CategoryList(CatalogCacheMixin, ListView):
     model = Category
     context_object_name = "cat"
     template_name = 'main/category_list.html'
 
+    def get_queryset(self):
+        # Число моделей — одним запросом, а не COUNT на каждую карточку
+        return super().get_queryset().annotate(product_count=Count('products'))
+
+    def get_cache_scopes(self):
+        return [CATALOG_SCOPE]
+
 
-class FurnitureList(ListView):
+class FurnitureList(CatalogCacheMixin, ConditionalGetMixin, ListView):
     model = Furniture
     context_object_name = 'fur'
     template_name = 'main/furniture_list.html'
+    paginate_by = 24
+
+    def get_cache_scopes(self):
+        return [category_scope(self.kwargs.get('slug'))]
+
+    def get_catalog_stats(self):
+        # Фасеты зависят от всей категории, поэтому агрегат без фильтров покупателя
+        slug = self.kwargs.get('slug')
+        return remember(f'stats:{slug}', self.get_cache_scopes(), lambda: catalog_stats(
+            Furniture.objects.filter(category__slug=slug, is_active=True)
+        ))
 
     def get_queryset(self):
         category_slug = self.kwargs.get('slug')
+        self.filters = FacetFilters.from_request(self.request)
 
-        # ИСПРАВЛЕНО: используем 'category' вместо 'cat'
-        return Furniture.objects.filter(
-            category__slug=category_slug,  # было cat__slug, стало category__slug
+        # Категория приходит вместе с товарами страницы (JOIN), отдельный запрос не нужен
+        return self.filters.apply(Furniture.objects.filter(
+            category__slug=category_slug,
             is_active=True
-        )
+        )).select_related('category')
+
+    def paginate_queryset(self, queryset, page_size):
+        page = KeysetPaginator(queryset, page_size).page(self.request.GET.get('cursor'))
+        return None, page, page.object_list, page.has_other_pages()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        category_slug = self.kwargs.get('slug')
-        category = get_object_or_404(Category, slug=category_slug)
+        page = context['page_obj']
+        if page.object_list:
+            context['category'] = page.object_list[0].category
+        else:
+            context['category'] = get_object_or_404(Category, slug=self.kwargs.get('slug'))
 
-        context['category'] = category
+        context['filters'] = self.filters
+        context['filter_query'] = self.filters.querystring()
+        context['facets'] = build_facets(facet_rows(self.kwargs.get('slug'), self.filters), self.filters)
         return context
 
 
-class FurnitureDetail(DetailView):
+class FurnitureDetail(CatalogCacheMixin, ConditionalGetMixin, DetailView):
     model = Furniture
     context_object_name = 'product'
     template_name = 'main/furniture_detail.html'
     slug_field = 'slug'
     slug_url_kwarg = 'product_slug'
 
+    def get_queryset(self):
+        return Furniture.objects.select_related('category')
+
+    def get_cache_scopes(self):
+        # Категория товара известна только после первого рендера страницы
+        category_slug = get_product_category(self.kwargs.get('product_slug'))
+        return [category_scope(category_slug)] if category_slug else None
+
+    def get_catalog_stats(self):
+        # Сам товар, его категория и соседи по категории (блок «Похожие товары»)
+        slug = self.kwargs.get('product_slug')
+        queryset = Furniture.objects.filter(Q(is_active=True) | Q(slug=slug), category__products__slug=slug)
+        scopes = self.get_cache_scopes()
+        if scopes is None:
+            return catalog_stats(queryset)
+        return remember(f'stats:product:{slug}', scopes, lambda: catalog_stats(queryset))
+
     def get_context_data(self, **kwargs):
+        set_product_category(self.object.slug, self.object.category.slug)
         context = super().get_context_data(**kwargs)
-        product = self.get_object()
-        context['related_products'] = Furniture.objects.filter(
-            category=product.category,  # было cat, стало category
-            is_active=True
-        ).exclude(id=product.id)[:4]
+        # Предрасчитанный список (main/related.py) — один запрос по индексу
+        context['related_products'] = [
+            link.related for link in
+            RelatedProduct.objects.filter(product=self.object).select_related('related')[:4]
+        ]
+        context['csrf_cookie_name'] = settings.CSRF_COOKIE_NAME
+        return context
+
+
+class SearchView(TemplateView):
+    """Поиск по названию, описанию и материалу товаров"""
+    template_name = 'main/search.html'
+    paginate_by = 24
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()
+        try:
+            page_number = int(self.request.GET.get('page', 1))
+        except ValueError:
+            page_number = 1
+
+        page = get_search_backend().search(query, page=page_number, per_page=self.paginate_by)
+        context['query'] = query
+        context['page_obj'] = page
+        context['results'] = page.object_list
         return context
 
 
@@ -89,41 +174,38 @@ class AboutView(TemplateView):
 
 
 
-@login_required
 def cart_view(request):
-    """Просмотр корзины (только для авторизованных)"""
-    cart, created = Cart.objects.get_or_create(user=request.user)
+    """Просмотр корзины: из базы для авторизованных, из сессии для гостей"""
+    if request.user.is_authenticated:
+        cart = Cart.objects.filter(user=request.user).first()
+        summary = cart.summary() if cart else CartSummary(items=[], item_count=0, total=Decimal('0'))
+    else:
+        cart = cart_ops.SessionCart(request.session)
+        summary = cart.summary()
 
     context = {
         'cart': cart,
-        'items': cart.items.all(),
-        'total': cart.total_price(),
+        'summary': summary,
+        'items': summary.items,
+        'total': summary.total,
     }
     return render(request, 'main/cart.html', context)
 
 
-@login_required
 def add_to_cart(request, product_id):
-    """Добавление товара в корзину (только для авторизованных)"""
+    """Добавление товара в корзину"""
     if request.method == 'POST':
-        product = get_object_or_404(Furniture, id=product_id, is_active=True)
-
-        # Получаем корзину пользователя
-        cart, created = Cart.objects.get_or_create(user=request.user)
-
-        # Проверяем есть ли уже такой товар в корзине
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': 1}
-        )
-
-        if not created:
-            # Если товар уже есть, увеличиваем количество
-            cart_item.quantity += 1
-            cart_item.save()
-
-        messages.success(request, f'Товар "{product.name}" добавлен в корзину!')
+        name = Furniture.objects.filter(id=product_id, is_active=True).values_list('name', flat=True).first()
+        if name is None:
+            raise Http404('Товар не найден')
+        if request.user.is_authenticated:
+            # Один upsert: параллельные клики не теряют друг друга
+            if cart_ops.add_item(request.user.pk, product_id) is None:
+                raise Http404('Товар не найден')
+        else:
+            cart_ops.SessionCart(request.session).add(product_id)
+
+        messages.success(request, f'Товар "{name}" добавлен в корзину!')
 
         # Возвращаемся на предыдущую страницу
         return redirect(request.META.get('HTTP_REFERER', 'main:index'))
@@ -131,34 +213,44 @@ def add_to_cart(request, product_id):
     return redirect('main:index')
 
 
-@login_required
+@require_POST
 def remove_from_cart(request, item_id):
-    """Удаление товара из корзины"""
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    product_name = cart_item.product.name
-    cart_item.delete()
+    """Удаление товара из корзины (у гостя item_id — это id товара)"""
+    if request.user.is_authenticated:
+        product_name = (
+            CartItem.objects.filter(id=item_id, cart__user=request.user)
+            .values_list('product__name', flat=True).first()
+        )
+        removed = product_name is not None and cart_ops.remove_item(request.user.pk, item_id)
+    else:
+        product_name = Furniture.objects.filter(id=item_id).values_list('name', flat=True).first()
+        removed = cart_ops.SessionCart(request.session).remove(item_id)
+    if not removed:
+        raise Http404('Товар не найден в корзине')
 
     messages.info(request, f'Товар "{product_name}" удален из корзины')
     return redirect('main:cart')
 
 
-@login_required
 def update_cart_quantity(request, item_id):
     """Изменение количества товара в корзине"""
     if request.method == 'POST':
-        cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-
         try:
             quantity = int(request.POST.get('quantity', 1))
-            if quantity > 0:
-                cart_item.quantity = quantity
-                cart_item.save()
-                messages.success(request, 'Количество обновлено')
-            else:
-                cart_item.delete()
-                messages.info(request, 'Товар удален из корзины')
         except ValueError:
             messages.error(request, 'Неверное количество')
+            return redirect('main:cart')
+
+        if request.user.is_authenticated:
+            updated = cart_ops.set_quantity(request.user.pk, item_id, quantity)
+        else:
+            updated = cart_ops.SessionCart(request.session).set_quantity(item_id, quantity)
+        if not updated:
+            raise Http404('Товар не найден в корзине')
+        if quantity > 0:
+            messages.success(request, 'Количество обновлено')
+        else:
+            messages.info(request, 'Товар удален из корзины')
 
     return redirect('main:cart')
 
@@ -191,4 +283,20 @@ class ContactsView(TemplateView):
             {'name': 'WhatsApp', 'icon': 'bi-whatsapp', 'url': 'https://wa.me/79991234567'},
             {'name': 'VK', 'icon': 'bi-vimeo', 'url': 'https://vk.com/blackwood'},
         ]
-        return context
\ No newline at end of file
+        return context
+
+
+@require_safe
+def rendition_view(request, path):
+    """Отдаёт рендишен, создавая его при первом обращении"""
+    parsed = parse_rendition_name(path)
+    if parsed is None or not default_storage.exists(parsed[0]):
+        raise Http404('Изображение не найдено')
+
+    source_name, width, fmt = parsed
+    try:
+        generate_renditions(source_name, only=(width, fmt))
+    except UnidentifiedImageError:
+        # Под путём лежит не картинка (PDF, битый файл) — рендишена у неё нет
+        raise Http404('Изображение не найдено')
+    return serve_file(request, rendition_name(source_name, width, fmt))
@@ -0,0 +1,62 @@
+    // Инициализация tooltips
+    document.addEventListener('DOMContentLoaded', function() {
+        var tooltipTriggerList = [].slice.call(document.querySelectorAll('[data-bs-toggle="tooltip"]'));
+        var tooltipList = tooltipTriggerList.map(function (tooltipTriggerEl) {
+            return new bootstrap.Tooltip(tooltipTriggerEl);
+        });
+
+        // Параллакс эффект для карточек
+        document.addEventListener('mousemove', function(e) {
+            const cards = document.querySelectorAll('.card-product');
+            cards.forEach(card => {
+                const rect = card.getBoundingClientRect();
+                const x = e.clientX - rect.left;
+                const y = e.clientY - rect.top;
+
+                const centerX = rect.width / 2;
+                const centerY = rect.height / 2;
+
+                const rotateY = (x - centerX) / 25;
+                const rotateX = (centerY - y) / 25;
+
+                card.style.transform = `perspective(1000px) rotateX(${rotateX}deg) rotateY(${rotateY}deg) translateY(-10px)`;
+            });
+        });
+
+        // Сброс трансформации при уходе мыши
+        document.querySelectorAll('.card-product').forEach(card => {
+            card.addEventListener('mouseleave', function() {
+                this.style.transform = 'perspective(1000px) rotateX(0) rotateY(0) translateY(0)';
+            });
+        });
+
+        // Анимация корзины при клике
+        const cartIcon = document.getElementById('cartIcon');
+        if (cartIcon) {
+    cartIcon.addEventListener('click', function(e) {
+        // Анимация
+        this.classList.add('animate__animated', 'animate__tada');
+        setTimeout(() => {
+            this.classList.remove('animate__animated', 'animate__tada');
+        }, 1000);
+        // Ссылка работает нормально, ничего не блокируем!
+    });
+}
+    });
+
+    // Плавная прокрутка для якорей
+    document.querySelectorAll('a[href^="#"]').forEach(anchor => {
+        anchor.addEventListener('click', function (e) {
+            e.preventDefault();
+            const targetId = this.getAttribute('href');
+            if (targetId === '#') return;
+
+            const targetElement = document.querySelector(targetId);
+            if (targetElement) {
+                window.scrollTo({
+                    top: targetElement.offsetTop - 80,
+                    behavior: 'smooth'
+                });
+            }
+        });
+    });